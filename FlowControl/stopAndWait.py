@@ -2,6 +2,7 @@ import streamlit as st
 import matplotlib.pyplot as plt
 import time
 import random
+from core.profiling import profile_toggle, profile_run, show_profile
 
 
 def add_log(message, type="info"):
@@ -181,8 +182,12 @@ def stopAndWait():
     status_area = st.empty()
     log_area = st.empty()
 
+    profile_toggle("stop_and_wait")
     if st.button("Start Simulation", disabled=st.session_state.simulation_running):
-        run_simulation(frame_count, plot_area, status_area, log_area, timeout, ack_loss_prob, animation_speed, frame_loss_prob)
+        with profile_run("stop_and_wait"):
+            run_simulation(frame_count, plot_area, status_area, log_area, timeout, ack_loss_prob, animation_speed, frame_loss_prob)
+    else:
+        show_profile("stop_and_wait")
 
     if st.session_state.simulation_complete:
         st.subheader("Simulation Results")
@@ -0,0 +1,130 @@
+import struct
+import time
+from core.codec import encode_frame
+
+LINKTYPE_ETHERNET = 1
+DEFAULT_SNAPLEN = 65535
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+_PCAP_HEADER = struct.Struct("<IHHiIII")
+_PCAP_RECORD = struct.Struct("<IIII")
+_BLOCK_HEADER = struct.Struct("<II")
+_SHB = struct.Struct("<IIIHHq")
+_IDB = struct.Struct("<IIHHI")
+_EPB = struct.Struct("<IIIIIII")
+
+
+def _pad4(length):
+    return -length % 4
+
+
+class PcapWriter:
+    """Classic libpcap file, one Ethernet link type; all capture points share it"""
+
+    def __init__(self, target, snaplen=DEFAULT_SNAPLEN, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.owns_file = isinstance(target, str)
+        self.file = open(target, 'wb', buffering=buffer_size) if self.owns_file else target
+        self.snaplen = snaplen
+        self.file.write(_PCAP_HEADER.pack(0xA1B2C3D4, 2, 4, 0, 0, snaplen, LINKTYPE_ETHERNET))
+
+    def add_interface(self, name):
+        return 0
+
+    def write(self, interface, timestamp, frame):
+        captured = frame[:self.snaplen]
+        seconds = int(timestamp)
+        self.file.write(_PCAP_RECORD.pack(seconds, int((timestamp - seconds) * 1e6), len(captured), len(frame)))
+        self.file.write(captured)
+
+    def close(self):
+        self.file.flush()
+        if self.owns_file:
+            self.file.close()
+
+
+class PcapngWriter:
+    """pcapng file with one interface description block per capture point"""
+
+    def __init__(self, target, snaplen=DEFAULT_SNAPLEN, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.owns_file = isinstance(target, str)
+        self.file = open(target, 'wb', buffering=buffer_size) if self.owns_file else target
+        self.snaplen = snaplen
+        self.interfaces = 0
+        length = _SHB.size + 4
+        self.file.write(_SHB.pack(0x0A0D0D0A, length, 0x1A2B3C4D, 1, 0, -1) + struct.pack("<I", length))
+
+    def add_interface(self, name):
+        name = name.encode('utf-8')
+        option = struct.pack("<HH", 2, len(name)) + name + bytes(_pad4(len(name)))  # if_name
+        options = option + struct.pack("<HH", 0, 0)
+        length = _IDB.size + len(options) + 4
+        self.file.write(_IDB.pack(1, length, LINKTYPE_ETHERNET, 0, self.snaplen) + options + struct.pack("<I", length))
+        self.interfaces += 1
+        return self.interfaces - 1
+
+    def write(self, interface, timestamp, frame):
+        captured = frame[:self.snaplen]
+        micros = int(timestamp * 1e6)
+        padding = _pad4(len(captured))
+        length = _EPB.size + len(captured) + padding + 4
+        self.file.write(_EPB.pack(6, length, interface, micros >> 32, micros & 0xFFFFFFFF, len(captured), len(frame)))
+        self.file.write(captured)
+        self.file.write(bytes(padding) + struct.pack("<I", length))
+
+    def close(self):
+        self.file.flush()
+        if self.owns_file:
+            self.file.close()
+
+
+class Capture:
+    """Records every frame arriving at the attached entities or links.
+
+    Frames are encoded to Ethernet/IPv4/TCP/UDP bytes and written through a
+    buffered pcap or pcapng writer. With a SimClock, timestamps follow
+    virtual time, offset from the moment the capture started.
+    """
+
+    def __init__(self, target, format='pcapng', clock=None, snaplen=DEFAULT_SNAPLEN, buffer_size=DEFAULT_BUFFER_SIZE):
+        writer = PcapngWriter if format == 'pcapng' else PcapWriter
+        self.writer = writer(target, snaplen, buffer_size)
+        self.clock = clock
+        self.epoch = time.time()
+        self.taps = []  # (entity, callback)
+        self.stats = {'frames': 0, 'bytes': 0}
+
+    def _timestamp(self):
+        return self.epoch + self.clock.now if self.clock is not None else time.time()
+
+    def _record(self, interface, data, layer):
+        frame = encode_frame(data, layer)
+        self.writer.write(interface, self._timestamp(), frame)
+        self.stats['frames'] += 1
+        self.stats['bytes'] += len(frame)
+
+    def attach(self, entity):
+        """Capture everything the entity receives"""
+        interface = self.writer.add_interface(entity.id)
+
+        def tap(owner, data, source, layer):
+            self._record(interface, data, layer)
+
+        entity.add_tap(tap)
+        self.taps.append((entity, tap))
+
+    def attach_link(self, a, b):
+        """Capture both directions of the link between a and b"""
+        interface = self.writer.add_interface(f"{a.id}<->{b.id}")
+        for owner, peer in ((a, b), (b, a)):
+            def tap(owner, data, source, layer, peer=peer):
+                if source is peer:
+                    self._record(interface, data, layer)
+
+            owner.add_tap(tap)
+            self.taps.append((owner, tap))
+
+    def close(self):
+        for entity, tap in self.taps:
+            entity.remove_tap(tap)
+        self.taps = []
+        self.writer.close()
@@ -0,0 +1,61 @@
+import heapq
+import itertools
+
+
+class Timer:
+    __slots__ = ('time', 'callback', 'args', 'cancelled')
+
+    def __init__(self, time, callback, args):
+        self.time = time
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SimClock:
+    """Discrete-event virtual clock shared by the protocol engines"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self._queue = []
+        self._seq = itertools.count()
+        self.events_run = 0
+
+    def schedule(self, delay, callback, *args):
+        return self.schedule_at(self.now + max(delay, 0.0), callback, *args)
+
+    def schedule_at(self, when, callback, *args):
+        timer = Timer(max(when, self.now), callback, args)
+        heapq.heappush(self._queue, (timer.time, next(self._seq), timer))
+        return timer
+
+    def pending(self):
+        return sum(1 for _, _, timer in self._queue if not timer.cancelled)
+
+    def step(self):
+        """Run the next event. Returns False when nothing is left to run."""
+        while self._queue:
+            when, _, timer = heapq.heappop(self._queue)
+            if timer.cancelled:
+                continue
+            self.now = when
+            self.events_run += 1
+            timer.callback(*timer.args)
+            return True
+        return False
+
+    def run(self, until=None, max_events=None):
+        """Run events in time order until the queue drains, `until` is reached or `max_events` ran"""
+        ran = 0
+        while self._queue:
+            if max_events is not None and ran >= max_events:
+                break
+            if until is not None and self._queue[0][0] > until:
+                self.now = until
+                break
+            if self.step():
+                ran += 1
+        return ran
@@ -0,0 +1,601 @@
+import socket
+import struct
+import zlib
+from collections.abc import Mapping
+from functools import lru_cache
+
+ETH_P_IPV4 = 0x0800
+ETH_P_8021Q = 0x8100
+ETH_P_LOCAL = 0x88B5  # IEEE 802 local experimental EtherType, for non-IP simulator payloads
+
+ETH_HEADER_SIZE = 14
+VLAN_TAG_SIZE = 4
+FCS_SIZE = 4
+IPV4_HEADER_SIZE = 20
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_TEXT = 253  # RFC 3692 experimental numbers, used for plain simulator payloads
+IPPROTO_RAW = 254
+
+TCP_FLAG_BITS = {"F": 0x01, "S": 0x02, "R": 0x04, "P": 0x08, "A": 0x10}
+
+_ETH = struct.Struct("!6s6sH")
+_VLAN = struct.Struct("!HH")
+_IPV4 = struct.Struct("!BBHHHBBH4s4s")
+_TCP = struct.Struct("!HHIIBBHHH")
+_UDP = struct.Struct("!HHHH")
+_PSEUDO = struct.Struct("!4s4sBBH")
+_U16 = struct.Struct("!H")
+_FCS = struct.Struct("<I")
+_SEQ_MASK = 0xFFFFFFFF
+
+
+@lru_cache(maxsize=64)  # A handful of flag strings occur, one lookup per TCP segment encoded
+def tcp_flag_bits(flags):
+    bits = 0
+    for flag in flags:
+        bits |= TCP_FLAG_BITS.get(flag, 0)
+    return bits
+
+
+def tcp_flag_string(bits):
+    return "".join(flag for flag, bit in TCP_FLAG_BITS.items() if bits & bit)
+
+
+# ----- checksums -----
+
+def internet_checksum(*parts):
+    """RFC 1071 checksum over the concatenated parts (only the last may have odd length).
+
+    The ones' complement sum of 16-bit words is congruent to the big-endian
+    integer value modulo 0xFFFF, so each part is summed with one bigint op.
+    A buffer that already contains its correct checksum yields 0.
+    """
+    total = 0
+    nonzero = False
+    for part in parts:
+        if len(part) & 1:
+            part = bytes(part) + b"\0"
+        value = int.from_bytes(part, 'big')
+        total += value % 0xFFFF
+        nonzero = nonzero or value != 0
+    total %= 0xFFFF
+    if total == 0:
+        return 0 if nonzero else 0xFFFF
+    return 0xFFFF - total
+
+
+def _ones_add(a, b):
+    total = a + b
+    return (total & 0xFFFF) + (total >> 16)
+
+
+def update_checksum(checksum, old_word, new_word):
+    """Incremental update after one 16-bit word changed (RFC 1624, eqn. 3)"""
+    return ~_ones_add(_ones_add(~checksum & 0xFFFF, ~old_word & 0xFFFF), new_word) & 0xFFFF
+
+
+def fcs(data):
+    """Ethernet frame check sequence (CRC-32)"""
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+# ----- address conversion -----
+
+ADDRESS_CACHE_SIZE = 65536  # Addresses remembered per direction; the module is shared by every session
+_mac_names = {}  # 6 bytes -> the MAC string first given for it, so decoding gives back the same spelling
+_ip_names = {}
+
+
+def _remember(names, packed, name):
+    """Keep the first spelling given for an address, dropping the oldest past ADDRESS_CACHE_SIZE
+    (decoding an address whose spelling was dropped gives the canonical one)"""
+    if packed not in names:
+        if len(names) >= ADDRESS_CACHE_SIZE:
+            del names[next(iter(names))]
+        names[packed] = name
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def mac_bytes(mac):
+    """MAC string to 6 bytes; malformed addresses get a stable locally administered stand-in"""
+    try:
+        packed = bytes.fromhex(str(mac).replace(":", "").replace("-", ""))
+    except ValueError:
+        packed = b""
+    if len(packed) != 6:
+        packed = b"\x02" + str(mac).encode('utf-8').ljust(5, b"\0")[:5]
+    _remember(_mac_names, packed, mac)
+    return packed
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _mac_name(packed):
+    return ":".join(f"{b:02X}" for b in packed)
+
+
+def mac_string(packed):
+    packed = bytes(packed)
+    return _mac_names.get(packed) or _mac_name(packed)
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def ip_bytes(ip):
+    try:
+        packed = socket.inet_aton(ip)
+    except (OSError, TypeError):
+        packed = bytes(4)
+    _remember(_ip_names, packed, ip)
+    return packed
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _ip_name(packed):
+    return socket.inet_ntoa(packed)
+
+
+def ip_string(packed):
+    packed = bytes(packed)
+    return _ip_names.get(packed) or _ip_name(packed)
+
+
+# ----- payloads -----
+
+def _transport(data):
+    """'tcp' or 'udp' for a segment, None for other payloads. Dicts skip the slow ABC check."""
+    if type(data) is dict or isinstance(data, Mapping):
+        return data.get('protocol')
+    return None
+
+
+def encode_payload(data):
+    """Encode an IP payload to bytes. Returns (ip_protocol_number, bytes)"""
+    protocol = _transport(data)
+    if protocol == 'tcp':
+        header = _TCP.pack(data['source_port'], data['dest_port'], data['seq'] & _SEQ_MASK,
+                           data['ack'] & _SEQ_MASK, 5 << 4, tcp_flag_bits(data['flags']),
+                           min(data['window'], 0xFFFF), 0, 0)
+        return IPPROTO_TCP, header + bytes(data['payload'])
+    if protocol == 'udp':
+        payload = bytes(data['payload'])
+        return IPPROTO_UDP, _UDP.pack(data['source_port'], data['dest_port'], _UDP.size + len(payload), 0) + payload
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return IPPROTO_RAW, bytes(data)
+    return IPPROTO_TEXT, str(data).encode('utf-8')
+
+
+def decode_payload(protocol, raw):
+    """Inverse of encode_payload"""
+    if protocol == IPPROTO_TCP:
+        source_port, dest_port, seq, ack, offset, flags, window, _, _ = _TCP.unpack_from(raw)
+        return {
+            'protocol': 'tcp',
+            'source_port': source_port,
+            'dest_port': dest_port,
+            'seq': seq,
+            'ack': ack,
+            'flags': tcp_flag_string(flags),
+            'window': window,
+            'payload': bytes(raw[(offset >> 4) * 4:])
+        }
+    if protocol == IPPROTO_UDP:
+        source_port, dest_port, length, _ = _UDP.unpack_from(raw)
+        return {
+            'protocol': 'udp',
+            'source_port': source_port,
+            'dest_port': dest_port,
+            'payload': bytes(raw[_UDP.size:length])
+        }
+    if protocol == IPPROTO_TEXT:
+        return bytes(raw).decode('utf-8', 'replace')
+    return bytes(raw)
+
+
+def _transport_parts(data):
+    """(protocol, bytes after the transport header) for packing an IP payload in place"""
+    protocol = _transport(data)
+    if protocol == 'tcp':
+        return IPPROTO_TCP, bytes(data['payload'])
+    if protocol == 'udp':
+        return IPPROTO_UDP, bytes(data['payload'])
+    return encode_payload(data)
+
+
+# ----- packing into buffers -----
+
+def ipv4_size(packet):
+    if type(packet) is not dict and isinstance(packet, WirePacket):
+        return len(packet.raw)
+    if 'frag_offset' in packet:
+        return IPV4_HEADER_SIZE + len(packet['data'])
+    data = packet['data']
+    protocol = _transport(data)
+    if protocol == 'tcp':
+        return IPV4_HEADER_SIZE + _TCP.size + len(data['payload'])
+    if protocol == 'udp':
+        return IPV4_HEADER_SIZE + _UDP.size + len(data['payload'])
+    return IPV4_HEADER_SIZE + len(encode_payload(data)[1])
+
+
+def pack_ipv4_into(buffer, offset, packet):
+    """Write a packet (dict or WirePacket) at `offset` with all checksums. Returns the end offset."""
+    if type(packet) is not dict and isinstance(packet, WirePacket):
+        raw = packet.raw
+        end = offset + len(raw)
+        buffer[offset:end] = raw
+        return end
+
+    start = offset + IPV4_HEADER_SIZE
+    view = memoryview(buffer)
+    source, dest = ip_bytes(packet['source_ip']), ip_bytes(packet['dest_ip'])
+    if 'frag_offset' in packet:
+        protocol, body = packet['proto'], packet['data']
+        frag = (0x2000 if packet['mf'] else 0) | packet['frag_offset']
+        end = start + len(body)
+        buffer[start:end] = body
+    else:
+        data = packet['data']
+        protocol, body = _transport_parts(data)
+        frag = 0
+        if protocol == IPPROTO_TCP:
+            header_end = start + _TCP.size
+            end = header_end + len(body)
+            _TCP.pack_into(buffer, start, data['source_port'], data['dest_port'], data['seq'] & _SEQ_MASK,
+                           data['ack'] & _SEQ_MASK, 5 << 4, tcp_flag_bits(data['flags']),
+                           min(data['window'], 0xFFFF), 0, 0)
+        elif protocol == IPPROTO_UDP:
+            header_end = start + _UDP.size
+            end = header_end + len(body)
+            _UDP.pack_into(buffer, start, data['source_port'], data['dest_port'], end - start, 0)
+        else:
+            header_end, end = start, start + len(body)
+        buffer[header_end:end] = body
+
+        if protocol in (IPPROTO_TCP, IPPROTO_UDP):
+            checksum = internet_checksum(_PSEUDO.pack(source, dest, 0, protocol, end - start), view[start:end])
+            if protocol == IPPROTO_UDP and checksum == 0:
+                checksum = 0xFFFF  # 0 means "no checksum" for UDP
+            _U16.pack_into(buffer, start + (16 if protocol == IPPROTO_TCP else 6), checksum)
+
+    if packet.get('df'):
+        frag |= 0x4000
+    _IPV4.pack_into(buffer, offset, 0x45, (packet.get('dscp', 0) & 0x3F) << 2, end - offset, packet.get('id', 0) & 0xFFFF, frag,
+                    max(packet.get('ttl', 64), 0), protocol, 0, source, dest)
+    _U16.pack_into(buffer, offset + 10, internet_checksum(view[offset:start]))
+    return end
+
+
+def _ethernet_parts(frame):
+    """(header_size, ethertype, inner) for a frame dict"""
+    inner = frame.get('data')
+    header = ETH_HEADER_SIZE + (VLAN_TAG_SIZE if frame.get('vlan') is not None else 0)
+    if frame.get('type') == 'IPv4' and (type(inner) is dict or isinstance(inner, Mapping)) and 'dest_ip' in inner:
+        return header, ETH_P_IPV4, inner
+    return header, ETH_P_LOCAL, inner
+
+
+def frame_size(frame, with_fcs=True):
+    if type(frame) is not dict and isinstance(frame, WireFrame):
+        return frame.length if with_fcs else frame.length - FCS_SIZE
+    header, ethertype, inner = _ethernet_parts(frame)
+    if ethertype == ETH_P_IPV4:
+        body = ipv4_size(inner)
+    else:
+        body = 1 + len(encode_payload(inner)[1])
+    return header + body + (FCS_SIZE if with_fcs else 0)
+
+
+def pack_frame_into(buffer, offset, frame, with_fcs=True):
+    """Write an Ethernet frame (optionally 802.1Q tagged) at `offset`. Returns the end offset."""
+    if type(frame) is not dict and isinstance(frame, WireFrame):
+        raw = frame.view[:frame.length - (0 if with_fcs else FCS_SIZE)]
+        buffer[offset:offset + len(raw)] = raw
+        return offset + len(raw)
+
+    header, ethertype, inner = _ethernet_parts(frame)
+    dest, source = mac_bytes(frame['dest_mac']), mac_bytes(frame['source_mac'])
+    if header > ETH_HEADER_SIZE:
+        _ETH.pack_into(buffer, offset, dest, source, ETH_P_8021Q)
+        _VLAN.pack_into(buffer, offset + 12 + 2, frame['vlan'] & 0x0FFF, ethertype)
+    else:
+        _ETH.pack_into(buffer, offset, dest, source, ethertype)
+
+    position = offset + header
+    if ethertype == ETH_P_IPV4:
+        end = pack_ipv4_into(buffer, position, inner)
+    else:
+        protocol, body = encode_payload(inner)
+        buffer[position] = protocol  # Local EtherType payloads lead with the IP protocol number
+        end = position + 1 + len(body)
+        buffer[position + 1:end] = body
+
+    if with_fcs:
+        _FCS.pack_into(buffer, end, fcs(memoryview(buffer)[offset:end]))
+        end += FCS_SIZE
+    return end
+
+
+class BufferPool:
+    """Free list of equally sized bytearrays, so steady-state encoding allocates nothing"""
+
+    def __init__(self, buffer_size=2048, count=64, max_free=1024):
+        self.buffer_size = buffer_size
+        self.max_free = max_free
+        self.free = [bytearray(buffer_size) for _ in range(count)]
+        self.stats = {'acquired': 0, 'released': 0, 'misses': 0}
+
+    def acquire(self, size):
+        if size <= self.buffer_size and self.free:
+            self.stats['acquired'] += 1
+            return self.free.pop()
+        self.stats['misses'] += 1
+        return bytearray(max(size, self.buffer_size))
+
+    def release(self, buffer):
+        if len(buffer) == self.buffer_size and len(self.free) < self.max_free:
+            self.stats['released'] += 1
+            self.free.append(buffer)
+
+
+FRAME_POOL = BufferPool()
+
+
+# ----- zero-copy views -----
+
+class WirePacket(Mapping):
+    """Mapping view of an IPv4 packet inside a frame buffer.
+
+    Reads decode straight from the bytes. Only 'ttl' can be assigned; the
+    header checksum is then patched incrementally.
+    """
+    __slots__ = ('frame', 'raw', '_data')
+
+    def __init__(self, frame, raw):
+        self.frame = frame  # Keeps the buffer out of the pool while this view lives
+        self.raw = raw
+        self._data = None
+
+    @property
+    def header_length(self):
+        return (self.raw[0] & 0x0F) * 4
+
+    @property
+    def payload(self):
+        return self.raw[self.header_length:]
+
+    @property
+    def protocol(self):
+        return self.raw[9]
+
+    def is_fragment(self):
+        return bool(_U16.unpack_from(self.raw, 6)[0] & 0x3FFF)
+
+    def _keys(self):
+        keys = ['source_ip', 'dest_ip', 'ttl', 'id', 'df', 'data']
+        if self.raw[1] >> 2:
+            keys.append('dscp')
+        if self.is_fragment():
+            keys += ['frag_offset', 'mf', 'proto']
+        return keys
+
+    def __getitem__(self, key):
+        raw = self.raw
+        if key == 'source_ip':
+            return ip_string(raw[12:16])
+        if key == 'dest_ip':
+            return ip_string(raw[16:20])
+        if key == 'ttl':
+            return raw[8]
+        if key == 'id':
+            return _U16.unpack_from(raw, 4)[0]
+        if key == 'df':
+            return bool(raw[6] & 0x40)
+        if key == 'dscp' and raw[1] >> 2:
+            return raw[1] >> 2
+        if key == 'data':
+            if self._data is None:
+                self._data = bytes(self.payload) if self.is_fragment() else decode_payload(self.protocol, self.payload)
+            return self._data
+        if self.is_fragment():
+            if key == 'frag_offset':
+                return _U16.unpack_from(raw, 6)[0] & 0x1FFF
+            if key == 'mf':
+                return bool(raw[6] & 0x20)
+            if key == 'proto':
+                return self.protocol
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key != 'ttl':
+            raise KeyError(f"{key} is read-only on a wire packet")
+        raw = self.raw
+        old_word = _U16.unpack_from(raw, 8)[0]
+        raw[8] = max(value, 0)
+        checksum = update_checksum(_U16.unpack_from(raw, 10)[0], old_word, _U16.unpack_from(raw, 8)[0])
+        _U16.pack_into(raw, 10, checksum)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def verify(self):
+        """Header checksum, plus the TCP/UDP checksum for unfragmented packets"""
+        raw = self.raw
+        if internet_checksum(raw[:self.header_length]) != 0:
+            return False
+        if self.is_fragment() or self.protocol not in (IPPROTO_TCP, IPPROTO_UDP):
+            return True
+        payload = self.payload
+        if self.protocol == IPPROTO_UDP and _U16.unpack_from(payload, 6)[0] == 0:
+            return True
+        pseudo = _PSEUDO.pack(bytes(raw[12:16]), bytes(raw[16:20]), 0, self.protocol, len(payload))
+        return internet_checksum(pseudo, payload) == 0
+
+    def __repr__(self):
+        return f"WirePacket({self['source_ip']} -> {self['dest_ip']}, ttl={self['ttl']}, {len(self.raw)} bytes)"
+
+
+class WireFrame(Mapping):
+    """Mapping view of an encoded Ethernet frame in a (pooled) buffer.
+
+    Device code reads it like a frame dict. The buffer goes back to its pool
+    when the frame and every view derived from it are gone; memoryview
+    slices handed out (view, payload) are only valid until then.
+    """
+    __slots__ = ('buffer', 'view', 'length', 'pool', '_header', '_ethertype')
+
+    def __init__(self, buffer, length, pool=None):
+        self.buffer = buffer
+        self.view = memoryview(buffer)[:length]
+        self.length = length
+        self.pool = pool
+        ethertype = _U16.unpack_from(buffer, 12)[0]
+        if ethertype == ETH_P_8021Q:
+            self._header = ETH_HEADER_SIZE + VLAN_TAG_SIZE
+            ethertype = _U16.unpack_from(buffer, 16)[0]
+        else:
+            self._header = ETH_HEADER_SIZE
+        self._ethertype = ethertype
+
+    @classmethod
+    def encode(cls, frame, pool=FRAME_POOL):
+        size = frame_size(frame)
+        buffer = pool.acquire(size)
+        return cls(buffer, pack_frame_into(buffer, 0, frame), pool)
+
+    def __del__(self):
+        if self.pool is not None:
+            self.pool.release(self.buffer)
+
+    @property
+    def payload(self):
+        return self.view[self._header:self.length - FCS_SIZE]
+
+    def _keys(self):
+        keys = ['source_mac', 'dest_mac', 'data']
+        if self._ethertype == ETH_P_IPV4:
+            keys.append('type')
+        if self._header > ETH_HEADER_SIZE:
+            keys.append('vlan')
+        return keys
+
+    def __getitem__(self, key):
+        if key == 'dest_mac':
+            return mac_string(self.view[0:6])
+        if key == 'source_mac':
+            return mac_string(self.view[6:12])
+        if key == 'type' and self._ethertype == ETH_P_IPV4:
+            return 'IPv4'
+        if key == 'vlan' and self._header > ETH_HEADER_SIZE:
+            return _U16.unpack_from(self.view, 14)[0] & 0x0FFF
+        if key == 'data':
+            payload = self.payload
+            if self._ethertype == ETH_P_IPV4:
+                # A fresh view each time: caching it here would form a cycle and keep the buffer from the pool
+                return WirePacket(self, payload[:_U16.unpack_from(payload, 2)[0]])
+            return decode_payload(payload[0], payload[1:])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def verify(self):
+        """Check the FCS and, for IPv4, the IP and transport checksums"""
+        end = self.length - FCS_SIZE
+        if _FCS.unpack_from(self.view, end)[0] != fcs(self.view[:end]):
+            return False
+        return self._ethertype != ETH_P_IPV4 or self['data'].verify()
+
+    def __repr__(self):
+        return f"WireFrame({self['source_mac']} -> {self['dest_mac']}, {self.length} bytes)"
+
+
+def plain(data):
+    """Dict copy of a wire frame or packet (and anything it carries), for data kept
+    past the send: it pins no pooled buffer and can be copied and pickled"""
+    if isinstance(data, (WireFrame, WirePacket)):
+        return {key: plain(value) for key, value in data.items()}
+    return data
+
+
+def encode_frame(data, layer=2):
+    """Ethernet bytes (no FCS) for whatever an entity received, as written to captures.
+
+    IPv4 frames are encoded in full. Other layer-2 frames and raw layer-1
+    data travel under the local experimental EtherType.
+    """
+    if not (layer >= 2 and isinstance(data, Mapping) and 'dest_mac' in data):
+        data = {'dest_mac': "FF:FF:FF:FF:FF:FF", 'source_mac': "00:00:00:00:00:00", 'data': data}
+    buffer = bytearray(frame_size(data, with_fcs=False))
+    pack_frame_into(buffer, 0, data, with_fcs=False)
+    return buffer
+
+
+if __name__ == "__main__":
+    import time
+
+    def rate(label, count, nbytes, elapsed):
+        print(f"{label:<32} {count / elapsed:>12,.0f} frames/s {nbytes / elapsed / 1e6:>10,.1f} MB/s")
+
+    def concat_frame(frame):
+        """The same Ethernet/IPv4/TCP frame as WireFrame.encode, built by concatenating bytes"""
+        packet = frame['data']
+        source, dest = ip_bytes(packet['source_ip']), ip_bytes(packet['dest_ip'])
+        protocol, segment = encode_payload(packet['data'])
+        checksum = internet_checksum(_PSEUDO.pack(source, dest, 0, protocol, len(segment)), segment)
+        segment = segment[:16] + _U16.pack(checksum) + segment[18:]
+        header = _IPV4.pack(0x45, 0, IPV4_HEADER_SIZE + len(segment), packet['id'], 0, packet['ttl'], protocol, 0,
+                            source, dest)
+        header = header[:10] + _U16.pack(internet_checksum(header)) + header[12:]
+        body = _ETH.pack(mac_bytes(frame['dest_mac']), mac_bytes(frame['source_mac']), ETH_P_IPV4) + header + segment
+        return body + _FCS.pack(fcs(body))
+
+    for payload_size in (64, 1460):
+        segment = {'protocol': 'tcp', 'source_port': 49152, 'dest_port': 80, 'seq': 1000, 'ack': 2000,
+                   'flags': "A", 'window': 65535, 'payload': bytes(payload_size)}
+        frame = {'source_mac': "00:1A:2B:3C:4D:11", 'dest_mac': "00:1A:2B:3C:4D:01", 'type': 'IPv4',
+                 'data': {'source_ip': "10.0.0.1", 'dest_ip': "40.0.0.1", 'ttl': 64, 'id': 1, 'data': segment}}
+        size = frame_size(frame)
+        count = 200000 if payload_size < 1000 else 50000
+        print(f"--- TCP frame, {payload_size} byte payload ({size} bytes on the wire) ---")
+
+        wire = WireFrame.encode(frame)
+        assert concat_frame(frame) == bytes(wire.view[:wire.length])
+        start = time.perf_counter()
+        for _ in range(count):
+            concat_frame(frame)
+        rate("full frame (bytes concat)", count, size * count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(count):
+            WireFrame.encode(frame)
+        rate("WireFrame.encode (pooled)", count, size * count, time.perf_counter() - start)
+
+        buffer = bytes(wire.view)
+        start = time.perf_counter()
+        for _ in range(count):
+            WireFrame(buffer, size)['data']['data']
+        rate("decode to segment dict", count, size * count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(count):
+            WireFrame(buffer, size)['data']['dest_ip']
+        rate("decode header field only", count, size * count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(count):
+            wire.verify()
+        rate("verify FCS + checksums", count, size * count, time.perf_counter() - start)
+
+        packet = wire['data']
+        start = time.perf_counter()
+        for _ in range(count):
+            packet['ttl'] = 64
+        rate("TTL rewrite (RFC 1624)", count, size * count, time.perf_counter() - start)
+        print(f"pool: {FRAME_POOL.stats}")
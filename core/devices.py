@@ -1,18 +1,121 @@
 import random
 from collections import defaultdict
+from collections.abc import Mapping
 import time
+import weakref
+import zlib
 import streamlit as st
 import os
+from core.clock import SimClock
+from core.codec import WireFrame, plain
+from core.metrics import frame_bytes
+from core.ftp import iter_chunks
+from core.fragmentation import DEFAULT_MTU, ReassemblyBuffer, fragment, fragment_count, is_fragment
+from core.dns import DnsServer, DnsZone, StubResolver, DEFAULT_ZONE_FILE
+from core.transport import TcpConnection, ConnectionTable, DEFAULT_TTL, IPV4_HEADER_SIZE, segment_size, tcp_segment, udp_datagram, to_bytes
+
+def flow_hash(data, salt=""):
+    """Stable CRC32 of a flow: IPs, protocol and ports when the frame carries
+    a packet, MAC addresses otherwise. `salt` varies the hash per device."""
+    macs = ()
+    if isinstance(data, Mapping) and 'dest_mac' in data:
+        macs = (data.get('source_mac'), data['dest_mac'])
+        data = data.get('data')
+    if isinstance(data, Mapping) and 'dest_ip' in data:
+        segment = data.get('data')
+        if isinstance(segment, Mapping):
+            ports = (segment.get('protocol'), segment.get('source_port'), segment.get('dest_port'))
+        else:
+            ports = ()
+        key = f"{salt}|{data.get('source_ip')}|{data['dest_ip']}|{ports}"
+    else:
+        key = f"{salt}|{macs}"
+    # CRC32 is linear, so similar keys differ in few bits; a Fibonacci multiply spreads them to the high bits
+    return (zlib.crc32(key.encode()) * 0x9E3779B1 & 0xFFFFFFFF) >> 16
 
 class Entity:
+    # Global change counters. Views derived from the network (tables,
+    # statistics) are cached against these instead of rebuilt on every rerun.
+    topology_version = 0  # links, addressing, VLANs, routes
+    state_version = 0  # learned tables and received data
+    taps = None  # Callbacks tap(entity, data, source, layer) for each frame arriving here, see core.capture
+    wire_mode = False  # Build frames as encoded bytes (core.codec.WireFrame) instead of dicts
+    counters = None  # Counter dict while instrumentation is on, see core.metrics
+    watchers = ()  # Weak references to the objects told touched((entity,)) when this entity changes, see watch()
+
     def __init__(self, id):
         self.id = id
         self.connected_to = []  
+        Entity.touch_topology(self)
         
+    @staticmethod
+    def touch_topology(*entities):
+        """Bump the topology version. `entities` are the devices that changed;
+        the watchers registered on them are told."""
+        Entity.topology_version += 1
+        for entity in entities:
+            for ref in entity.watchers:
+                watcher = ref()
+                if watcher is not None:
+                    watcher.touched((entity,))
+
+    def watch(self, watcher):
+        """Tell watcher.touched() about changes to this entity, see core.route_check.
+        Registered per entity, so a session's watchers only hear of its own network."""
+        ref = weakref.ref(watcher)
+        if ref not in self.watchers:
+            self.watchers = tuple(r for r in self.watchers if r() is not None) + (ref,)
+
+    @staticmethod
+    def touch_state():
+        Entity.state_version += 1
+
+    def add_tap(self, tap):
+        self.taps = (self.taps or []) + [tap]
+
+    def remove_tap(self, tap):
+        taps = [t for t in (self.taps or []) if t is not tap]
+        self.taps = taps or None
+
+    def _tap(self, data, source, layer):
+        for tap in self.taps:
+            tap(self, data, source, layer)
+
+    def _count_frame(self, data, source, layer):
+        size = frame_bytes(data, layer)
+        counters = self.counters
+        counters['frames_in'] += 1
+        counters['bytes_in'] += size
+        link = counters['links'].get(source.id)
+        if link is None:
+            link = counters['links'][source.id] = [0, 0]
+        link[0] += 1
+        link[1] += size
+        if source.counters is not None:
+            source.counters['frames_out'] += 1
+            source.counters['bytes_out'] += size
+
+    def _frame(self, source_mac, dest_mac, data, ethertype='IPv4'):
+        frame = {'source_mac': source_mac, 'dest_mac': dest_mac}
+        if ethertype:
+            frame['type'] = ethertype
+        frame['data'] = data
+        return WireFrame.encode(frame) if self.wire_mode else frame
+
+    def _check_frame(self, frame):
+        """Wire frames must pass their FCS and checksums; dict frames always do"""
+        if isinstance(frame, WireFrame) and not frame.verify():
+            print(f"{self.id}: dropping frame with bad checksum {frame}")
+            if self.counters is not None:
+                self.counters['checksum_drops'] += 1
+            return False
+        return True
+
     def connect(self, entity):
         if entity not in self.connected_to:
             self.connected_to.append(entity)
             entity.connected_to.append(self)  # Bidirectional connection
+            Entity.touch_topology(self, entity)
             return True
         return False
             
@@ -29,13 +132,22 @@ class EndDevice(Entity):
         self.received_data = []  
         self.arp_table = {}  
         self.ports = {}  # port_num -> {"protocol", "service", "handler"}
-        self.connections = defaultdict(dict)  # (ip, port) -> connection state
+        self.connections = ConnectionTable(self)  # 5-tuple -> socket, listeners and ephemeral ports
+        self.transport = None  # TransportLayerSimulator handling segments addressed to this device
+        self.resolver = StubResolver(self)  # DNS cache for names this device looks up
+        self.mtu = DEFAULT_MTU
+        self.reassembly = ReassemblyBuffer()
+        self.next_ip_id = 0
+        self.fragments_created = 0
+        self.dhcp = None  # core.dhcp.DhcpClient once the device gets its address by DHCP
         
     def set_gateway(self, gateway_ip):
         self.default_gateway = gateway_ip
+        Entity.touch_topology(self)
     
     def add_to_arp_table(self, ip, mac):
         self.arp_table[ip] = mac
+        Entity.touch_state()
                     
     def same_subnet(self, ip_address):
         """Check if the destination IP is in the same subnet"""
@@ -58,9 +170,10 @@ class EndDevice(Entity):
             "service": service_name,
             "handler": handler
         }
+        Entity.touch_topology(self)
         return True
     
-    def send(self, data, destination, layer=3, visited=None):
+    def send(self, data, destination, layer=3, visited=None, dscp=0, dest_ip=None):
         if visited is None:
             visited = set()
         
@@ -77,11 +190,7 @@ class EndDevice(Entity):
             return False
         
         elif layer == 2:
-            frame = {
-                'source_mac': self.mac,
-                'dest_mac': destination.mac,
-                'data': data
-            }
+            frame = self._frame(self.mac, destination.mac, data, ethertype=None)
             
             if destination in self.connected_to:
                 return destination.receive(frame, self, layer=layer)
@@ -95,104 +204,122 @@ class EndDevice(Entity):
             return False
         
         elif layer == 3:
-            print(f"Sending data to {destination.ip} at layer 3")
-            dest_ip = destination.ip
+            dest_ip = dest_ip or destination.ip  # Another address only for a NAT router's public one
+            print(f"Sending data to {dest_ip} at layer 3")
             
             packet = {
                 'source_ip': self.ip,
                 'dest_ip': dest_ip,
-                'ttl': 64, 
+                'ttl': DEFAULT_TTL, 
+                'id': self.next_ip_id,
                 'data': data
             }
+            if dscp:
+                packet['dscp'] = dscp
+            self.next_ip_id = (self.next_ip_id + 1) & 0xFFFF
 
             print(f"Packet to send: {packet}")
 
-            if destination in self.connected_to or self.same_subnet(dest_ip):
-                print(f"Destination {dest_ip} is present in same subnet or directly connected.")
-                if dest_ip not in self.arp_table:
-                    self.arp_table[dest_ip] = destination.mac
-                
-                frame = {
-                    'source_mac': self.mac,
-                    'dest_mac': self.arp_table[dest_ip],
-                    'type': 'IPv4',
-                    'data': packet
-                }
-
-                print(f"Frame to send: {frame}")
-                
-                if destination in self.connected_to:
-                    return destination.receive(frame, self, layer=2)
-                
-                for entity in self.connected_to:
-                    if entity.id not in visited:
-                        if isinstance(entity, (Switch, Bridge, Hub)):
-                            visited_copy = visited.copy()
-                            if entity.forward(frame, self, destination, layer=2, visited=visited_copy):
-                                return True
+            fragments = fragment(packet, self.mtu)
+            if not fragments:
+                print(f"Packet to {dest_ip} does not fit in an IPv4 datagram")
+                return False
+            if len(fragments) > 1:
+                print(f"Packet to {dest_ip} split into {len(fragments)} fragments for MTU {self.mtu}")
+                self.fragments_created += len(fragments)
+            return all([self._send_packet(f, destination, visited) for f in fragments])
+        
+        return False
+    
+    def _send_packet(self, packet, destination, visited):
+        """Deliver one IP packet (or fragment) towards destination"""
+        dest_ip = packet['dest_ip']
+        if destination in self.connected_to or self.same_subnet(dest_ip):
+            print(f"Destination {dest_ip} is present in same subnet or directly connected.")
+            if dest_ip not in self.arp_table:
+                self.arp_table[dest_ip] = destination.get_mac_for_interface(dest_ip) if isinstance(destination, Router) else destination.mac
+                Entity.touch_state()
             
-            elif self.default_gateway:
-                gateway_mac = None
-                gateway_device = None
-                
-                for entity in self.connected_to:
-                    if isinstance(entity, Router) and entity.has_ip(self.default_gateway):
-                        gateway_mac = entity.get_mac_for_interface(self.default_gateway)
-                        gateway_device = entity
-                        break
-                    elif isinstance(entity, (Hub, Switch, Bridge)):
-                        for connected_entity in entity.connected_to:
-                            if isinstance(connected_entity, Router) and connected_entity.has_ip(self.default_gateway):
-                                gateway_mac = connected_entity.get_mac_for_interface(self.default_gateway)
-                                gateway_device = connected_entity
-                                break
-                        
-                        if gateway_mac:
+            frame = self._frame(self.mac, self.arp_table[dest_ip], packet)
+
+            print(f"Frame to send: {frame}")
+            
+            if destination in self.connected_to:
+                return destination.receive(frame, self, layer=2)
+            
+            for entity in self.connected_to:
+                if entity.id not in visited:
+                    if isinstance(entity, (Switch, Bridge, Hub)):
+                        visited_copy = visited.copy()
+                        if entity.forward(frame, self, destination, layer=2, visited=visited_copy):
+                            return True
+        
+        elif self.default_gateway:
+            gateway_mac = None
+            gateway_device = None
+            
+            for entity in self.connected_to:
+                if isinstance(entity, Router) and entity.has_ip(self.default_gateway):
+                    gateway_mac = entity.get_mac_for_interface(self.default_gateway)
+                    gateway_device = entity
+                    break
+                elif isinstance(entity, (Hub, Switch, Bridge)):
+                    for connected_entity in entity.connected_to:
+                        if isinstance(connected_entity, Router) and connected_entity.has_ip(self.default_gateway):
+                            gateway_mac = connected_entity.get_mac_for_interface(self.default_gateway)
+                            gateway_device = connected_entity
                             break
-                
-                if gateway_mac and gateway_device:
-                    print(f"Gateway found: {gateway_device.id} with MAC {gateway_mac}")
-                    frame = {
-                        'source_mac': self.mac,
-                        'dest_mac': gateway_mac,
-                        'type': 'IPv4',
-                        'data': packet
-                    }
-
-                    print(f"Frame to send to gateway: {frame}")
-                    
-                    if gateway_device in self.connected_to:
-                        return gateway_device.receive(frame, self, layer=2)
                     
-                    for entity in self.connected_to:
-                        if entity.id not in visited and isinstance(entity, (Hub, Switch, Bridge)):
-                            visited_copy = visited.copy()
-                            if entity.forward(frame, self, gateway_device, layer=2, visited=visited_copy):
-                                return True
+                    if gateway_mac:
+                        break
+            
+            if gateway_mac and gateway_device:
+                print(f"Gateway found: {gateway_device.id} with MAC {gateway_mac}")
+                frame = self._frame(self.mac, gateway_mac, packet)
+
+                print(f"Frame to send to gateway: {frame}")
                 
-                return False
-            else:
-                return False
+                if gateway_device in self.connected_to:
+                    return gateway_device.receive(frame, self, layer=2)
+                
+                for entity in self.connected_to:
+                    if entity.id not in visited and isinstance(entity, (Hub, Switch, Bridge)):
+                        visited_copy = visited.copy()
+                        if entity.forward(frame, self, gateway_device, layer=2, visited=visited_copy):
+                            return True
+            elif self.counters is not None:
+                self.counters['arp_failures'] += 1
+            
+            return False
+        else:
+            return False
         
         return False
     
     def receive(self, data, source, layer=1):
         print(f"Device {self.id} receiving data from {source.id}")
         print(f"Data: {data}")
+        Entity.touch_state()
+        if self.taps and layer <= 2:
+            self._tap(data, source, layer)
+        if self.counters is not None and layer <= 2:
+            self._count_frame(data, source, layer)
         if layer == 1:
             self.received_data.append({
                 "layer": 1,
-                "data": data,
+                "data": plain(data),
                 "source": source.id
             })
             return True
             
         elif layer == 2:
             if 'dest_mac' in data:  
+                if not self._check_frame(data):
+                    return False
                 destination_mac = data['dest_mac']
                 source_mac = data['source_mac']
                 
-                if 'data' in data and isinstance(data['data'], dict) and 'source_ip' in data['data']:
+                if 'data' in data and isinstance(data['data'], Mapping) and 'source_ip' in data['data']:
                     self.arp_table[data['data']['source_ip']] = source_mac
                 
                 if destination_mac == self.mac or destination_mac == "FF:FF:FF:FF:FF:FF": 
@@ -201,7 +328,7 @@ class EndDevice(Entity):
                     else:
                         self.received_data.append({
                             "layer": 2,
-                            "frame": data,
+                            "frame": plain(data),
                             "source": source.id
                         })
                         return True
@@ -213,10 +340,24 @@ class EndDevice(Entity):
             if 'dest_ip' in data:  
                 destination_ip = data['dest_ip']
                 
+                if self.dhcp is not None and self.dhcp.receive(data):
+                    return True
+                
                 if destination_ip == self.ip:
+                    if is_fragment(data):
+                        now = self.transport.clock.now if self.transport is not None else time.monotonic()
+                        data = self.reassembly.add(data, now)
+                        if data is None:
+                            return True  # Held until the rest of the datagram arrives
+                    
+                    segment = data.get('data')
+                    if self.transport is not None and isinstance(segment, dict) and 'protocol' in segment:
+                        self.transport.on_packet(self, data)
+                        return True
+                    
                     self.received_data.append({
                         "layer": 3,
-                        "packet": data,
+                        "packet": plain(data),
                         "source": source.id
                     })
                     
@@ -254,6 +395,11 @@ class Hub(Entity):
             visited = set()
         print(f"Hub {self.id} broadcasting data from {source.id} to {destination.id if destination else ""}")
         visited.add(self.id)
+        if self.taps:
+            self._tap(data, source, layer)
+        if self.counters is not None:
+            self._count_frame(data, source, layer)
+            self.counters['floods'] += 1  # A hub repeats everything
         
         success = False
         
@@ -280,6 +426,7 @@ class Switch(Entity):
         self.port_table = {}  
         self.vlan_table = {}  
         self.default_vlan = 1
+        self.lags = {}  # logical port -> {'peer', 'members': [{'name', 'up'}], shared with the peer, 'tx': {name: [frames, bytes]}}
     
     def connect(self, entity, port=None, vlan=None):
         if entity not in self.connected_to:
@@ -295,6 +442,7 @@ class Switch(Entity):
             else:
                 self.vlan_table[port] = self.default_vlan
                 
+            Entity.touch_topology(self, entity)
             return True
         return False
     
@@ -302,14 +450,80 @@ class Switch(Entity):
         if entity in self.port_table:
             port = self.port_table[entity]
             self.vlan_table[port] = vlan
+            Entity.touch_topology(self)
             return True
         return False
+    
+    def add_lag_member(self, entity):
+        """Add a member link towards another switch.
+
+        The existing link becomes the first member, so the aggregate keeps
+        the neighbour's single logical port in port_table and mac_table.
+        Both switches share the member list, so failing a member takes it
+        down in both directions.
+        """
+        if not isinstance(entity, Switch):
+            return False
+        if entity not in self.connected_to:
+            self.connect(entity)
+        for switch, peer in ((self, entity), (entity, self)):
+            if peer not in switch.port_table:
+                port = len(switch.port_table)
+                switch.port_table[peer] = port
+                switch.vlan_table[port] = switch.default_vlan
+
+        lag = self.lags.get(self.port_table[entity])
+        if lag is None:
+            members = [{'name': "member1", 'up': True}]
+            for switch, peer in ((self, entity), (entity, self)):
+                switch.lags[switch.port_table[peer]] = {'peer': peer, 'members': members, 'tx': {"member1": [0, 0]}}
+            lag = self.lags[self.port_table[entity]]
+        name = f"member{len(lag['members']) + 1}"
+        lag['members'].append({'name': name, 'up': True})
+        for switch, peer in ((self, entity), (entity, self)):
+            switch.lags[switch.port_table[peer]]['tx'][name] = [0, 0]
+        print(f"Switch {self.id}: {len(lag['members'])} member links to {entity.id}")
+        Entity.touch_topology(self, entity)
+        return True
+    
+    def set_lag_member(self, entity, name, up):
+        """Fail or restore one member link; flows rehash onto the members still up"""
+        lag = self.lags.get(self.port_table.get(entity))
+        if lag is None:
+            return False
+        for member in lag['members']:
+            if member['name'] == name:
+                member['up'] = up
+                Entity.touch_topology(self, lag['peer'])
+                return True
+        return False
+    
+    def _egress(self, device, data, layer=2):
+        """Pick the LAG member for a frame leaving towards device; False if every member is down"""
+        if not self.lags:
+            return True
+        lag = self.lags.get(self.port_table.get(device))
+        if lag is None:
+            return True
+        up = [member for member in lag['members'] if member['up']]
+        if not up:
+            print(f"Switch {self.id}: every member link to {device.id} is down")
+            return False
+        member = up[flow_hash(data, self.id) % len(up)] if len(up) > 1 else up[0]
+        tx = lag['tx'][member['name']]
+        tx[0] += 1
+        tx[1] += frame_bytes(data, layer)
+        return True
         
     def forward(self, frame, source, destination=None, layer=2, visited=None):
         if visited is None:
             visited = set()
         print(f"Switch {self.id} forwarding frame from {source.id}")
         visited.add(self.id)
+        if self.taps:
+            self._tap(frame, source, layer)
+        if self.counters is not None:
+            self._count_frame(frame, source, layer)
         
         if layer < 2:
             return self._flood(frame, source, destination, visited)
@@ -319,7 +533,11 @@ class Switch(Entity):
             source_port = self.port_table.get(source)
             
             if source_port is not None:
-                self.mac_table[source_mac] = source_port
+                if self.mac_table.get(source_mac) != source_port:
+                    self.mac_table[source_mac] = source_port
+                    Entity.touch_state()
+                    if self.counters is not None:
+                        self.counters['mac_learns'] += 1
                 source_vlan = self.vlan_table.get(source_port, self.default_vlan)
             else:
                 source_vlan = self.default_vlan
@@ -333,14 +551,21 @@ class Switch(Entity):
                 dest_port = self.mac_table[destination_mac]
                 dest_vlan = self.vlan_table.get(dest_port, self.default_vlan)
                 print(f"Destination MAC {destination_mac} found on port {dest_port}")
+                if dest_vlan != source_vlan and self.counters is not None:
+                    self.counters['vlan_drops'] += 1
                 if source_port is not None and dest_vlan == source_vlan:
                     for device, port in self.port_table.items():
                         if port == dest_port:
-                            if device == destination or destination is None:
+                            deliver = device == destination or destination is None
+                            if not deliver and not (isinstance(device, (Hub, Switch, Bridge, Router)) and device.id not in visited):
+                                continue  # Nothing leaves on this port, so no member link carries it
+                            if not self._egress(device, frame, layer):
+                                return False
+                            if deliver:
                                 print(f"Sending frame to {device.id} on port {port}")
                                 result = device.receive(frame, self, layer=layer)
                                 return result
-                            elif isinstance(device, (Hub, Switch, Bridge, Router)) and device.id not in visited:
+                            else:
                                 print(f"Forwarding frame to {device.id} on port {port}")
                                 visited_copy = visited.copy()
                                 return device.forward(frame, self, destination, layer=layer, visited=visited_copy)
@@ -352,10 +577,12 @@ class Switch(Entity):
     def _flood(self, data, source, destination=None, visited=None):
         if visited is None:
             visited = set()
+        if self.counters is not None:
+            self.counters['floods'] += 1
             
         success = False
         for device in self.connected_to:
-            if device != source and device.id not in visited:
+            if device != source and device.id not in visited and self._egress(device, data):
                 if isinstance(device, EndDevice):
                     result = device.receive(data, self, layer=2)
                     if device == destination and result:
@@ -372,6 +599,8 @@ class Switch(Entity):
     def _flood_vlan(self, data, source, destination, source_vlan, visited=None):
         if visited is None:
             visited = set()
+        if self.counters is not None:
+            self.counters['floods'] += 1
             
         success = False
         source_port = self.port_table.get(source)
@@ -381,7 +610,11 @@ class Switch(Entity):
                 port = self.port_table.get(device)
                 if port is not None:
                     port_vlan = self.vlan_table.get(port, self.default_vlan)
-                    if port_vlan == source_vlan:
+                    if port_vlan != source_vlan:
+                        if self.counters is not None and self._addressed_to(device, data, destination):
+                            self.counters['vlan_drops'] += 1
+                        continue
+                    if self._egress(device, data):
                         if isinstance(device, EndDevice):
                             result = device.receive(data, self, layer=2)
                             if device == destination and result:
@@ -395,6 +628,18 @@ class Switch(Entity):
                             success = success or result
         return success
     
+    @staticmethod
+    def _addressed_to(device, frame, destination):
+        """Whether a frame is meant for device, by object, MAC or (for broadcasts) IP"""
+        if device == destination:
+            return True
+        if not isinstance(device, EndDevice) or not isinstance(frame, Mapping):
+            return False
+        if frame.get('dest_mac') == device.mac:
+            return True
+        packet = frame.get('data')
+        return isinstance(packet, Mapping) and packet.get('dest_ip') == device.ip
+    
     def get_mac_for_interface(self, ip_address):
         print(f"Switch {self.id} looking for MAC Address of IP {ip_address}")
         for device in self.connected_to:
@@ -420,6 +665,7 @@ class Bridge(Entity):
             if port is None:
                 port = len(self.port_table)
             self.port_table[entity] = port
+            Entity.touch_topology(self, entity)
             return True
         return False 
     
@@ -429,6 +675,10 @@ class Bridge(Entity):
             visited = set()
             
         visited.add(self.id)
+        if self.taps:
+            self._tap(frame, source, layer)
+        if self.counters is not None:
+            self._count_frame(frame, source, layer)
         
         if layer < 2:
             return False  
@@ -437,8 +687,11 @@ class Bridge(Entity):
             source_mac = frame["source_mac"]
             source_port = self.port_table.get(source)
             
-            if source_port is not None:
+            if source_port is not None and self.mac_table.get(source_mac) != source_port:
                 self.mac_table[source_mac] = source_port
+                Entity.touch_state()
+                if self.counters is not None:
+                    self.counters['mac_learns'] += 1
             
             destination_mac = frame["dest_mac"]
             
@@ -464,6 +717,8 @@ class Bridge(Entity):
         """Send data to all ports except the source port"""
         if visited is None:
             visited = set()
+        if self.counters is not None:
+            self.counters['floods'] += 1
             
         success = False
         for device in self.connected_to:
@@ -482,23 +737,32 @@ class Bridge(Entity):
         return success
 
 class Router(Entity):
+
     def __init__(self, id):
         super().__init__(id)
         self.interfaces = {}  # Interface name : {ip, mac, subnet} 
-        self.routing_table = []  # [{network, subnet_mask, next_hop, interface}, ...]
+        self.routing_table = []  # [{network, subnet_mask, next_hop, interface[, ecmp]}, ...]
         self.port_table = {}  
         self.arp_table = {}  
         self.public_ip = None  
+        self.nat = None  # core.nat.NatTable translating traffic that leaves through its outside interfaces
+        self.fragments_created = 0
+        self.next_hop_load = {}  # ECMP groups: (network, subnet_mask) -> {(interface, next_hop): packets}
+        self.egress = {}  # Interface name : core.qos.EgressQueue
+        self.acls = {}  # (interface name, "in" or "out") : core.acl.Acl
+        self.dhcp = {}  # Interface name : core.dhcp.DhcpServer
     
-    def add_interface(self, name, ip_address, mac_address, subnet_mask="255.255.255.0"):
+    def add_interface(self, name, ip_address, mac_address, subnet_mask="255.255.255.0", mtu=DEFAULT_MTU):
         self.interfaces[name] = {
             'ip': ip_address,
             'mac': mac_address,
-            'subnet_mask': subnet_mask
+            'subnet_mask': subnet_mask,
+            'mtu': mtu
         }
         
         network = self._get_network(ip_address, subnet_mask)
         self.add_route(network, subnet_mask, None, name)
+        Entity.touch_topology(self)
         
         return True
     
@@ -558,23 +822,30 @@ class Router(Entity):
             if isinstance(entity, EndDevice):
                 entity.set_gateway(self.interfaces[interface_name]['ip'])
                 
+            Entity.touch_topology(self, entity)
             return True
         return False
     
-    def add_route(self, network, subnet_mask, next_hop, interface):
-        self.routing_table.append({
+    def add_route(self, network, subnet_mask, next_hop, interface, ecmp=False):
+        """`ecmp` routes for the same prefix form a group that flows are hashed across"""
+        route = {
             'network': network,
             'subnet_mask': subnet_mask,
             'next_hop': next_hop,  
             'interface': interface
-        })
+        }
+        if ecmp:
+            route['ecmp'] = True
+        self.routing_table.append(route)
+        Entity.touch_topology(self)
         return True
     
     def add_default_route(self, next_hop, interface):
         return self.add_route("0.0.0.0", "0.0.0.0", next_hop, interface)
             
     def _match_route(self, dest_ip):
-        best_match = None
+        """Every route of the longest matching prefix, in table order"""
+        best_matches = []
         best_mask_count = -1
         
         for route in self.routing_table:
@@ -597,104 +868,183 @@ class Router(Entity):
                     break
             
             if matches and mask_bit_count > best_mask_count:
-                best_match = route
+                best_matches = [route]
                 best_mask_count = mask_bit_count
+            elif matches and mask_bit_count == best_mask_count:
+                best_matches.append(route)
         
-        return best_match
+        return best_matches
+    
+    @staticmethod
+    def forwarding_group(routes):
+        """Which of one prefix's routes carry traffic: the first, or every ECMP route when the first is one"""
+        if len(routes) > 1 and routes[0].get('ecmp'):
+            return [route for route in routes if route.get('ecmp')]
+        return routes[:1]
+
+    def _select_route(self, routes, packet):
+        routes = self.forwarding_group(routes)
+        if len(routes) == 1:
+            return routes[0]
+        routes = sorted(routes, key=lambda r: (r['interface'], r['next_hop'] or ""))
+        route = routes[flow_hash(packet, self.id) % len(routes)]  # Salted so ECMP stages don't all pick alike
+        group = self.next_hop_load.setdefault((route['network'], route['subnet_mask']), {})
+        key = (route['interface'], route['next_hop'])
+        group[key] = group.get(key, 0) + 1
+        return route
     
     def forward(self, packet, source, destination=None, layer=3, visited=None):
         if visited is None:
             visited = set()
         visited.add(self.id)
         
-        if layer == 2 and isinstance(packet, dict) and 'type' in packet and packet['type'] == 'IPv4':
+        if layer == 2 and isinstance(packet, Mapping) and 'type' in packet and packet['type'] == 'IPv4':
             return self.receive(packet, source, layer)
         
-        if layer == 3 and isinstance(packet, dict) and 'dest_ip' in packet:
+        if layer == 3 and isinstance(packet, Mapping) and 'dest_ip' in packet:
             dest_ip = packet['dest_ip']
             print(f"Router {self.id} processing packet for destination {dest_ip}")
             packet['ttl'] = packet.get('ttl', 64) - 1
             if packet['ttl'] <= 0:
+                if self.counters is not None:
+                    self.counters['ttl_drops'] += 1
                 return False
             
-            route = self._match_route(dest_ip)
-            print(f"Best Matched route: {route}")
+            routes = self._match_route(dest_ip)
+            route = self._select_route(routes, packet) if routes else None
+            print(f"Best Matched route: {route}" + (f" of {len(routes)} equal-cost routes" if len(routes) > 1 else ""))
+            if self.counters is not None:
+                self.counters['route_lookups'] += 1
+                if not route:
+                    self.counters['no_route_drops'] += 1
+            if route and self.nat is not None and route['interface'] in self.nat.outside \
+                    and self.port_table.get(source) not in self.nat.outside:
+                packet = self.nat.outbound(packet)
+                if packet is None:
+                    print(f"Router {self.id}: no NAT mapping available for {dest_ip}")
+                    return False
+            if route and self.acls and not self._acl_permits(packet, route['interface'], "out"):
+                return False
             if route:
-                outgoing_interface = route['interface']
-                next_hop = route['next_hop']
-                
-                if not next_hop:
-                    print(f"No next hop for {dest_ip}, sending directly to interface {outgoing_interface}")
-                    for device, interface in self.port_table.items():
-                        if interface == outgoing_interface:
-                            if isinstance(device, EndDevice) and device.ip == dest_ip:
-                                frame = {
-                                    'source_mac': self.interfaces[outgoing_interface]['mac'],
-                                    'dest_mac': device.mac,
-                                    'type': 'IPv4',
-                                    'data': packet
-                                }
-                                return device.receive(frame, self, layer=2)
-                            elif isinstance(device, (Switch, Hub, Bridge)) and device.id not in visited:
-                                frame = {
-                                    'source_mac': self.interfaces[outgoing_interface]['mac'],
-                                    'dest_mac': "FF:FF:FF:FF:FF:FF",  
-                                    'type': 'IPv4',
-                                    'data': packet
-                                }
-                                visited_copy = visited.copy()
-                                return device.forward(frame, self, destination, layer=2, visited=visited_copy)
-                
-                else:
-                    next_hop_device = None
-                    next_hop_mac = None
-                    print(f"Next hop for {dest_ip} is {next_hop} via interface {outgoing_interface}")
-                    for device, interface in self.port_table.items():
-                        if interface == outgoing_interface:
-                            if isinstance(device, Router):
-                                for intf_name, intf_details in device.interfaces.items():
-                                    if intf_details['ip'] == next_hop:
-                                        next_hop_device = device
-                                        next_hop_mac = intf_details['mac']
-                                        break
-                                if next_hop_device:  
-                                    break
-                            elif isinstance(device, (Switch, Hub, Bridge)) and device.id not in visited:
-                                frame = {
-                                    'source_mac': self.interfaces[outgoing_interface]['mac'],
-                                    'dest_mac': "FF:FF:FF:FF:FF:FF",  # Will try ARP-like resolution
-                                    'type': 'IPv4',
-                                    'data': packet
-                                }
-                                next_hop_mac = device.get_mac_for_interface(next_hop)
-                                print(f"Next hop MAC for {next_hop} is {next_hop_mac}")
-                                if next_hop_mac:
-                                    frame['dest_mac'] = next_hop_mac
-                                
-                                visited_copy = visited.copy()
-                                return device.forward(frame, self, destination, layer=2, visited=visited_copy)
-                    
-                    if next_hop_device and next_hop_mac:
-                        frame = {
-                            'source_mac': self.interfaces[outgoing_interface]['mac'],
-                            'dest_mac': next_hop_mac,
-                            'type': 'IPv4',
-                            'data': packet
-                        }
-
-                        print(f"Sending frame to next hop device {next_hop_device.id} with MAC {next_hop_mac}")
-                        
-                        return next_hop_device.receive(frame, self, layer=2)
+                mtu = self.interfaces.get(route['interface'], {}).get('mtu', DEFAULT_MTU)
+                fragments = fragment(packet, mtu)
+                if not fragments:
+                    print(f"Router {self.id}: packet for {dest_ip} exceeds MTU {mtu} on {route['interface']} and DF is set")
+                    return False
+                if len(fragments) > 1:
+                    print(f"Router {self.id}: fragmenting packet for {dest_ip} into {len(fragments)} for MTU {mtu}")
+                    self.fragments_created += len(fragments)
+                return all([self._forward_on_route(f, route, destination, visited) for f in fragments])
             
             return False
             
         return False
     
+    def _acl_permits(self, packet, interface, direction):
+        acl = self.acls.get((interface, direction))
+        if acl is None or acl.permits(packet):
+            return True
+        print(f"Router {self.id}: {direction}bound ACL {acl.name} on {interface} denied {packet['source_ip']} -> {packet['dest_ip']}")
+        if self.counters is not None:
+            self.counters['acl_drops'] += 1
+        return False
+    
+    def _forward_on_route(self, packet, route, destination, visited):
+        queue = self.egress.get(route['interface'])
+        if queue is not None:
+            # Sent later on the queue's clock; True only means the packet was not dropped
+            return queue.enqueue(packet, self._send_on_route, packet, route, destination, visited)
+        return self._send_on_route(packet, route, destination, visited)
+    
+    def _send_on_route(self, packet, route, destination, visited):
+        dest_ip = packet['dest_ip']
+        outgoing_interface = route['interface']
+        next_hop = route['next_hop']
+        
+        if not next_hop:
+            print(f"No next hop for {dest_ip}, sending directly to interface {outgoing_interface}")
+            for device, interface in self.port_table.items():
+                if interface == outgoing_interface:
+                    if isinstance(device, EndDevice) and device.ip == dest_ip:
+                        frame = self._frame(self.interfaces[outgoing_interface]['mac'], device.mac, packet)
+                        return device.receive(frame, self, layer=2)
+                    elif isinstance(device, Router) and device.has_ip(dest_ip):
+                        frame = self._frame(self.interfaces[outgoing_interface]['mac'], device.get_mac_for_interface(dest_ip), packet)
+                        return device.receive(frame, self, layer=2)
+                    elif isinstance(device, (Switch, Hub, Bridge)) and device.id not in visited:
+                        frame = self._frame(self.interfaces[outgoing_interface]['mac'], "FF:FF:FF:FF:FF:FF", packet)
+                        visited_copy = visited.copy()
+                        result = device.forward(frame, self, destination, layer=2, visited=visited_copy)
+                        if not result and self.counters is not None:
+                            self.counters['arp_failures'] += 1
+                        return result
+        
+        else:
+            next_hop_device = None
+            next_hop_mac = None
+            print(f"Next hop for {dest_ip} is {next_hop} via interface {outgoing_interface}")
+            for device, interface in self.port_table.items():
+                if interface == outgoing_interface:
+                    if isinstance(device, Router):
+                        for intf_name, intf_details in device.interfaces.items():
+                            if intf_details['ip'] == next_hop:
+                                next_hop_device = device
+                                next_hop_mac = intf_details['mac']
+                                break
+                        if next_hop_device:  
+                            break
+                    elif isinstance(device, (Switch, Hub, Bridge)) and device.id not in visited:
+                        next_hop_mac = device.get_mac_for_interface(next_hop)
+                        print(f"Next hop MAC for {next_hop} is {next_hop_mac}")
+                        # Without a resolved MAC, broadcast (ARP-like resolution)
+                        frame = self._frame(self.interfaces[outgoing_interface]['mac'], next_hop_mac or "FF:FF:FF:FF:FF:FF", packet)
+                        
+                        visited_copy = visited.copy()
+                        result = device.forward(frame, self, destination, layer=2, visited=visited_copy)
+                        if not result and next_hop_mac is None and self.counters is not None:
+                            self.counters['arp_failures'] += 1
+                        return result
+            
+            if next_hop_device and next_hop_mac:
+                frame = self._frame(self.interfaces[outgoing_interface]['mac'], next_hop_mac, packet)
+
+                print(f"Sending frame to next hop device {next_hop_device.id} with MAC {next_hop_mac}")
+                
+                return next_hop_device.receive(frame, self, layer=2)
+        
+        if self.counters is not None:
+            self.counters['arp_failures'] += 1  # Nothing on the outgoing interface owns the address
+        return False
+    
     def receive(self, frame, source, layer=2):
-        if layer == 2 and isinstance(frame, dict) and 'type' in frame and frame['type'] == 'IPv4':
+        if self.taps:
+            self._tap(frame, source, layer)
+        if self.counters is not None:
+            self._count_frame(frame, source, layer)
+        if layer == 2 and isinstance(frame, Mapping) and 'type' in frame and frame['type'] == 'IPv4':
+            if not self._check_frame(frame):
+                return False
             packet = frame['data']
             dest_ip = packet['dest_ip']
             
+            if self.acls and not self._acl_permits(packet, self.port_table.get(source), "in"):
+                return False
+            
+            if self.dhcp:
+                server = self.dhcp.get(self.port_table.get(source))
+                if server is not None and server.receive(packet, source):
+                    return True
+            
+            if dest_ip == "255.255.255.255":
+                return False  # Limited broadcasts stay on their segment
+            
+            if self.nat is not None and dest_ip in self.nat.addresses:
+                translated = self.nat.inbound(packet)
+                if translated is not None:
+                    return self.forward(translated, source, layer=3)
+                if not self.has_ip(dest_ip):
+                    return False
+            
             for interface_name, interface in self.interfaces.items():
                 if packet['dest_ip'] == interface['ip']:
                     return True
@@ -704,17 +1054,320 @@ class Router(Entity):
         return False
 
 class TransportLayerSimulator:
-    def __init__(self):
-        self.connections = defaultdict(dict)  # (device_id, ip, port) 
+    """TCP and UDP carried hop by hop through the simulated devices.
+
+    Every segment is handed to EndDevice.send, so it crosses the same hubs,
+    switches and routers as any other packet. Timing comes from a virtual
+    clock: each direction of every link sends `link_rate` bytes/s from a
+    tail-drop buffer of `queue_limit` bytes, so flows crossing the same link
+    compete for it, plus `hop_delay` seconds per router hop. The links a
+    flow crosses are probed once per topology version, as traceroute does.
+    """
+    def __init__(self, clock=None, link_rate=1250000, hop_delay=0.005, queue_limit=16 * 1024, loss_rate=0.0, seed=None):
+        # Sockets and listeners live in each device's ConnectionTable
+        self.hosts = {}  # ip -> EndDevice
+        self.clock = clock or SimClock()
+        self.rng = random.Random(seed)
+        self.link_rate = link_rate
+        self.hop_delay = hop_delay
+        self.queue_limit = queue_limit
+        self.loss_rate = loss_rate
+        self._busy_until = {}  # (from_id, to_id) link -> time its queue drains
+        self._paths = {}  # (src, dst, dest_ip, protocol, ports) -> [(from_id, to_id) links], for _paths_version
+        self._paths_version = None
+        self._probing = False
+        self.nat_routers = {}  # Public address -> Router whose NAT table hands it out, found on first reply
+        self._departure = None
+        self.stats = {'segments': 0, 'bytes': 0, 'queue_drops': 0, 'random_drops': 0, 'path_failures': 0}
         
-    def get_ephemeral_port(self, device):
-        used_ports = set(port_num for port_num, port in device.ports.items())
-        while True:
-            port = random.randint(49152, 65535)
-            if port not in used_ports:
-                return port
+    def attach(self, device):
+        device.transport = self
+        self.hosts[device.ip] = device
+    
+    def get_ephemeral_port(self, device, protocol='tcp', remote_ip=None, remote_port=None):
+        port = device.connections.allocate_port(protocol, remote_ip, remote_port)
+        if port is None:
+            raise RuntimeError(f"{device.id} has no free ephemeral port towards {remote_ip}:{remote_port}")
+        return port
+        
+    def transmit(self, src, dst, segment, dscp=0, dest_ip=None):
+        """Send a segment from src to dst through the simulated network, marked with `dscp`.
+
+        `dest_ip` addresses a reply to a NAT router's public address, dst being that router.
+        """
+        size = segment_size(segment)
+        size += (fragment_count(size - IPV4_HEADER_SIZE, src.mtu) - 1) * IPV4_HEADER_SIZE  # Extra headers if the source fragments
+        links = self._links(src, dst, segment, dscp, dest_ip)
+        start = self.clock.now
+        starts = []
+        for link in links:
+            # Cut-through: the segment waits at each link for whatever is queued there ahead of it
+            free_at = max(start, self._busy_until.get(link, start))
+            if (free_at - start) * self.link_rate + size > self.queue_limit:
+                self.stats['queue_drops'] += 1
+                return False
+            start = free_at
+            starts.append(start)
+        if self.loss_rate and self.rng.random() < self.loss_rate:
+            self.stats['random_drops'] += 1
+            return False
+        
+        for link, begun in zip(links, starts):
+            self._busy_until[link] = begun + size / self.link_rate
+        self.stats['segments'] += 1
+        self.stats['bytes'] += size
+        
+        self._departure = start + size / self.link_rate
+        delivered = src.send(segment, dst, layer=3, dscp=dscp, dest_ip=dest_ip)
+        self._departure = None
+        if not delivered:
+            self.stats['path_failures'] += 1
+        return delivered
+    
+    def _links(self, src, dst, segment, dscp, dest_ip):
+        """The links a flow's segments cross, found by sending one as a probe"""
+        if self._paths_version != Entity.topology_version:
+            self._paths = {}
+            self._paths_version = Entity.topology_version
+        flow = (src, dst, dest_ip, segment['protocol'], segment['source_port'], segment['dest_port'])
+        links = self._paths.get(flow)
+        if links is not None:
+            return links
+        from core.traceroute import forwarding_links  # core.traceroute imports this module
+        entities = [src]
+        seen = {src}
+        for entity in entities:
+            for peer in entity.connected_to:
+                if peer not in seen:
+                    seen.add(peer)
+                    entities.append(peer)
+        self._probing = True
+        try:
+            crossed = forwarding_links(src, dst, entities, lambda: src.send(segment, dst, layer=3, dscp=dscp, dest_ip=dest_ip))
+        finally:
+            self._probing = False
+        links = self._paths[flow] = [(node.id, peer.id) for node, peer in crossed] or [(src.id, dst.id)]
+        return links
+    
+    def on_packet(self, device, packet):
+        """Called by EndDevice.receive for packets carrying a segment"""
+        if self._probing:
+            return
+        routers = DEFAULT_TTL - packet.get('ttl', DEFAULT_TTL)
+        departure = self._departure if self._departure is not None else self.clock.now
+        self.clock.schedule_at(departure + self.hop_delay * (routers + 1), self._demux, device, packet)
+    
+    def _demux(self, device, packet):
+        segment = packet['data']
+        local_port = segment['dest_port']
+        
+        table = device.connections
+        if segment['protocol'] == 'udp':
+            socket = table.listener('udp', local_port)
+            if socket:
+                socket(device, packet, segment)
+            else:
+                self._serve_datagram(device, packet, segment)
+            return
+        
+        connection = table.lookup('tcp', local_port, packet['source_ip'], segment['source_port'])
+        if connection:
+            connection.on_segment(segment)
+            return
+        
+        remote = self._remote(device, packet['source_ip'])
+        flags = segment['flags']
+        if remote is None or "R" in flags:
+            return
+        reply_ip = None if isinstance(remote, EndDevice) else packet['source_ip']
+        
+        service = device.ports.get(local_port)
+        on_accept = table.listener('tcp', local_port)
+        if "S" in flags and "A" not in flags and (on_accept or (service and service['protocol'] == 'tcp')):
+            connection = TcpConnection(self, device, local_port, remote, segment['source_port'], remote_ip=reply_ip)
+            table.add(connection.key, connection)
+            if on_accept:
+                on_accept(connection)
+            else:
+                self._serve(connection, service)
+            connection.accept(segment)
+            return
+        
+        # Nothing listening: refuse with a reset
+        ack = segment['seq'] + len(segment['payload']) + (1 if "S" in flags else 0)
+        self.transmit(device, remote, tcp_segment(local_port, segment['source_port'], segment.get('ack', 0), ack, "RA", 0),
+                      dest_ip=reply_ip)
+    
+    def _remote(self, device, source_ip):
+        """Who a packet to device came from: the host with that address, or the router whose NAT handed it out.
+
+        Replies to a NAT router go to its public address and port, which its
+        table translates back to the inside host. The router is searched for
+        in device's own network, so simulators in other sessions never see it.
+        """
+        remote = self.hosts.get(source_ip)
+        if remote is not None:
+            return remote
+        router = self.nat_routers.get(source_ip)
+        if router is not None and router.nat is not None and source_ip in router.nat.addresses:
+            return router
+        seen = {device}
+        queue = [device]
+        for entity in queue:
+            if isinstance(entity, Router) and entity.nat is not None and source_ip in entity.nat.addresses:
+                self.nat_routers[source_ip] = entity
+                return entity
+            for peer in entity.connected_to:
+                if peer not in seen:
+                    seen.add(peer)
+                    queue.append(peer)
+        return None
+    
+    def _serve(self, connection, service):
+        """Run a port's service handler on the request and reply once"""
+        request = bytearray()
+        
+        def on_data(conn, chunk):
+            if conn.close_requested:
+                return
+            request.extend(chunk)
+            response = service['handler'](request.decode('utf-8', 'replace')) if service['handler'] else None
+            if response is not None:
+                conn.send(response)
+                conn.close()
         
+        connection.on_data = on_data
+        connection.on_peer_close = lambda conn: conn.close()
+    
+    def _serve_datagram(self, device, packet, datagram):
+        service = device.ports.get(datagram['dest_port'])
+        remote = self._remote(device, packet['source_ip'])
+        if not service or service['protocol'] != 'udp' or remote is None:
+            return
+        if service['handler']:
+            response = service['handler'](datagram['payload'].decode('utf-8', 'replace'))
+            if response is not None:
+                self.transmit(device, remote, udp_datagram(datagram['dest_port'], datagram['source_port'], to_bytes(response)),
+                              dest_ip=None if isinstance(remote, EndDevice) else packet['source_ip'])
+    
+    def listen(self, device, port, on_accept):
+        self.attach(device)
+        device.connections.listen('tcp', port, on_accept)
+    
+    def unlisten(self, device, port):
+        device.connections.unlisten('tcp', port)
+    
+    def connect(self, source, dest, dest_port, **options):
+        self.attach(source)
+        self.attach(dest)
+        port = self.get_ephemeral_port(source, 'tcp', dest.ip, dest_port)
+        connection = TcpConnection(self, source, port, dest, dest_port, **options)
+        connection.ephemeral = True
+        source.connections.add(connection.key, connection)
+        connection.open()
+        return connection
+    
+    def release(self, connection):
+        table = connection.device.connections
+        if table.remove(connection.key, connection) and connection.ephemeral:
+            table.release_port(connection.local_port)
+    
+    def tcp_request(self, source, dest, dest_port, data, timeout=120.0):
+        """Open a connection, send `data`, collect the reply and close"""
+        response = bytearray()
+        connection = self.connect(source, dest, dest_port)
+        connection.on_data = lambda conn, chunk: response.extend(chunk)
+        connection.on_peer_close = lambda conn: conn.close()
+        connection.send(data)
+        connection.close()
+        self.clock.run(until=self.clock.now + timeout)
+        
+        result = connection.summary()
+        result['source_port'] = connection.local_port
+        result['response'] = response.decode('utf-8', 'replace')
+        result['delivered'] = connection.stats['bytes_acked'] >= len(to_bytes(data)) and not result['refused']
+        result['cwnd_trace'] = connection.cwnd_trace
+        return result
+    
+    def udp_request(self, source, dest, dest_port, data, timeout=5.0):
+        """Send one datagram and wait for at most one reply"""
+        self.attach(source)
+        self.attach(dest)
+        port = self.get_ephemeral_port(source, 'udp', dest.ip, dest_port)
+        replies = []
+        source.connections.listen('udp', port, lambda device, packet, datagram: replies.append(datagram['payload']))
+        started = self.clock.now
+        delivered = self.transmit(source, dest, udp_datagram(port, dest_port, to_bytes(data)))
+        self.clock.run(until=self.clock.now + timeout)
+        source.connections.unlisten('udp', port)
+        source.connections.release_port(port)
+        return {
+            'source_port': port,
+            'delivered': delivered,
+            'refused': delivered and dest_port not in dest.ports,
+            'response': replies[0].decode('utf-8', 'replace') if replies else "",
+            'duration': self.clock.now - started
+        }
+    
+    def bulk_transfer(self, source, dest, nbytes, dest_port=5001, timeout=600.0, **options):
+        """Push `nbytes` over one TCP connection into a sink; for goodput and cwnd studies"""
+        received = [0]
+        
+        def on_accept(conn):
+            conn.on_data = lambda c, chunk: received.__setitem__(0, received[0] + len(chunk))
+            conn.on_peer_close = lambda c: c.close()
+        
+        self.listen(dest, dest_port, on_accept)
+        connection = self.connect(source, dest, dest_port, **options)
+        connection.send(bytes(nbytes))
+        connection.close()
+        self.clock.run(until=self.clock.now + timeout)
+        self.unlisten(dest, dest_port)
+        
+        result = connection.summary()
+        result['received'] = received[0]
+        result['cwnd_trace'] = connection.cwnd_trace
+        result['network'] = dict(self.stats)
+        return result
+    
+    def stream_transfer(self, source, dest, chunks, dest_port, on_chunk, timeout=3600.0, buffer_limit=256 * 1024):
+        """Send an iterable of byte chunks over one TCP connection.
 
+        The send buffer is refilled only as ACKs free space, so at most
+        `buffer_limit` bytes of the stream are held at any time. The receiver
+        hands each in-order chunk to `on_chunk`.
+        """
+        chunks = iter(chunks)
+        sent = [0]
+        
+        def on_accept(conn):
+            conn.on_data = lambda c, chunk: on_chunk(chunk)
+            conn.on_peer_close = lambda c: c.close()
+        
+        def refill(conn):
+            while len(conn.send_buffer) < buffer_limit:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    conn.on_writable = None
+                    conn.close()
+                    return
+                sent[0] += len(chunk)
+                conn.send(chunk)
+        
+        self.listen(dest, dest_port, on_accept)
+        connection = self.connect(source, dest, dest_port)
+        connection.trace_limit = 2000
+        connection.on_writable = refill
+        refill(connection)
+        self.clock.run(until=self.clock.now + timeout)
+        self.unlisten(dest, dest_port)
+        
+        result = connection.summary()
+        result['source_port'] = connection.local_port
+        result['sent'] = sent[0]
+        result['cwnd_trace'] = connection.cwnd_trace
+        return result
+    
     def log_message(self, src, dest, data, src_port=None, dest_port=None, protocol=None):
         msg = {
             "timestamp": time.strftime("%H:%M:%S"),
@@ -729,6 +1382,7 @@ class TransportLayerSimulator:
         
         src.received_data.append(msg)
         dest.received_data.append(msg)
+        Entity.touch_state()
         
         st.session_state.messages.append(msg)
 
@@ -740,14 +1394,9 @@ def http_handler(request):
                 "<html><body><h1>Hello Tawheed!</h1></body></html>")
     return None
 
-def dns_handler(query):
-    dns_records = {
-        "example.com": "192.168.1.100",
-        "test.com": "192.168.1.101"
-    }
-    if query in dns_records:
-        return f"DNS Response: {query} -> {dns_records[query]}"
-    return f"DNS Response: NXDOMAIN (No record for {query})"
+# Default DNS service; the zone is loaded and indexed once, not per query.
+# Any DnsServer (or callable taking the query) can be passed to assign_port instead.
+dns_handler = DnsServer(DnsZone.from_file(DEFAULT_ZONE_FILE))
 
 def ftp_handler(command, uploaded_file=None):
     if command.startswith("LIST"):
@@ -757,14 +1406,14 @@ def ftp_handler(command, uploaded_file=None):
             return f"Opening data connection\n{file_list}\nTransfer complete"
         except Exception as e:
             return "Failed to list"
+    elif command.startswith("STOR"):
+        filename = command[4:].strip() or "upload"
+        return f"150 Opening BINARY mode data connection for {filename}"
     elif command.startswith("PUT"):
         if uploaded_file is not None:
             try:
-                content = uploaded_file.read()
-                if isinstance(content, bytes):
-                    content = content.decode('utf-8')
-                first_line = content.split('\n')[0] if content else "Empty file"
-                print(f"First line of file recieved: {first_line}")
+                size = sum(len(chunk) for chunk in iter_chunks(uploaded_file))
+                print(f"File received: {size} bytes")
             except Exception as e:
                 print(f"Error reading file: {e}")
             return f"File {uploaded_file} received successfully\nTransfer complete"
@@ -0,0 +1,538 @@
+import random
+import socket
+import struct
+from core.clock import SimClock
+from core.devices import Entity, EndDevice, Router, Switch, Hub, Bridge
+from core.transport import udp_datagram
+
+SERVER_PORT = 67
+CLIENT_PORT = 68
+BROADCAST_IP = "255.255.255.255"
+BROADCAST_MAC = "FF:FF:FF:FF:FF:FF"
+UNASSIGNED_IP = "0.0.0.0"
+DEFAULT_LEASE = 86400.0
+RETRANSMIT = (4.0, 64.0)  # RFC 2131 4.1: first retransmission after 4 s, doubling up to 64 s
+
+DISCOVER, OFFER, REQUEST, DECLINE, ACK, NAK, RELEASE = 1, 2, 3, 4, 5, 6, 7
+MESSAGE_NAMES = {DISCOVER: "DISCOVER", OFFER: "OFFER", REQUEST: "REQUEST", DECLINE: "DECLINE", ACK: "ACK", NAK: "NAK", RELEASE: "RELEASE"}
+
+# BOOTP header (RFC 2131 section 2): op htype hlen hops xid secs flags ciaddr yiaddr siaddr giaddr chaddr sname file
+_BOOTP = struct.Struct("!BBBBIHH4s4s4s4s16s64s128s")
+_MAGIC = b"\x63\x82\x53\x63"
+OPT_MASK, OPT_ROUTER, OPT_REQUESTED, OPT_LEASE, OPT_TYPE, OPT_SERVER, OPT_T1, OPT_T2, OPT_END = 1, 3, 50, 51, 53, 54, 58, 59, 255
+
+
+def _ip_int(ip):
+    return int.from_bytes(socket.inet_aton(ip), 'big')
+
+
+def _int_ip(value):
+    return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+
+def encode_message(message):
+    """DHCP message dict -> BOOTP bytes with options"""
+    chaddr = bytes.fromhex(message['chaddr'].replace(":", ""))
+    raw = bytearray(_BOOTP.pack(1 if message['type'] in (DISCOVER, REQUEST, DECLINE, RELEASE) else 2, 1, 6, 0,
+                                message['xid'], 0, 0x8000 if message.get('broadcast') else 0,
+                                socket.inet_aton(message.get('ciaddr', UNASSIGNED_IP)),
+                                socket.inet_aton(message.get('yiaddr', UNASSIGNED_IP)),
+                                socket.inet_aton(UNASSIGNED_IP), socket.inet_aton(UNASSIGNED_IP),
+                                chaddr, b"", b""))
+    raw += _MAGIC
+    raw += bytes((OPT_TYPE, 1, message['type']))
+    for option, key in ((OPT_REQUESTED, 'requested'), (OPT_SERVER, 'server'), (OPT_MASK, 'mask'), (OPT_ROUTER, 'router')):
+        if message.get(key):
+            raw += bytes((option, 4)) + socket.inet_aton(message[key])
+    for option, key in ((OPT_LEASE, 'lease'), (OPT_T1, 't1'), (OPT_T2, 't2')):
+        if message.get(key) is not None:
+            raw += bytes((option, 4)) + int(message[key]).to_bytes(4, 'big')
+    raw.append(OPT_END)
+    return bytes(raw)
+
+
+def decode_message(raw):
+    """BOOTP bytes -> DHCP message dict, or None if it is not a DHCP message"""
+    if len(raw) < _BOOTP.size + len(_MAGIC) or raw[_BOOTP.size:_BOOTP.size + 4] != _MAGIC:
+        return None
+    op, _, hlen, _, xid, _, flags, ciaddr, yiaddr, _, _, chaddr, _, _ = _BOOTP.unpack_from(raw)
+    message = {'xid': xid, 'broadcast': bool(flags & 0x8000), 'ciaddr': socket.inet_ntoa(ciaddr),
+               'yiaddr': socket.inet_ntoa(yiaddr), 'chaddr': ":".join(f"{b:02X}" for b in chaddr[:hlen])}
+    offset = _BOOTP.size + 4
+    while offset < len(raw) and raw[offset] != OPT_END:
+        option = raw[offset]
+        if option == 0:  # Pad
+            offset += 1
+            continue
+        length = raw[offset + 1]
+        value = raw[offset + 2:offset + 2 + length]
+        if option == OPT_TYPE:
+            message['type'] = value[0]
+        elif option in (OPT_REQUESTED, OPT_SERVER, OPT_MASK, OPT_ROUTER):
+            message[{OPT_REQUESTED: 'requested', OPT_SERVER: 'server', OPT_MASK: 'mask', OPT_ROUTER: 'router'}[option]] = socket.inet_ntoa(value)
+        elif option in (OPT_LEASE, OPT_T1, OPT_T2):
+            message[{OPT_LEASE: 'lease', OPT_T1: 't1', OPT_T2: 't2'}[option]] = int.from_bytes(value, 'big')
+        offset += 2 + length
+    return message if 'type' in message else None
+
+
+def dhcp_message(packet, port):
+    """The decoded DHCP message of a UDP packet to `port`, else None"""
+    segment = packet.get('data')
+    if not isinstance(segment, dict) or segment.get('protocol') != 'udp' or segment.get('dest_port') != port:
+        return None
+    return decode_message(segment['payload'])
+
+
+def _packet(source_ip, dest_ip, source_port, dest_port, message):
+    return {'source_ip': source_ip, 'dest_ip': dest_ip, 'ttl': 64,
+            'data': udp_datagram(source_port, dest_port, encode_message(message))}
+
+
+def _flood(sender, frame, toward):
+    """Hand a frame to every neighbour in `toward`, as a broadcast on that link"""
+    delivered = False
+    for entity in toward:
+        if isinstance(entity, (Switch, Hub, Bridge)):
+            delivered = entity.forward(frame, sender, None, layer=2, visited={sender.id}) or delivered
+        elif isinstance(entity, (EndDevice, Router)):
+            delivered = entity.receive(frame, sender, layer=2) or delivered
+    return delivered
+
+
+class AddressPool:
+    """Free/used bitmap over one subnet's host addresses, one byte per address"""
+
+    def __init__(self, network, subnet_mask, first=None, last=None, excluded=()):
+        self.base = _ip_int(network) & _ip_int(subnet_mask)
+        size = (~_ip_int(subnet_mask) & 0xFFFFFFFF) + 1
+        self.first = _ip_int(first) - self.base if first else 1
+        self.last = _ip_int(last) - self.base if last else size - 2  # Skip the broadcast address
+        self.used = bytearray(size)
+        self.used[:self.first] = b"\x01" * self.first
+        self.used[self.last + 1:] = b"\x01" * (size - self.last - 1)
+        self.free = self.last - self.first + 1
+        for ip in excluded:
+            self.reserve(ip)
+        self.cursor = self.first
+
+    def contains(self, ip):
+        return 0 <= _ip_int(ip) - self.base < len(self.used)
+
+    def reserve(self, ip):
+        """Mark a specific address used; False if taken or outside the pool"""
+        index = _ip_int(ip) - self.base
+        if not self.first <= index <= self.last or self.used[index]:
+            return False
+        self.used[index] = 1
+        self.free -= 1
+        return True
+
+    def allocate(self):
+        """Next free address after the last one handed out, wrapping around; None when full"""
+        index = self.used.find(0, self.cursor)
+        if index < 0:
+            index = self.used.find(0, self.first)
+        if index < 0:
+            return None
+        self.used[index] = 1
+        self.free -= 1
+        self.cursor = index + 1
+        return _int_ip(self.base + index)
+
+    def release(self, ip):
+        index = _ip_int(ip) - self.base
+        if 0 <= index < len(self.used) and self.used[index] and self.first <= index <= self.last:
+            self.used[index] = 0
+            self.free += 1
+
+
+class DhcpServer:
+    """DHCP service on one Router interface.
+
+    Hands out addresses from the interface's subnet (or first..last) with
+    the interface as default gateway. Leases are keyed by client MAC, so
+    a returning client gets its old address back while it is still free.
+    Expired leases are reclaimed when the pool runs dry.
+    """
+
+    def __init__(self, router, interface, clock=None, lease_time=DEFAULT_LEASE, first=None, last=None):
+        details = router.interfaces[interface]
+        self.router = router
+        self.interface = interface
+        self.clock = clock or SimClock()
+        self.lease_time = lease_time
+        self.address = details['ip']
+        self.subnet_mask = details['subnet_mask']
+        self.pool = AddressPool(router._get_network(details['ip'], details['subnet_mask']), details['subnet_mask'],
+                                first, last, excluded=[details['ip']])
+        self.leases = {}  # client MAC -> {'ip', 'expires', 'state': "offered" or "bound"}
+        self.stats = {'discovers': 0, 'offers': 0, 'requests': 0, 'acks': 0, 'naks': 0, 'releases': 0, 'declines': 0,
+                      'exhausted': 0, 'reclaimed': 0}
+
+    def _reclaim(self):
+        now = self.clock.now
+        for mac, lease in list(self.leases.items()):
+            if lease['expires'] <= now:
+                del self.leases[mac]
+                self.pool.release(lease['ip'])
+                self.stats['reclaimed'] += 1
+
+    def _address_for(self, mac, requested=None):
+        lease = self.leases.get(mac)
+        if lease is not None:
+            return lease['ip']
+        if requested and self.pool.reserve(requested):
+            return requested
+        ip = self.pool.allocate()
+        if ip is None:
+            self._reclaim()
+            ip = self.pool.allocate()
+        return ip
+
+    def _reply(self, message, kind, ip=None):
+        reply = {'type': kind, 'xid': message['xid'], 'chaddr': message['chaddr'], 'server': self.address,
+                 'broadcast': message.get('broadcast')}
+        if kind != NAK:
+            reply.update(yiaddr=ip, mask=self.subnet_mask, router=self.address, lease=self.lease_time,
+                         t1=self.lease_time * 0.5, t2=self.lease_time * 0.875)
+        return reply
+
+    def handle(self, message):
+        """Server side of one client message; returns the reply message or None"""
+        kind = message['type']
+        mac = message['chaddr']
+        now = self.clock.now
+        if kind == DISCOVER:
+            self.stats['discovers'] += 1
+            ip = self._address_for(mac, message.get('requested'))
+            if ip is None:
+                self.stats['exhausted'] += 1
+                print(f"DHCP {self.router.id} {self.interface}: pool exhausted, no offer for {mac}")
+                return None
+            lease = self.leases.get(mac)
+            if lease is None or lease['state'] != "bound":
+                self.leases[mac] = {'ip': ip, 'expires': now + RETRANSMIT[1], 'state': "offered"}
+            self.stats['offers'] += 1
+            return self._reply(message, OFFER, ip)
+
+        if kind == REQUEST:
+            self.stats['requests'] += 1
+            if message.get('server') not in (None, self.address):
+                # The client took another server's offer
+                lease = self.leases.get(mac)
+                if lease is not None and lease['state'] == "offered":
+                    del self.leases[mac]
+                    self.pool.release(lease['ip'])
+                return None
+            wanted = message.get('requested') or message.get('ciaddr')
+            lease = self.leases.get(mac)
+            if lease is None and wanted and self.pool.contains(wanted) and self.pool.reserve(wanted):
+                lease = self.leases[mac] = {'ip': wanted, 'expires': now, 'state': "offered"}  # Rebinding after a server restart
+            if lease is None or lease['ip'] != wanted:
+                self.stats['naks'] += 1
+                return self._reply(message, NAK)
+            lease['state'] = "bound"
+            lease['expires'] = now + self.lease_time
+            self.stats['acks'] += 1
+            Entity.touch_state()
+            return self._reply(message, ACK, lease['ip'])
+
+        if kind in (RELEASE, DECLINE):
+            self.stats['releases' if kind == RELEASE else 'declines'] += 1
+            lease = self.leases.pop(mac, None)
+            if lease is not None and kind == RELEASE:
+                self.pool.release(lease['ip'])  # A declined address stays marked used: someone else has it
+            Entity.touch_state()
+        return None
+
+    def receive(self, packet, source):
+        """Router hook for UDP packets to port 67 arriving on this interface"""
+        message = dhcp_message(packet, SERVER_PORT)
+        if message is None:
+            return False
+        reply = self.handle(message)
+        if reply is not None:
+            self.send(reply, source)
+        return True
+
+    def send(self, reply, toward):
+        """Send a reply back down the link the request came in on"""
+        dest_ip = BROADCAST_IP if reply.get('broadcast') or reply['type'] == NAK else reply['yiaddr']
+        packet = _packet(self.address, dest_ip, SERVER_PORT, CLIENT_PORT, reply)
+        frame = self.router._frame(self.router.interfaces[self.interface]['mac'], reply['chaddr'], packet)
+        return _flood(self.router, frame, [toward])
+
+    def report(self):
+        now = self.clock.now
+        return [{'mac': mac, 'ip': lease['ip'], 'state': lease['state'], 'expires_in': lease['expires'] - now}
+                for mac, lease in self.leases.items()]
+
+
+class DhcpClient:
+    """RFC 2131 client state machine for one EndDevice.
+
+    INIT -> SELECTING (DISCOVER sent) -> REQUESTING (OFFER taken) -> BOUND,
+    then RENEWING at T1 (unicast REQUEST to the server), REBINDING at T2
+    (broadcast REQUEST) and back to INIT when the lease runs out. Messages
+    are broadcast over the device's links, or handed straight to `server`
+    when one is given (bulk addressing, see address_hosts).
+    """
+
+    def __init__(self, device, clock=None, server=None, seed=None):
+        self.device = device
+        self.clock = clock or SimClock()
+        self.server = server
+        self.rng = random.Random(seed if seed is not None else device.mac)
+        self.state = "INIT"
+        self.xid = None
+        self.offer = None
+        self.lease = None  # {'ip', 'mask', 'router', 'server', 'obtained', 'lease', 't1', 't2'}
+        self.timer = None
+        self.retransmit = RETRANSMIT[0]
+        self.stats = {'sent': 0, 'received': 0, 'retransmissions': 0, 'renewals': 0, 'rebinds': 0, 'expired': 0, 'naks': 0}
+
+    def _message(self, kind, **fields):
+        return dict(fields, type=kind, xid=self.xid, chaddr=self.device.mac, broadcast=self.device.ip == UNASSIGNED_IP)
+
+    def _send(self, message, unicast_to=None):
+        self.stats['sent'] += 1
+        source_ip = self.device.ip
+        if self.server is not None:
+            reply = self.server.handle(message)
+            if reply is not None:
+                self.handle(reply)
+            return True
+        packet = _packet(source_ip, unicast_to or BROADCAST_IP, CLIENT_PORT, SERVER_PORT, message)
+        frame = self.device._frame(self.device.mac, BROADCAST_MAC, packet)
+        return _flood(self.device, frame, self.device.connected_to)
+
+    def _schedule(self, delay, callback):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.clock.schedule(delay, callback)
+
+    def start(self):
+        """Begin (or restart) acquiring an address"""
+        self.state = "SELECTING"
+        self.xid = self.rng.getrandbits(32)
+        self.offer = None
+        self.retransmit = RETRANSMIT[0]
+        self._discover()
+
+    def _discover(self):
+        if self.state != "SELECTING":
+            return
+        if self.timer is not None:
+            self.stats['retransmissions'] += 1
+        self._schedule(self._backoff(), self._discover)
+        requested = self.lease['ip'] if self.lease else None
+        self._send(self._message(DISCOVER, requested=requested))
+
+    def _backoff(self):
+        delay = self.retransmit + self.rng.uniform(-1, 1)  # RFC 2131 4.1 randomizes by +-1 s
+        self.retransmit = min(self.retransmit * 2, RETRANSMIT[1])
+        return delay
+
+    def handle(self, message):
+        """Client side of one server message"""
+        if message.get('xid') != self.xid or message.get('chaddr') != self.device.mac:
+            return False
+        self.stats['received'] += 1
+        kind = message['type']
+        if kind == OFFER and self.state == "SELECTING":
+            self.offer = message
+            self.state = "REQUESTING"
+            self.retransmit = RETRANSMIT[0]
+            self._request()
+        elif kind == ACK and self.state in ("REQUESTING", "RENEWING", "REBINDING"):
+            self._bind(message)
+        elif kind == NAK and self.state in ("REQUESTING", "RENEWING", "REBINDING"):
+            self.stats['naks'] += 1
+            self._unbind()
+            self.start()
+        return True
+
+    def receive(self, packet):
+        """EndDevice hook: True if the packet was a DHCP reply for this client"""
+        message = dhcp_message(packet, CLIENT_PORT)
+        return message is not None and self.handle(message)
+
+    def _request(self):
+        if self.state != "REQUESTING":
+            return
+        self._schedule(self._backoff(), self._request)
+        self._send(self._message(REQUEST, requested=self.offer['yiaddr'], server=self.offer['server']))
+
+    def _bind(self, ack):
+        now = self.clock.now
+        self.lease = {'ip': ack['yiaddr'], 'mask': ack.get('mask', "255.255.255.0"), 'router': ack.get('router'),
+                      'server': ack['server'], 'obtained': now, 'lease': ack.get('lease', DEFAULT_LEASE),
+                      't1': ack.get('t1'), 't2': ack.get('t2')}
+        self.lease['t1'] = self.lease['t1'] or self.lease['lease'] * 0.5
+        self.lease['t2'] = self.lease['t2'] or self.lease['lease'] * 0.875
+        device = self.device
+        changed = device.ip != self.lease['ip'] or device.subnet_mask != self.lease['mask']
+        device.ip = self.lease['ip']
+        device.subnet_mask = self.lease['mask']
+        if self.lease['router'] and device.default_gateway != self.lease['router']:
+            device.set_gateway(self.lease['router'])
+        elif changed:
+            Entity.touch_topology(device)
+        if device.transport is not None:
+            device.transport.attach(device)
+        self.state = "BOUND"
+        print(f"DHCP {device.id}: bound to {device.ip}/{device.subnet_mask} for {self.lease['lease']:.0f} s")
+        self._schedule(self.lease['t1'], self._renew)
+
+    def _retry(self, deadline, again, then):
+        """RFC 2131 4.4.5: retry at half the time left to `deadline`, at least 60 s apart"""
+        remaining = deadline - self.clock.now
+        if remaining > 60.0:
+            self._schedule(max(remaining / 2, 60.0), again)
+        else:
+            self._schedule(remaining, then)
+
+    def _renew(self):
+        self.state = "RENEWING"
+        self.stats['renewals'] += 1
+        self.xid = self.rng.getrandbits(32)
+        self._retry(self.lease['obtained'] + self.lease['t2'], self._renew, self._rebind)
+        self._send(self._message(REQUEST, ciaddr=self.device.ip), unicast_to=self.lease['server'])
+
+    def _rebind(self):
+        self.state = "REBINDING"
+        self.stats['rebinds'] += 1
+        self._retry(self.lease['obtained'] + self.lease['lease'], self._rebind, self._expire)
+        self._send(self._message(REQUEST, ciaddr=self.device.ip))
+
+    def _expire(self):
+        self.stats['expired'] += 1
+        print(f"DHCP {self.device.id}: lease on {self.device.ip} expired")
+        self._unbind()
+        self.start()
+
+    def _unbind(self):
+        self.lease = None
+        if self.device.ip != UNASSIGNED_IP:
+            self.device.ip = UNASSIGNED_IP
+            Entity.touch_topology(self.device)
+
+    def release(self):
+        """Give the address back and stop"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.lease is not None:
+            self.xid = self.rng.getrandbits(32)
+            self._send(self._message(RELEASE, ciaddr=self.device.ip, server=self.lease['server']), unicast_to=self.lease['server'])
+        self._unbind()
+        self.state = "INIT"
+
+
+def enable_dhcp(router, interface, clock=None, **options):
+    server = DhcpServer(router, interface, clock, **options)
+    router.dhcp[interface] = server
+    Entity.touch_state()
+    return server
+
+
+def disable_dhcp(router, interface):
+    removed = router.dhcp.pop(interface, None) is not None
+    Entity.touch_state()
+    return removed
+
+
+def client_for(device, clock=None, server=None):
+    """The device's DHCP client, created on first use"""
+    client = device.dhcp
+    if client is None:
+        client = device.dhcp = DhcpClient(device, clock)
+    if clock is not None:
+        client.clock = clock
+    client.server = server
+    return client
+
+
+def segment_servers(devices):
+    """{device: DhcpServer} for every device sharing an L2 segment with a router running DHCP.
+
+    One walk per segment, so the whole map costs O(devices + links).
+    """
+    result = {}
+    seen = set()
+    for device in devices:
+        if device in seen:
+            continue
+        segment = {device}
+        stack = [device]
+        server = None
+        while stack:
+            entity = stack.pop()
+            for peer in entity.connected_to:
+                if isinstance(peer, Router):
+                    interface = peer.port_table.get(entity)
+                    server = server or peer.dhcp.get(interface)
+                elif peer not in segment and isinstance(peer, (Switch, Hub, Bridge, EndDevice)):
+                    segment.add(peer)
+                    if not isinstance(peer, EndDevice):
+                        stack.append(peer)
+        seen |= segment
+        if server is not None:
+            for member in segment:
+                if isinstance(member, EndDevice):
+                    result[member] = server
+    return result
+
+
+def address_hosts(devices, clock=None):
+    """Lease an address to every device whose segment has a DHCP server, in one pass.
+
+    Each client runs the full DISCOVER/OFFER/REQUEST/ACK exchange, but the
+    messages go straight to its segment's server instead of being flooded
+    to every host on the segment, which would make N clients cost O(N^2).
+    Returns {'bound', 'failed'} device lists.
+    """
+    servers = segment_servers(devices)
+    bound, failed = [], []
+    for device in devices:
+        server = servers.get(device)
+        if server is None:
+            failed.append(device)
+            continue
+        client = client_for(device, clock or server.clock, server)
+        client.start()
+        client.server = None  # Renewals and rebinds go over the links again
+        (bound if client.state == "BOUND" else failed).append(device)
+    return {'bound': bound, 'failed': failed}
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import time
+
+    # Bulk addressing: one router, switches of 250 hosts each, a /16 pool
+    for hosts in (1000, 5000, 20000):
+        clock = SimClock()
+        router = Router("Gateway")
+        router.add_interface("fa0/0", "10.0.0.1", "02:00:00:00:00:01", "255.255.0.0")
+        devices = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for s in range(-(-hosts // 250)):
+                switch = Switch(f"Access{s}")
+                router.connect(switch, "fa0/0")
+                switch.port_table[router] = len(switch.port_table)
+                switch.set_port_vlan(router, 1)
+                for i in range(min(250, hosts - s * 250)):
+                    n = s * 250 + i
+                    device = EndDevice(f"H{n}", f"02:01:00:{n >> 16 & 255:02X}:{n >> 8 & 255:02X}:{n & 255:02X}", UNASSIGNED_IP)
+                    switch.connect(device)
+                    devices.append(device)
+            server = enable_dhcp(router, "fa0/0", clock)
+            start = time.perf_counter()
+            result = address_hosts(devices, clock)
+            elapsed = time.perf_counter() - start
+        unique = len({device.ip for device in result['bound']})
+        print(f"{hosts:>6} hosts: {len(result['bound'])} bound ({unique} unique addresses) in {elapsed * 1000:.0f} ms, "
+              f"{elapsed / hosts * 1e6:.1f} us per host, pool free {server.pool.free}")
@@ -0,0 +1,250 @@
+import os
+import re
+
+DEFAULT_TTL = 300
+DEFAULT_NEGATIVE_TTL = 60
+MAX_CNAME_CHAIN = 8
+DEFAULT_ZONE_FILE = os.path.join(os.path.dirname(__file__), "zones", "default.zone")
+
+_RESPONSE = re.compile(r"^DNS Response: (?P<body>.*?)(?: \(TTL (?P<ttl>\d+)\))?$")
+
+
+def _normalize(name):
+    return name.strip().rstrip('.').lower()
+
+
+class DnsZone:
+    """Records indexed by owner name: name -> {type: (ttl, [values])}"""
+
+    def __init__(self, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.records = {}
+        self.negative_ttl = negative_ttl
+
+    def add(self, name, rtype, value, ttl=DEFAULT_TTL):
+        rtype = rtype.upper()
+        if rtype not in ("A", "CNAME"):
+            return False
+        entry = self.records.setdefault(_normalize(name), {})
+        if rtype == "CNAME":
+            entry["CNAME"] = (ttl, [_normalize(value)])  # Only one CNAME per name
+        else:
+            old_ttl, values = entry.get("A", (ttl, []))
+            if value not in values:
+                values.append(value)
+            entry["A"] = (min(old_ttl, ttl), values)
+        return True
+
+    def get(self, name, rtype):
+        return self.records.get(_normalize(name), {}).get(rtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def from_records(cls, records, ttl=DEFAULT_TTL):
+        """Build a zone from a plain {name: ip} dict"""
+        zone = cls()
+        for name, ip in records.items():
+            zone.add(name, "A", ip, ttl)
+        return zone
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls.parse(f.read())
+
+    @classmethod
+    def parse(cls, text):
+        """Parse a master-file style zone (RFC 1035 subset).
+
+        Supports $ORIGIN, $TTL, '@', relative names, blank owner continuation,
+        ';' comments, parenthesised SOA records (the minimum field sets the
+        negative TTL) and A/CNAME records. Other record types are skipped.
+        """
+        zone = cls()
+        origin = ""
+        default_ttl = DEFAULT_TTL
+        last_name = None
+
+        def absolute(name):
+            if name == "@":
+                return origin
+            if name.endswith(".") or not origin:
+                return name.rstrip(".")
+            return f"{name}.{origin}"
+
+        lines = []
+        pending = None
+        for raw in text.splitlines():
+            line = raw.split(";", 1)[0].rstrip()
+            if pending is not None:
+                pending += " " + line.strip()
+                if ")" in line:
+                    lines.append(pending.replace("(", " ").replace(")", " "))
+                    pending = None
+                continue
+            if "(" in line and ")" not in line:
+                pending = line
+                continue
+            if line.strip():
+                lines.append(line.replace("(", " ").replace(")", " "))
+
+        for line in lines:
+            fields = line.split()
+            if fields[0].upper() == "$ORIGIN":
+                origin = fields[1].rstrip(".")
+                continue
+            if fields[0].upper() == "$TTL":
+                default_ttl = int(fields[1])
+                continue
+
+            if line[0].isspace():
+                name = last_name
+            else:
+                name = absolute(fields.pop(0))
+                last_name = name
+            if name is None or not fields:
+                continue
+
+            ttl = default_ttl
+            while fields and (fields[0].isdigit() or fields[0].upper() in ("IN", "CH", "HS")):
+                token = fields.pop(0)
+                if token.isdigit():
+                    ttl = int(token)
+            if len(fields) < 2:
+                continue
+
+            rtype, rdata = fields[0].upper(), fields[1:]
+            if rtype == "SOA" and len(rdata) >= 7:
+                zone.negative_ttl = min(ttl, int(rdata[6]))
+            elif rtype == "CNAME":
+                zone.add(name, "CNAME", absolute(rdata[0]), ttl)
+            elif rtype == "A":
+                zone.add(name, "A", rdata[0], ttl)
+        return zone
+
+
+class DnsServer:
+    """Authoritative DNS service; pass an instance to EndDevice.assign_port as the handler"""
+
+    def __init__(self, zone):
+        self.zone = zone
+        self.stats = {'queries': 0, 'answers': 0, 'nxdomain': 0}
+
+    def resolve(self, name):
+        """Follow CNAMEs inside the zone. Returns (chain, addresses, ttl)"""
+        chain = [_normalize(name)]
+        ttl = None
+        while len(chain) <= MAX_CNAME_CHAIN:
+            a = self.zone.get(chain[-1], "A")
+            if a:
+                return chain, a[1], a[0] if ttl is None else min(ttl, a[0])
+            cname = self.zone.get(chain[-1], "CNAME")
+            if not cname or cname[1][0] in chain:
+                break
+            ttl = cname[0] if ttl is None else min(ttl, cname[0])
+            chain.append(cname[1][0])
+        return chain, [], self.zone.negative_ttl
+
+    def __call__(self, query):
+        self.stats['queries'] += 1
+        query = query.strip()
+        chain, addresses, ttl = self.resolve(query)
+        if not addresses:
+            self.stats['nxdomain'] += 1
+            return f"DNS Response: NXDOMAIN (No record for {query}) (TTL {ttl})"
+        self.stats['answers'] += 1
+        aliases = "".join(f" -> CNAME {name}" for name in chain[1:])
+        return f"DNS Response: {query}{aliases} -> {', '.join(addresses)} (TTL {ttl})"
+
+
+def parse_response(text):
+    """Turn a DnsServer reply back into {'status', 'addresses', 'cname_chain', 'ttl'}"""
+    match = _RESPONSE.match(text.strip())
+    if not match:
+        return None
+    ttl = int(match.group('ttl')) if match.group('ttl') else DEFAULT_TTL
+    body = match.group('body')
+    if body.startswith("NXDOMAIN"):
+        return {'status': "NXDOMAIN", 'addresses': [], 'cname_chain': [], 'ttl': ttl}
+    parts = body.split(" -> ")
+    return {
+        'status': "NOERROR",
+        'addresses': [ip.strip() for ip in parts[-1].split(",")],
+        'cname_chain': [part[len("CNAME "):] for part in parts[1:-1]],
+        'ttl': ttl
+    }
+
+
+class StubResolver:
+    """Per-device resolver cache with TTL expiry and negative caching.
+
+    Entries expire on the transport's virtual clock. On a miss the query goes
+    out as a UDP datagram through the simulated network.
+    """
+
+    def __init__(self, device, max_entries=10000):
+        self.device = device
+        self.nameserver = None  # (EndDevice, port)
+        self.max_entries = max_entries
+        self.cache = {}  # name -> (expires_at, answer)
+        self.stats = {'queries': 0, 'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'failures': 0}
+
+    def set_nameserver(self, server, port=53):
+        self.nameserver = (server, port)
+
+    def lookup(self, name, now):
+        key = _normalize(name)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self.cache[key]
+            self.stats['expired'] += 1
+            return None
+        return entry[1]
+
+    def store(self, name, answer, now):
+        if answer['ttl'] <= 0:
+            return
+        key = _normalize(name)
+        self.cache.pop(key, None)
+        if len(self.cache) >= self.max_entries:
+            del self.cache[next(iter(self.cache))]  # Evict the oldest insertion
+        self.cache[key] = (now + answer['ttl'], answer)
+
+    def resolve(self, name, transport, server=None, port=None):
+        """Answer from the cache or query the nameserver over `transport`.
+
+        Returns None only when no nameserver is known. Network answers also
+        carry the udp_request fields (source_port, delivered, refused).
+        """
+        self.stats['queries'] += 1
+        now = transport.clock.now
+        answer = self.lookup(name, now)
+        if answer is not None:
+            self.stats['negative_hits' if answer['status'] == "NXDOMAIN" else 'hits'] += 1
+            remaining = self.cache[_normalize(name)][0] - now
+            return dict(answer, cached=True, ttl=int(remaining))
+
+        if server is None:
+            if self.nameserver is None:
+                self.stats['failures'] += 1
+                return None
+            server, port = self.nameserver[0], port or self.nameserver[1]
+        self.stats['misses'] += 1
+        result = transport.udp_request(self.device, server, port or 53, name)
+        answer = parse_response(result['response']) if result['response'] else None
+        if answer is None:
+            self.stats['failures'] += 1
+            return dict(result, status="SERVFAIL", addresses=[], cname_chain=[], ttl=0, cached=False)
+        answer['response'] = result['response']
+        self.store(name, answer, transport.clock.now)
+        return dict(result, **answer, cached=False)
+
+    def flush(self):
+        self.cache.clear()
+
+    def hit_ratio(self):
+        answered = self.stats['hits'] + self.stats['negative_hits'] + self.stats['misses']
+        return (self.stats['hits'] + self.stats['negative_hits']) / answered if answered else 0.0
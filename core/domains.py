@@ -0,0 +1,93 @@
+import streamlit as st
+from core.devices import Entity, EndDevice, Hub, Switch, Router
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+
+    def find(self, item):
+        parent = self.parent
+        root = item
+        while parent[root] != root:
+            root = parent[root]
+        while parent[item] != root:  # Path compression
+            parent[item], item = root, parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def _attachment(entity, peer):
+    """Broadcast-domain node that `entity` contributes to a link towards `peer`.
+
+    Switches split per VLAN and routers per interface, so the same entity can
+    sit in several broadcast domains.
+    """
+    if isinstance(entity, Switch):
+        port = entity.port_table.get(peer)
+        return (entity.id, 'vlan', entity.vlan_table.get(port, entity.default_vlan))
+    if isinstance(entity, Router):
+        interface = entity.port_table.get(peer)
+        if interface is None:
+            return (entity.id, 'link', peer.id)
+        return (entity.id, 'interface', interface)
+    return (entity.id,)
+
+
+def compute_domains(connections, entities=()):
+    """Count broadcast and collision domains with union-find over the links.
+
+    Broadcast domains are joined across hubs, bridges and same-VLAN switch
+    ports and split at routers; only domains holding an end device or a
+    router interface are counted. Collision domains are joined only across
+    hubs, so every switch, bridge or router port starts a new one.
+    """
+    broadcast = UnionFind()
+    endpoints = set()  # End device and router interface nodes
+    for entity in entities:
+        if isinstance(entity, EndDevice):
+            broadcast.add((entity.id,))
+            endpoints.add((entity.id,))
+
+    collision = UnionFind()
+    hub_links = {}
+
+    for index, (a, b) in enumerate(connections):
+        node_a, node_b = _attachment(a, b), _attachment(b, a)
+        broadcast.add(node_a)
+        broadcast.add(node_b)
+        broadcast.union(node_a, node_b)
+        for entity, node in ((a, node_a), (b, node_b)):
+            if isinstance(entity, EndDevice) or node[1:2] == ('interface',):
+                endpoints.add(node)
+
+        collision.add(index)
+        for entity in (a, b):
+            if isinstance(entity, Hub):
+                first = hub_links.setdefault(entity.id, index)
+                collision.union(first, index)
+
+    broadcast_domains = len({broadcast.find(node) for node in endpoints})
+    collision_domains = len({collision.find(index) for index in collision.parent})
+
+    return {
+        'broadcast_domains': broadcast_domains,
+        'collision_domains': collision_domains
+    }
+
+
+def cached_domains(connections, entities=()):
+    """compute_domains, recomputed only when the topology version changes; kept per session"""
+    key = (Entity.topology_version, len(connections))
+    entry = st.session_state.get('domain_cache')
+    if entry is None or entry[0] != key:
+        entry = st.session_state.domain_cache = (key, compute_domains(connections, entities))
+    return entry[1]
@@ -2,14 +2,12 @@ import streamlit as st
 from core.devices import EndDevice, Hub, Switch, Bridge, Router, http_handler, dns_handler, ftp_handler
 from core.network import Network
 import time
-from core.functions import visualize_topology, find_path, restore_connections, initialize_session_state
+from core.functions import visualize_topology, find_path, restore_connections, initialize_session_state, reset_network_state
 
 def create_prebuilt_network(network_type):
     """Create a prebuilt network configuration"""
     # Clear existing network
-    for key in ['network', 'devices', 'hubs', 'switches', 'bridges', 'connections', 'messages', 'routers']:
-        if key in st.session_state:
-            del st.session_state[key]
+    reset_network_state()
     
     # Initialize fresh network
     initialize_session_state(Network)
@@ -141,14 +139,8 @@ def create_prebuilt_network(network_type):
             # router1.connect(router3, "se1/1")
             # router2.connect(router3, "se1/0")
             
-            router3.add_route("10.0.0.0", "255.255.255.0", "20.0.0.1", "se1/1")
-            router3.add_route("40.0.0.0", "255.255.255.0", "30.0.0.1", "se1/0")
-            
-            router1.add_route("40.0.0.0", "255.255.255.0", "20.0.0.2", "se1/1")
-            router1.add_route("30.0.0.0", "255.255.255.0", "20.0.0.2", "se1/1")
-            
-            router2.add_route("10.0.0.0", "255.255.255.0", "30.0.0.2", "se1/1")
-            router2.add_route("20.0.0.0", "255.255.255.0", "30.0.0.2", "se1/1")
+            # Static routes between the three routers come from the shortest-path solver
+            st.session_state.routing_solver.update(st.session_state.routers.values())
 
             st.session_state.connections.append((router1, router3))
             st.session_state.connections.append((router2, router3))
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from core.codec import encode_payload, decode_payload
+from core.transport import IPV4_HEADER_SIZE, segment_size
+
+DEFAULT_MTU = 1500
+MIN_MTU = 68
+MAX_DATAGRAM = 65535
+REASSEMBLY_TIMEOUT = 30.0
+MAX_REASSEMBLIES = 16  # Datagrams one host reassembles at once; caps memory at 16 x 64 KB
+
+
+def payload_length(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    if isinstance(data, dict) and 'protocol' in data:
+        return segment_size(data) - IPV4_HEADER_SIZE
+    return len(str(data).encode('utf-8'))
+
+
+def packet_size(packet):
+    return IPV4_HEADER_SIZE + payload_length(packet['data'])
+
+
+def fragment_count(length, mtu):
+    """Fragments needed for an IP payload of `length` bytes"""
+    step = (mtu - IPV4_HEADER_SIZE) // 8 * 8
+    return max(1, -(-length // step))
+
+
+def is_fragment(packet):
+    return 'frag_offset' in packet
+
+
+def fragment(packet, mtu):
+    """Split a packet so each piece fits `mtu`.
+
+    Returns [packet] when it already fits, and [] when it is too big but has
+    DF set or exceeds the largest IPv4 datagram. Fragments carry the encoded payload bytes plus 'proto',
+    'frag_offset' (8-byte units) and 'mf'; fragments can be fragmented again.
+    """
+    if packet_size(packet) <= mtu:
+        return [packet]
+    if packet.get('df') or packet_size(packet) > MAX_DATAGRAM:
+        return []
+
+    if is_fragment(packet):
+        protocol, raw = packet['proto'], packet['data']
+        base, more = packet['frag_offset'], packet['mf']
+    else:
+        protocol, raw = encode_payload(packet['data'])
+        base, more = 0, False
+
+    step = (max(mtu, MIN_MTU) - IPV4_HEADER_SIZE) // 8 * 8
+    fragments = []
+    for start in range(0, len(raw), step):
+        fragments.append(dict(packet, proto=protocol, data=raw[start:start + step],
+                              frag_offset=base + start // 8, mf=more or start + step < len(raw)))
+    return fragments
+
+
+class _Reassembly:
+    __slots__ = ('buffer', 'blocks', 'received', 'high', 'total', 'protocol', 'started')
+
+    def __init__(self):
+        self.buffer = bytearray(MAX_DATAGRAM)
+        self.blocks = bytearray(MAX_DATAGRAM // 8 + 1)  # One flag per 8-byte fragment block
+        self.high = 0
+
+    def reset(self, protocol, now):
+        self.blocks[:self.high] = bytes(self.high)  # Clear only the blocks the last datagram used
+        self.received = 0
+        self.high = 0
+        self.total = None
+        self.protocol = protocol
+        self.started = now
+
+
+class ReassemblyBuffer:
+    """Per-host IPv4 reassembly.
+
+    Partial datagrams live in preallocated 64 KB buffers that are recycled
+    through a free list, at most `max_datagrams` of them. When all are busy
+    the oldest partial datagram is dropped; partial datagrams older than
+    `timeout` seconds are dropped too.
+    """
+
+    def __init__(self, max_datagrams=MAX_REASSEMBLIES, timeout=REASSEMBLY_TIMEOUT):
+        self.max_datagrams = max_datagrams
+        self.timeout = timeout
+        self.pending = OrderedDict()  # (source_ip, dest_ip, proto, id) -> _Reassembly, oldest first
+        self.free = []
+        self.allocated = 0
+        self.stats = {'fragments': 0, 'reassembled': 0, 'timeouts': 0, 'evicted': 0, 'malformed': 0}
+
+    def _acquire(self):
+        if self.free:
+            return self.free.pop()
+        if self.allocated < self.max_datagrams:
+            self.allocated += 1
+            return _Reassembly()
+        key, oldest = self.pending.popitem(last=False)
+        self.stats['evicted'] += 1
+        return oldest
+
+    def expire(self, now):
+        while self.pending:
+            key, entry = next(iter(self.pending.items()))
+            if entry.started + self.timeout > now:
+                break
+            del self.pending[key]
+            self.free.append(entry)
+            self.stats['timeouts'] += 1
+
+    def add(self, packet, now):
+        """Store one fragment. Returns the reassembled packet once complete, else None."""
+        self.stats['fragments'] += 1
+        self.expire(now)
+        key = (packet['source_ip'], packet['dest_ip'], packet['proto'], packet.get('id'))
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self._acquire()
+            entry.reset(packet['proto'], now)
+            self.pending[key] = entry
+
+        data = packet['data']
+        offset = packet['frag_offset'] * 8
+        end = offset + len(data)
+        if end > MAX_DATAGRAM - IPV4_HEADER_SIZE or (packet['mf'] and len(data) % 8):
+            del self.pending[key]
+            self.free.append(entry)
+            self.stats['malformed'] += 1
+            return None
+
+        entry.buffer[offset:end] = data
+        first, last = offset // 8, -(-end // 8)
+        entry.received += (last - first) - entry.blocks.count(1, first, last)
+        entry.blocks[first:last] = b"\x01" * (last - first)
+        entry.high = max(entry.high, last)
+        if not packet['mf']:
+            entry.total = end
+
+        if entry.total is None or entry.received < -(-entry.total // 8):
+            return None
+
+        del self.pending[key]
+        raw = bytes(entry.buffer[:entry.total])
+        self.free.append(entry)
+        self.stats['reassembled'] += 1
+
+        whole = {k: v for k, v in packet.items() if k not in ('frag_offset', 'mf', 'proto')}
+        whole['data'] = decode_payload(entry.protocol, raw)
+        return whole
@@ -0,0 +1,80 @@
+import hashlib
+import io
+import mmap
+import os
+
+FTP_CONTROL_PORT = 21
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(fileobj, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield a file in fixed-size chunks without loading it whole.
+
+    Real files are read through a memory map; in-memory uploads (no file
+    descriptor) are read with read(chunk_size).
+    """
+    try:
+        fileno = fileobj.fileno()
+        size = os.fstat(fileno).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno, size = None, 0
+
+    if fileno is not None and size:
+        with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(0, size, chunk_size):
+                yield mapped[offset:offset + chunk_size]
+        return
+
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class TransferSink:
+    """Receiving end of a data connection: counts and hashes the bytes, optionally writing them out"""
+
+    def __init__(self, output=None):
+        self.output = output
+        self.bytes = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk):
+        self.bytes += len(chunk)
+        self.digest.update(chunk)
+        if self.output is not None:
+            self.output.write(chunk)
+
+
+def ftp_put(sim, source, dest, fileobj, filename, control_port=FTP_CONTROL_PORT,
+            chunk_size=DEFAULT_CHUNK_SIZE, output=None):
+    """Upload `fileobj` to `dest` through the simulated network.
+
+    The STOR command goes over the control connection; the file then streams
+    over a separate data connection (port control_port - 1) in chunks of
+    `chunk_size`, segmented into MSS-sized packets by TCP.
+    """
+    control = sim.tcp_request(source, dest, control_port, f"STOR {filename}")
+    if control['refused'] or not control['response'].startswith("150"):
+        control['sent'] = 0
+        return control
+
+    sent_digest = hashlib.sha256()
+
+    def hashed_chunks():
+        for chunk in iter_chunks(fileobj, chunk_size):
+            sent_digest.update(chunk)
+            yield chunk
+
+    sink = TransferSink(output)
+    result = sim.stream_transfer(source, dest, hashed_chunks(), control_port - 1, sink.write)
+    result['received'] = sink.bytes
+    result['sha256'] = sink.digest.hexdigest()
+    result['delivered'] = sink.bytes == result['sent'] and result['sha256'] == sent_digest.hexdigest()
+    result['refused'] = False
+    status = "226 Transfer complete" if result['delivered'] else "426 Transfer aborted"
+    result['response'] = f"{control['response']}\n{status} ({sink.bytes} bytes of {filename})"
+    return result
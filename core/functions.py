@@ -1,10 +1,24 @@
 import networkx as nx
 import os
 from pyvis.network import Network as PyVisNetwork
-from core.devices import EndDevice, Hub, Switch, Bridge, Router
+from core.devices import Entity, EndDevice, Hub, Switch, Bridge, Router
+from core.clock import SimClock
+from core.routing import RoutingSolver
+from core.route_check import ForwardingAnalyzer
+from core.lint import ConfigLinter
 import streamlit as st
 
-def visualize_topology(network, connections, highlight_path=None):
+def _heat_colour(utilization):
+    """Green (idle) through yellow to red (saturated)"""
+    utilization = max(0.0, min(utilization, 1.0))
+    if utilization < 0.5:
+        red, green = int(510 * utilization), 200
+    else:
+        red, green = 255, int(200 * (1 - utilization) * 2)
+    return f"#{red:02X}{green:02X}30"
+
+
+def visualize_topology(network, connections, highlight_path=None, link_load=None):
     G = nx.Graph()
 
     for device in network.devices:
@@ -26,12 +40,34 @@ def visualize_topology(network, connections, highlight_path=None):
     for conn in connections:
         if conn[0].id in G.nodes and conn[1].id in G.nodes:  
             G.add_edge(conn[0].id, conn[1].id)
+
+    for switch in network.switches:
+        for lag in switch.lags.values():
+            if G.has_edge(switch.id, lag['peer'].id):
+                up = sum(member['up'] for member in lag['members'])
+                G.edges[(switch.id, lag['peer'].id)]['weight'] = 1 + 2 * up
+                G.edges[(switch.id, lag['peer'].id)]['title'] = f"LAG: {up} of {len(lag['members'])} member links up"
+    
+    if link_load:
+        # link_load from metrics.LinkLoad.links(): width follows cumulative bytes, colour the windowed utilization
+        busiest = max(load['bytes'] for load in link_load.values()) or 1
+        for (a, b), load in link_load.items():
+            if G.has_edge(a, b):
+                G.edges[(a, b)]['weight'] = 1 + 11 * load['bytes'] / busiest  # from_nx turns weight into the edge width
+                title = f"{a} - {b}\n{load['frames']} frames, {load['bytes']} bytes\n"
+                if load['utilization'] is None:
+                    G.edges[(a, b)]['color'] = '#A9A9A9'
+                    title += "Utilization unknown: no simulated time has passed"
+                else:
+                    G.edges[(a, b)]['color'] = _heat_colour(load['utilization'])
+                    title += f"{load['rate_bps'] / 1e6:.3f} Mbps, {load['utilization']:.1%} utilized"
+                G.edges[(a, b)]['title'] = title
         
     if highlight_path:
         for i in range(len(highlight_path) - 1):
             if G.has_edge(highlight_path[i], highlight_path[i + 1]):
                 G.edges[(highlight_path[i], highlight_path[i + 1])]['color'] = '#28A428'
-                G.edges[(highlight_path[i], highlight_path[i + 1])]['width'] = 6
+                G.edges[(highlight_path[i], highlight_path[i + 1])]['weight'] = 6
 
     net = PyVisNetwork(height="500px", width="100%", notebook=False)
     net.from_nx(G)
@@ -81,6 +117,9 @@ def restore_connections():
     for router in st.session_state.routers.values():
         router.connected_to = []
         router.port_table = {}
+    Entity.touch_topology(*st.session_state.devices.values(), *st.session_state.hubs.values(),
+                          *st.session_state.switches.values(), *st.session_state.bridges.values(),
+                          *st.session_state.routers.values())
 
     def get_current_entity(entity):
         if isinstance(entity, EndDevice):
@@ -132,6 +171,17 @@ def restore_connections():
     
     st.session_state.connections = new_connections
 
+# Session state built from the current network, dropped by Reset Network and when a prebuilt network loads
+NETWORK_STATE_KEYS = ['network', 'devices', 'hubs', 'switches', 'bridges', 'connections', 'messages', 'routers',
+                      'transport_sim', 'snapshot_cache', 'capture', 'capture_file', 'capture_result', 'traffic_result',
+                      'sim_clock', 'link_load', 'routing_solver', 'forwarding_analyzer', 'config_linter', 'domain_cache',
+                      'reachability_cache']
+
+def reset_network_state():
+    for key in NETWORK_STATE_KEYS:
+        if key in st.session_state:
+            del st.session_state[key]
+
 def initialize_session_state(Network):
     if 'network' not in st.session_state:
         st.session_state.network = Network()
@@ -153,5 +203,17 @@ def initialize_session_state(Network):
     if 'messages' not in st.session_state:
         st.session_state.messages = []  
 
+    if 'sim_clock' not in st.session_state:
+        st.session_state.sim_clock = SimClock()  # Shared by every transport run, and by link utilization
+
+    if 'routing_solver' not in st.session_state:
+        st.session_state.routing_solver = RoutingSolver()
+
+    if 'forwarding_analyzer' not in st.session_state:
+        st.session_state.forwarding_analyzer = ForwardingAnalyzer()
+
+    if 'config_linter' not in st.session_state:
+        st.session_state.config_linter = ConfigLinter()
+
     if 'selected_layer' not in st.session_state:
         st.session_state.selected_layer = 1
\ No newline at end of file
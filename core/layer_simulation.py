@@ -1,13 +1,30 @@
 import streamlit as st
-from core.devices import EndDevice, Hub, Switch, Bridge, Router, http_handler, dns_handler, ftp_handler, TransportLayerSimulator
+from core.devices import Entity, EndDevice, Hub, Switch, Bridge, Router, http_handler, dns_handler, ftp_handler, TransportLayerSimulator
+from core.dns import DnsServer, DnsZone
+from core.ftp import ftp_put
+from core.capture import Capture
+from core.traceroute import traceroute
+from core.reachability import LAYERS as REACH_LAYERS, cached_reachability
+from core.traffic import TrafficGenerator, PoissonFlow, CbrFlow, OnOffFlow, constant_size, uniform_size, exponential_size, bimodal_size
+from core import metrics, qos, nat, acl, dhcp
+from core.profiling import profile_toggle, profile_run, show_profile
 from core.network import Network
 from collections import defaultdict
 import random
+import io
 import time
-from core.functions import visualize_topology, find_path, restore_connections, initialize_session_state
+import pandas as pd
+from core.functions import visualize_topology, find_path, restore_connections, initialize_session_state, reset_network_state
 from core.external import prebuilt_network_ui
+from core.domains import cached_domains
+from core.tables import cached_snapshot, paginated_dataframe, message_snapshot, device_snapshot, l2_snapshot, router_snapshot, metrics_snapshot, reachability_snapshot, forwarding_snapshot, lint_snapshot, MATRIX_LIMIT
 
 
+def session_entities():
+    entities = list(st.session_state.devices.values()) + list(st.session_state.hubs.values())
+    entities += list(st.session_state.switches.values()) + list(st.session_state.bridges.values()) + list(st.session_state.routers.values())
+    return entities
+
 def add_device():
     with st.form("add_device"):
         st.subheader("Add End Device")
@@ -18,13 +35,17 @@ def add_device():
         
         if st.form_submit_button("Add Device"):
             if device_id and mac_address and ip_address:
-                if device_id not in st.session_state.devices:
+                problems = st.session_state.config_linter.refresh(session_entities()).conflicts(ip_address, mac_address, subnet_mask)
+                if device_id in st.session_state.devices:
+                    st.error(f"Device {device_id} already exists!")
+                elif problems:
+                    for problem in problems:
+                        st.error(problem)
+                else:
                     new_device = EndDevice(device_id, mac_address, ip_address, subnet_mask)
                     st.session_state.devices[device_id] = new_device
                     st.session_state.network.add_device(new_device)
                     st.success(f"Device {device_id} added with MAC {mac_address} and IP {ip_address}")
-                else:
-                    st.error(f"Device {device_id} already exists!")
             else:
                 st.error("Please provide Device ID, MAC Address, and IP Address.")
 
@@ -37,6 +58,7 @@ def port_assignment():
             port_num = st.number_input("Port Number", min_value=1, max_value=65535, value=80)
             protocol = st.selectbox("Protocol", ["tcp", "udp"])
             service = st.selectbox("Service", ["http", "dns", "ftp"])
+            zone_file = st.file_uploader("Zone file (DNS only, optional)", type=['zone', 'txt'])
             
             if st.form_submit_button("Assign Port"):
                 handler = None
@@ -44,6 +66,10 @@ def port_assignment():
                     handler = http_handler
                 elif service == "dns":
                     handler = dns_handler
+                    if zone_file is not None:
+                        zone = DnsZone.parse(zone_file.read().decode('utf-8', 'replace'))
+                        handler = DnsServer(zone)
+                        st.info(f"Loaded {len(zone)} names from {zone_file.name}")
                 elif service == "ftp":
                     handler = ftp_handler
 
@@ -135,10 +161,18 @@ def router_interface_configuration():
         interface_ip = st.text_input("IP Address", key="interface_ip")
         interface_mac = st.text_input("MAC Address", key="interface_mac") 
         interface_subnet = st.text_input("Subnet Mask", value="255.255.255.0", key="interface_subnet")
+        interface_mtu = st.number_input("MTU (bytes)", min_value=68, max_value=65535, value=1500, key="interface_mtu")
         
         if st.form_submit_button("Add Interface"):
+            problems = []
             if interface_name and interface_ip and interface_mac:
-                router.add_interface(interface_name, interface_ip, interface_mac, interface_subnet)
+                problems = st.session_state.config_linter.refresh(session_entities()).conflicts(
+                    interface_ip, interface_mac, interface_subnet, router, interface_name)
+            if problems:
+                for problem in problems:
+                    st.error(problem)
+            elif interface_name and interface_ip and interface_mac:
+                router.add_interface(interface_name, interface_ip, interface_mac, interface_subnet, int(interface_mtu))
                 st.session_state.routers[router.id] = router
                 st.success(f"Interface {interface_name} added to {router.id}")
             else:
@@ -180,6 +214,210 @@ def router_routing_configuration():
             else:
                 st.error("Network, subnet mask, and interface are required")
 
+def automatic_routing():
+    routers = list(st.session_state.routers.values())
+    if not routers:
+        return
+    solver = st.session_state.routing_solver
+
+    st.subheader("Automatic Routing")
+    auto = st.checkbox("Compute routes automatically", key="auto_routing",
+                       help="Shortest-path routes to every router subnet, kept up to date as links and interfaces change")
+    recompute, withdraw = st.columns(2)
+    if recompute.button("Recompute all routes", key="recompute_routes"):
+        solver.update(routers, full=True)
+    elif withdraw.button("Withdraw computed routes", key="withdraw_routes", disabled=auto):
+        solver.clear()
+    elif auto:
+        solver.update(routers)
+
+    installed = sum(len(group) for routes in solver.installed.values() for group in routes.values())
+    if installed:
+        st.caption(f"{installed} computed routes on {len(solver.installed)} routers, "
+                   f"{solver.stats['spf_runs']} shortest-path runs so far")
+
+def router_qos():
+    routers = [r for r in st.session_state.routers.values() if r.interfaces]
+    if not routers:
+        return
+
+    st.subheader("Egress Queueing")
+    col1, col2 = st.columns(2)
+    router = col1.selectbox("Router", routers, format_func=lambda x: x.id, key="qos_router")
+    router = st.session_state.routers[router.id]
+    interface = col2.selectbox("Interface", list(router.interfaces), key="qos_interface")
+    col1, col2, col3 = st.columns(3)
+    scheduler = col1.selectbox("Scheduler", list(qos.SCHEDULERS), key="qos_scheduler",
+                               help="Classes: voice (EF), video (AF4x), bulk (CS1), default for everything else")
+    rate = col2.number_input("Line Rate (Mbps)", min_value=0.01, max_value=10000.0, value=10.0, key="qos_rate")
+    buffer_kb = col3.number_input("Buffer (KB per queue)", min_value=1, max_value=65536, value=64, key="qos_buffer")
+    apply, remove = st.columns(2)
+    if apply.button("Apply Queue", key="qos_apply"):
+        qos.attach_queue(router, interface, st.session_state.sim_clock, qos.SCHEDULERS[scheduler](limit=int(buffer_kb) * 1024), rate=rate * 1e6 / 8)
+        st.success(f"{scheduler} queue on {router.id} {interface}")
+    if remove.button("Remove Queue", key="qos_remove", disabled=interface not in router.egress):
+        qos.detach_queue(router, interface)
+
+    queued = [f"{r.id} {name} ({queue.scheduler.name}, {queue.rate * 8 / 1e6:g} Mbps)" for r in routers for name, queue in r.egress.items()]
+    if queued:
+        st.caption("Queues: " + ", ".join(queued))
+
+def router_nat():
+    routers = [r for r in st.session_state.routers.values() if r.interfaces]
+    if not routers:
+        return
+
+    st.subheader("NAT/PAT")
+    col1, col2 = st.columns(2)
+    router = col1.selectbox("Router", routers, format_func=lambda x: x.id, key="nat_router")
+    router = st.session_state.routers[router.id]
+    outside = col2.multiselect("Outside Interfaces", list(router.interfaces), key="nat_outside")
+    public_ips = st.text_input("Public Addresses (comma separated, default: first outside interface)", key="nat_public")
+    enable, disable = st.columns(2)
+    if enable.button("Enable NAT", key="nat_enable", disabled=not outside):
+        addresses = [ip.strip() for ip in public_ips.split(",") if ip.strip()]
+        nat.enable_nat(router, outside, addresses, clock=st.session_state.sim_clock)
+        st.success(f"{router.id} translates traffic leaving {', '.join(outside)} to {', '.join(router.nat.addresses)}")
+    if disable.button("Disable NAT", key="nat_disable", disabled=router.nat is None):
+        nat.disable_nat(router)
+
+    if router.nat is not None:
+        stats = router.nat.stats
+        st.caption(f"{len(router.nat)} translations on {', '.join(sorted(router.nat.outside))}; "
+                   f"{stats['created']} created, {stats['expired']} expired, {stats['evicted']} evicted")
+
+def router_acl():
+    routers = [r for r in st.session_state.routers.values() if r.interfaces]
+    if not routers:
+        return
+
+    st.subheader("Access Lists")
+    col1, col2, col3 = st.columns(3)
+    router = col1.selectbox("Router", routers, format_func=lambda x: x.id, key="acl_router")
+    router = st.session_state.routers[router.id]
+    interface = col2.selectbox("Interface", list(router.interfaces), key="acl_interface")
+    direction = col3.radio("Direction", acl.DIRECTIONS, horizontal=True, key="acl_direction")
+    current = router.acls.get((interface, direction))
+
+    with st.form("acl_rule"):
+        col1, col2, col3 = st.columns(3)
+        action = col1.selectbox("Action", [acl.PERMIT, acl.DENY], key="acl_action")
+        protocol = col2.selectbox("Protocol", ["ip", "tcp", "udp"], key="acl_protocol")
+        col1, col2 = st.columns(2)
+        source = col1.text_input("Source (any, a.b.c.d or a.b.c.d/len)", value="any", key="acl_source")
+        source_ports = col2.text_input("Source Ports (any, 80 or 1024-65535)", value="any", key="acl_source_ports")
+        dest = col1.text_input("Destination", value="any", key="acl_dest")
+        dest_ports = col2.text_input("Destination Ports", value="any", key="acl_dest_ports")
+        if st.form_submit_button("Add Rule"):
+            target = current or acl.Acl(f"{router.id}-{interface}-{direction}")
+            try:
+                target.add_rule(action, source, dest, protocol, source_ports, dest_ports)
+            except (ValueError, OSError) as e:
+                st.error(f"Invalid rule: {e}")
+            else:
+                current = acl.apply_acl(router, interface, direction, target)
+                Entity.touch_state()
+
+    if current is not None:
+        rows = [{'Seq': str((index + 1) * 10), 'Rule': current.describe(index), 'Hits': rule['hits']}
+                for index, rule in enumerate(current.rules)]
+        rows.append({'Seq': "implicit", 'Rule': f"{current.default} any", 'Hits': current.default_hits})
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        if st.button("Remove Access List", key="acl_remove"):
+            acl.remove_acl(router, interface, direction)
+            Entity.touch_state()
+
+def router_dhcp():
+    routers = [r for r in st.session_state.routers.values() if r.interfaces]
+    if not routers:
+        return
+
+    st.subheader("DHCP")
+    col1, col2, col3 = st.columns(3)
+    router = col1.selectbox("Router", routers, format_func=lambda x: x.id, key="dhcp_router")
+    router = st.session_state.routers[router.id]
+    interface = col2.selectbox("Interface", list(router.interfaces), key="dhcp_interface")
+    lease_time = col3.number_input("Lease Time (s)", min_value=60, max_value=10 * 86400, value=86400, key="dhcp_lease")
+    col1, col2 = st.columns(2)
+    first = col1.text_input("Pool Start (default: whole subnet)", key="dhcp_first")
+    last = col2.text_input("Pool End", key="dhcp_last")
+    enable, disable = st.columns(2)
+    if enable.button("Enable DHCP Server", key="dhcp_enable"):
+        try:
+            server = dhcp.enable_dhcp(router, interface, st.session_state.sim_clock, lease_time=float(lease_time),
+                                      first=first.strip() or None, last=last.strip() or None)
+        except (ValueError, OSError) as e:
+            st.error(f"Invalid pool: {e}")
+        else:
+            st.success(f"{router.id} {interface} leases {server.pool.free} addresses")
+    if disable.button("Disable DHCP Server", key="dhcp_disable", disabled=interface not in router.dhcp):
+        dhcp.disable_dhcp(router, interface)
+
+    servers = [(r, name, server) for r in routers for name, server in r.dhcp.items()]
+    if not servers:
+        return
+    st.caption("Servers: " + ", ".join(f"{r.id} {name} ({len(server.leases)} leases, {server.pool.free} free)"
+                                         for r, name, server in servers))
+
+    unaddressed = st.checkbox("Only devices without an address", value=True, key="dhcp_unaddressed")
+    if st.button("Address Devices by DHCP", key="dhcp_address"):
+        devices = [d for d in st.session_state.devices.values() if not unaddressed or d.ip in ("", dhcp.UNASSIGNED_IP)]
+        result = dhcp.address_hosts(devices, st.session_state.sim_clock)
+        st.success(f"{len(result['bound'])} devices bound, {len(result['failed'])} without a server or a free address")
+
+    switches = list(st.session_state.switches.values())
+    if switches:
+        with st.form("dhcp_bulk"):
+            col1, col2, col3 = st.columns(3)
+            switch = col1.selectbox("Switch", switches, format_func=lambda x: x.id, key="dhcp_bulk_switch")
+            count = col2.number_input("Hosts", min_value=1, max_value=10000, value=50, key="dhcp_bulk_count")
+            prefix = col3.text_input("Name Prefix", value="Host", key="dhcp_bulk_prefix")
+            if st.form_submit_button("Add DHCP Hosts"):
+                switch = st.session_state.switches[switch.id]
+                devices = []
+                index = 0
+                while len(devices) < count:
+                    index += 1
+                    device_id = f"{prefix}{index}"
+                    if device_id in st.session_state.devices:
+                        continue
+                    serial = len(st.session_state.devices)
+                    device = EndDevice(device_id, f"02:DC:{serial >> 24 & 255:02X}:{serial >> 16 & 255:02X}:{serial >> 8 & 255:02X}:{serial & 255:02X}",
+                                       dhcp.UNASSIGNED_IP)
+                    st.session_state.devices[device_id] = device
+                    st.session_state.network.add_device(device)
+                    switch.connect(device)
+                    st.session_state.connections.append((switch, device))
+                    devices.append(device)
+                result = dhcp.address_hosts(devices, st.session_state.sim_clock)
+                st.success(f"Added {len(devices)} hosts to {switch.id}; {len(result['bound'])} got an address")
+
+def forwarding_check():
+    routers = list(st.session_state.routers.values())
+    if not routers:
+        return
+
+    st.subheader("Forwarding Check")
+    analyzer = st.session_state.forwarding_analyzer.refresh(session_entities())
+    issues = analyzer.report()
+    st.caption(f"{analyzer.stats['prefixes']} destination prefixes across {len(routers)} routers, "
+               f"{analyzer.stats['checked']} prefix checks so far")
+    if not issues:
+        st.success("No routing loops, blackholes or unreachable next hops")
+        return
+    st.warning(f"{len(issues)} forwarding problems")
+    paginated_dataframe(forwarding_snapshot(issues), "forwarding_issues")
+
+def config_lint():
+    linter = st.session_state.config_linter.refresh(session_entities())
+    issues = linter.report()
+    st.caption(f"{len(linter.ips)} IP and {len(linter.macs)} MAC addresses, {len(linter.subnets)} interface subnets indexed")
+    if not issues:
+        st.success("No duplicate addresses, overlapping subnets or bad gateways")
+        return
+    st.warning(", ".join(f"{count} {kind}" for kind, count in linter.summary().items() if count))
+    paginated_dataframe(lint_snapshot(issues), "lint_issues")
+
 def create_conns(available_entities):
     st.subheader("Create Network Connection")
     entity1 = st.selectbox("Select Entity 1", available_entities, format_func=lambda x: f"{x.id} ({type(x).__name__})")
@@ -281,6 +519,29 @@ def create_conns(available_entities):
         else:
             st.error(message)
 
+def link_aggregation():
+    switches = list(st.session_state.switches.values())
+    pairs = []
+    for a, b in st.session_state.connections:
+        if isinstance(a, Switch) and isinstance(b, Switch):
+            pairs.append((st.session_state.switches.get(a.id, a), st.session_state.switches.get(b.id, b)))
+    if len(switches) < 2 or not pairs:
+        return
+
+    st.subheader("Link Aggregation")
+    pair = st.selectbox("Switch Link", range(len(pairs)), format_func=lambda i: f"{pairs[i][0].id} - {pairs[i][1].id}", key="lag_pair")
+    switch, peer = pairs[pair]
+    lag = switch.lags.get(switch.port_table.get(peer))
+    if st.button("Add Member Link", key="lag_add"):
+        switch.add_lag_member(peer)
+        lag = switch.lags.get(switch.port_table.get(peer))
+    if lag:
+        for member in lag['members']:
+            up = st.checkbox(f"{member['name']} up", value=member['up'], key=f"lag_{switch.id}_{peer.id}_{member['name']}")
+            if up != member['up']:
+                switch.set_lag_member(peer, member['name'], up)
+        st.caption(f"{sum(m['up'] for m in lag['members'])} of {len(lag['members'])} member links up")
+
 def send_data(devices, graph_placeholder):
     source = st.selectbox("Source Device", devices, format_func=lambda x: x.id)
     dest = st.selectbox("Destination Device", [d for d in devices if d != source], format_func=lambda x: x.id)
@@ -297,6 +558,7 @@ def send_data(devices, graph_placeholder):
                          5: "Layer 5 - Application"
                      }[x])
     
+    upload = None
     if layer >= 4:  
         protocol = st.selectbox("Protocol", ["tcp", "udp"])
         
@@ -319,7 +581,8 @@ def send_data(devices, graph_placeholder):
                 if command == "PUT":
                     uploaded_file = st.file_uploader("Upload file for FTP", type=['txt', 'pdf', 'doc', 'docx'])
                     if uploaded_file is not None:
-                        data = ftp_handler("PUT", uploaded_file)
+                        upload = uploaded_file  # Streamed over a data connection on send
+                        data = f"STOR {uploaded_file.name}"
                     else:
                         data = "PUT command selected but no file uploaded"
                 elif command == "LIST":
@@ -335,75 +598,324 @@ def send_data(devices, graph_placeholder):
         protocol = None
         dest_port = None
     
+    profile_toggle("send_data")
     if st.button("Send Data"):
-        path = find_path(source, dest, st.session_state.connections)
-        print(f"{source.id} sending data to {dest.id}")
-        if path:
-            sent = False
+        with profile_run("send_data"):
+            path = find_path(source, dest, st.session_state.connections)
+            print(f"{source.id} sending data to {dest.id}")
+            if path:
+                sent = False
             
-            if layer >= 3 and not source.same_subnet(dest.ip) and not source.default_gateway:
-                st.error(f"Source device {source.id} needs a default gateway to reach {dest.id}")
-                return
+                if layer >= 3 and not source.same_subnet(dest.ip) and not source.default_gateway:
+                    st.error(f"Source device {source.id} needs a default gateway to reach {dest.id}")
+                    return
                 
-            if layer >= 4:
-                if 'transport_sim' not in st.session_state:
-                    st.session_state.transport_sim = TransportLayerSimulator()
-                transport_sim = st.session_state.transport_sim
+                if layer >= 4:
+                    if 'transport_sim' not in st.session_state:
+                        st.session_state.transport_sim = TransportLayerSimulator(clock=st.session_state.sim_clock)
+                    transport_sim = st.session_state.transport_sim
                 
-                src_port = transport_sim.get_ephemeral_port(source)
-                print(f"Source Port: {src_port} assigned to {source.id}")
-                print(f"Destination Port: {dest_port} for {dest.id}")
-                print(f"Data to be send: {data}")
-                if dest_port not in dest.ports or dest.ports[dest_port]['protocol'] != protocol:
-                    transport_sim.log_message(source, dest, 
-                                            f"Connection refused (port {dest_port} closed)", 
-                                            src_port, dest_port, protocol)
-                    st.error(f"Port {dest_port}/{protocol} is not open on destination")
-                    return
+                    print(f"Destination Port: {dest_port} for {dest.id}")
+                    print(f"Data to be send: {data}")
+                    if protocol == "tcp" and upload is not None:
+                        result = ftp_put(transport_sim, source, dest, upload, upload.name, control_port=dest_port)
+                    elif protocol == "tcp":
+                        result = transport_sim.tcp_request(source, dest, dest_port, data)
+                    elif dest_ports.get(dest_port, {}).get('service') == "dns":
+                        result = source.resolver.resolve(data, transport_sim, dest, dest_port)
+                        resolver_stats = source.resolver.stats
+                        st.caption(f"{source.id} resolver: {len(source.resolver.cache)} cached names, "
+                                   f"{resolver_stats['hits']} hits, {resolver_stats['negative_hits']} negative hits, "
+                                   f"{resolver_stats['misses']} misses, hit ratio {source.resolver.hit_ratio():.0%}")
+                        if result['cached']:
+                            st.success(f"Answered from {source.id}'s DNS cache ({result['ttl']}s left): {result['response']}")
+                            return
+                    else:
+                        result = transport_sim.udp_request(source, dest, dest_port, data)
+                    src_port = result['source_port']
+                    print(f"Source Port: {src_port} assigned to {source.id}")
                 
-                service = dest.ports[dest_port]
-                print(f"Service: {service}")
-                if service['handler']:
-                    response = service['handler'](data)
-                    
-                sent = source.send(data, dest, layer=3)
-            else:
-                sent = source.send(data, dest, layer=layer)
+                    if result['refused']:
+                        transport_sim.log_message(source, dest, 
+                                                f"Connection refused (port {dest_port} closed)", 
+                                                src_port, dest_port, protocol)
+                        st.error(f"Port {dest_port}/{protocol} is not open on destination")
+                        return
+                
+                    sent = result['delivered']
+                    if sent and result['response']:
+                        transport_sim.log_message(dest, source, result['response'], dest_port, src_port, protocol)
+                else:
+                    received = len(dest.received_data)
+                    sent = source.send(data, dest, layer=layer)
+                    queued = qos.drain(st.session_state.sim_clock, st.session_state.routers.values())
+                    if queued:
+                        sent = len(dest.received_data) > received  # What the queues actually delivered
+                        st.caption(f"Egress queues held the packet for {queued * 1000:.2f} ms of simulated time")
             
-            if sent:
-                msg = {
-                    "source": source.id,
-                    "destination": dest.id,
-                    "data": data,
-                    "timestamp": time.strftime("%H:%M:%S"),
-                    "path": path,
-                    "layer": layer
-                }
+                if sent:
+                    msg = {
+                        "source": source.id,
+                        "destination": dest.id,
+                        "data": data,
+                        "timestamp": time.strftime("%H:%M:%S"),
+                        "path": path,
+                        "layer": layer
+                    }
                 
-                if layer >= 2:
-                    msg["source_mac"] = source.mac
-                    msg["dest_mac"] = dest.mac
+                    if layer >= 2:
+                        msg["source_mac"] = source.mac
+                        msg["dest_mac"] = dest.mac
                 
-                if layer >= 3:
-                    msg["source_ip"] = source.ip
-                    msg["dest_ip"] = dest.ip
+                    if layer >= 3:
+                        msg["source_ip"] = source.ip
+                        msg["dest_ip"] = dest.ip
                 
-                if layer >= 4:
-                    msg["source_port"] = src_port
-                    msg["dest_port"] = dest_port
-                    msg["protocol"] = protocol
+                    if layer >= 4:
+                        msg["source_port"] = src_port
+                        msg["dest_port"] = dest_port
+                        msg["protocol"] = protocol
                 
-                st.session_state.messages.append(msg)
+                    st.session_state.messages.append(msg)
                 
-                html = visualize_topology(st.session_state.network, st.session_state.connections, highlight_path=path)
-                graph_placeholder.empty()  
-                st.components.v1.html(html, height=500)  
+                    html = visualize_topology(st.session_state.network, st.session_state.connections, highlight_path=path)
+                    graph_placeholder.empty()  
+                    st.components.v1.html(html, height=500)  
                 
-                st.success(f"Data sent from {source.id} to {dest.id} using Layer {layer}")
+                    st.success(f"Data sent from {source.id} to {dest.id} using Layer {layer}")
+                    if layer >= 4:
+                        show_transport_result(result)
+                else:
+                    st.error(f"Failed to send data to {dest.id}")
+                    if layer == 3:
+                        show_traceroute(run_traceroute(source, dest), graph_placeholder)
             else:
-                st.error(f"Failed to send data to {dest.id}")
+                st.error(f"No path found between {source.id} and {dest.id}")
+    else:
+        show_profile("send_data")
+
+    if st.button("Traceroute", help="TTL-limited probes along the forwarding path; leaves MAC and ARP tables untouched"):
+        show_traceroute(run_traceroute(source, dest), graph_placeholder)
+
+def run_traceroute(source, dest):
+    entities = session_entities()
+    return traceroute(source, dest, entities)
+
+def show_traceroute(result, graph_placeholder):
+    if result['reached']:
+        st.success(f"Traceroute reached {result['hops'][-1]['entity']} in {len(result['hops'])} hops")
+    else:
+        st.error(f"Traceroute failed: {result['reason']}")
+    if result['hops']:
+        rows = [{'Hop': hop['hop'], 'Entity': hop['entity'], 'Address': hop['address'] or "", 'Status': hop['status'],
+                 'Via': " > ".join(hop['path']), 'RTT (ms)': round(hop['rtt_ms'], 3) if hop['rtt_ms'] is not None else None,
+                 'Frames': sum(work.get('frames_in', 0) for work in hop['processing'].values()),
+                 'Route Lookups': sum(work.get('route_lookups', 0) for work in hop['processing'].values())}
+                for hop in result['hops']]
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    if len(result['path']) > 1:
+        html = visualize_topology(st.session_state.network, st.session_state.connections, highlight_path=result['path'])
+        graph_placeholder.empty()
+        st.components.v1.html(html, height=500)
+
+def show_transport_result(result):
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Duration (simulated)", f"{result['duration'] * 1000:.1f} ms")
+    if result.get('srtt') is not None:
+        col2.metric("Smoothed RTT", f"{result['srtt'] * 1000:.1f} ms")
+    if 'goodput_bps' in result:
+        col3.metric("Goodput", f"{result['goodput_bps'] / 1e6:.2f} Mbps")
+        st.caption(f"Segments sent: {result['segments_sent']}, retransmissions: {result['retransmissions']}, "
+                   f"timeouts: {result['timeouts']}, fast retransmits: {result['fast_retransmits']}")
+    if 'sha256' in result:
+        st.caption(f"Reassembled {result['received']} of {result['sent']} bytes at the destination, "
+                   f"SHA-256 {result['sha256'][:16]}… ({'match' if result['delivered'] else 'mismatch'})")
+    if result.get('cwnd_trace'):
+        trace = pd.DataFrame(result['cwnd_trace'], columns=["time", "cwnd", "ssthresh"]).set_index("time")
+        st.line_chart(trace)
+
+def transport_benchmark(devices):
+    st.subheader("TCP Bulk Transfer")
+    source = st.selectbox("Sender", devices, format_func=lambda x: x.id, key="bench_source")
+    dest = st.selectbox("Receiver", [d for d in devices if d != source], format_func=lambda x: x.id, key="bench_dest")
+    
+    col1, col2 = st.columns(2)
+    size_kb = col1.number_input("Transfer Size (KB)", min_value=1, max_value=102400, value=1024)
+    link_mbps = col2.number_input("Bottleneck Rate (Mbps)", min_value=0.1, max_value=10000.0, value=10.0)
+    hop_delay_ms = col1.number_input("Delay per Router Hop (ms)", min_value=0.0, max_value=1000.0, value=5.0)
+    queue_kb = col2.number_input("Bottleneck Buffer (KB)", min_value=2, max_value=10240, value=16)
+    loss = st.slider("Random Loss Probability", 0.0, 0.2, 0.0)
+    mss = st.number_input("TCP Segment Size (bytes)", min_value=64, max_value=65000, value=1460,
+                          help="Segments larger than a link's MTU are fragmented by IP")
+    
+    if st.button("Run Transfer"):
+        source = st.session_state.devices[source.id]
+        dest = st.session_state.devices[dest.id]
+        sim = TransportLayerSimulator(clock=st.session_state.sim_clock, link_rate=link_mbps * 1e6 / 8, hop_delay=hop_delay_ms / 1000,
+                                      queue_limit=queue_kb * 1024, loss_rate=loss, seed=0)
+        routers = st.session_state.routers.values()
+        fragments_before = source.fragments_created + sum(r.fragments_created for r in routers)
+        result = sim.bulk_transfer(source, dest, size_kb * 1024, mss=int(mss))
+        fragments = source.fragments_created + sum(r.fragments_created for r in routers) - fragments_before
+        if result['received'] == size_kb * 1024:
+            st.success(f"Transferred {size_kb} KB from {source.id} to {dest.id}")
         else:
-            st.error(f"No path found between {source.id} and {dest.id}")
+            st.error(f"Transfer incomplete: {result['received']} of {size_kb * 1024} bytes received")
+        show_transport_result(result)
+        st.caption(f"Bottleneck drops: {result['network']['queue_drops']}, random drops: {result['network']['random_drops']}")
+        st.caption(f"IP fragments created: {fragments} ({result['network']['bytes'] / max(result['network']['segments'], 1):.0f} bytes per segment on the wire), "
+                   f"{dest.id} reassembly: {dest.reassembly.stats}")
+
+def traffic_generator(devices):
+    st.subheader("Traffic Generator")
+    col1, col2 = st.columns(2)
+    sources = col1.multiselect("Sources", devices, default=devices[:1], format_func=lambda x: x.id, key="traffic_sources")
+    dests = col2.multiselect("Destinations", devices, default=devices[-1:], format_func=lambda x: x.id, key="traffic_dests")
+    
+    model = st.radio("Flow Model", ["Poisson", "CBR", "On/Off"], horizontal=True, key="traffic_model")
+    col1, col2, col3 = st.columns(3)
+    if model == "Poisson":
+        rate = col1.number_input("Packets per Second", min_value=1.0, max_value=100000.0, value=100.0)
+        make_model = lambda: PoissonFlow(rate)
+    else:
+        mbps = col1.number_input("Rate (Mbps)", min_value=0.01, max_value=10000.0, value=1.0)
+        if model == "CBR":
+            make_model = lambda: CbrFlow(mbps * 1e6)
+        else:
+            mean_on = col2.number_input("Mean ON (s)", min_value=0.01, max_value=60.0, value=0.5)
+            mean_off = col3.number_input("Mean OFF (s)", min_value=0.01, max_value=60.0, value=0.5)
+            heavy = st.checkbox("Heavy-tailed periods (Pareto, shape 1.5)", key="traffic_pareto")
+            make_model = lambda: OnOffFlow(mbps * 1e6, mean_on, mean_off, shape=1.5 if heavy else None)
+    
+    col1, col2, col3 = st.columns(3)
+    distribution = col1.selectbox("Packet Size", ["Constant", "Uniform", "Exponential", "Bimodal"], key="traffic_size")
+    if distribution == "Constant":
+        size = constant_size(col2.number_input("Size (bytes)", min_value=12, max_value=65507, value=512))
+    elif distribution == "Uniform":
+        low = col2.number_input("Min (bytes)", min_value=12, max_value=65507, value=64)
+        high = col3.number_input("Max (bytes)", min_value=12, max_value=65507, value=1400)
+        size = uniform_size(min(low, high), max(low, high))
+    elif distribution == "Exponential":
+        size = exponential_size(col2.number_input("Mean (bytes)", min_value=12, max_value=65507, value=500))
+    else:
+        size = bimodal_size(small_share=col2.slider("Small Packet Share", 0.0, 1.0, 0.5))
+    
+    dscp = st.selectbox("DSCP Marking", list(qos.DSCP), key="traffic_dscp",
+                        format_func=lambda name: f"{name} ({qos.DSCP[name]})")
+    
+    col1, col2, col3 = st.columns(3)
+    duration = col1.number_input("Duration (s, simulated)", min_value=0.1, max_value=600.0, value=5.0)
+    link_mbps = col2.number_input("Bottleneck Rate (Mbps)", min_value=0.1, max_value=10000.0, value=10.0, key="traffic_link")
+    seed = col3.number_input("Seed", min_value=0, max_value=2**31 - 1, value=0, key="traffic_seed")
+    
+    if st.button("Generate Traffic", disabled=not sources or not dests):
+        sources = [st.session_state.devices[d.id] for d in sources]
+        dests = [st.session_state.devices[d.id] for d in dests]
+        sim = TransportLayerSimulator(clock=st.session_state.sim_clock, link_rate=link_mbps * 1e6 / 8, seed=int(seed))
+        generator = TrafficGenerator(sim, seed=int(seed))
+        flows = generator.add_flows(sources, dests, make_model, size=size, duration=duration, dscp=qos.DSCP[dscp])
+        if not flows:
+            st.error("Pick at least one source and a different destination")
+            return
+        st.session_state.traffic_result = generator.run()
+    
+    result = st.session_state.get('traffic_result')
+    if result:
+        totals = result['totals']
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Offered Load", f"{totals['offered_bps'] / 1e6:.2f} Mbps")
+        col2.metric("Delivered Load", f"{totals['delivered_bps'] / 1e6:.2f} Mbps")
+        col3.metric("Loss", f"{totals['loss']:.1%}")
+        col4.metric("p99 Latency", f"{totals['p99_ms']:.1f} ms" if totals['p99_ms'] is not None else "-")
+        st.caption(f"{totals['flows']} flows, {totals['sent']} packets sent, {totals['delivered']} delivered; "
+                   f"latency p50 {totals['p50_ms'] or 0:.1f} ms, p95 {totals['p95_ms'] or 0:.1f} ms; "
+                   f"bottleneck drops: {result['network']['queue_drops']}")
+        st.dataframe(pd.DataFrame(result['flows']), hide_index=True, use_container_width=True)
+    
+    queues = qos.queue_report(st.session_state.routers.values())
+    if queues:
+        st.markdown("**Egress queues** (cumulative since each queue was applied)")
+        st.dataframe(pd.DataFrame(queues), hide_index=True, use_container_width=True)
+
+def packet_capture(entities):
+    capture = st.session_state.get('capture')
+    if capture is None:
+        names = st.multiselect("Capture Points", entities, format_func=lambda x: x.id, key="capture_points")
+        fmt = st.radio("File Format", ["pcapng", "pcap"], horizontal=True, key="capture_format")
+        if st.button("Start Capture", disabled=not names):
+            buffer = io.BytesIO()
+            capture = Capture(buffer, fmt)
+            for entity in names:
+                capture.attach(entity)
+            st.session_state.capture = capture
+            st.session_state.capture_file = (buffer, fmt)
+            st.rerun()
+    else:
+        points = ', '.join(entity.id for entity, _ in capture.taps)
+        st.info(f"Capturing on {points}: {capture.stats['frames']} frames, {capture.stats['bytes']} bytes")
+        if st.button("Stop Capture"):
+            capture.close()
+            buffer, fmt = st.session_state.capture_file
+            st.session_state.capture_result = (buffer.getvalue(), fmt)
+            del st.session_state.capture
+            st.rerun()
+    
+    if st.session_state.get('capture_result'):
+        data, fmt = st.session_state.capture_result
+        st.download_button(f"Download capture ({len(data)} bytes)", data, file_name=f"protoplay.{fmt}",
+                           mime="application/vnd.tcpdump.pcap")
+
+def metrics_panel(entities):
+    st.subheader("Metrics")
+    if not st.session_state.get("collect_metrics"):
+        st.info("Enable \"Collect metrics\" in the sidebar to start counting.")
+        return
+
+    metric_tables = metrics_snapshot(entities)
+    paginated_dataframe(metric_tables["entities"], "metrics_entities", empty_message="No entities yet.")
+
+    st.write("**Links:**")
+    paginated_dataframe(metric_tables["links"], "metrics_links", empty_message="No frames have crossed a link yet.")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        path = st.text_input("Exporter File", value=metrics.DEFAULT_METRICS_FILE, key="metrics_path")
+    with col2:
+        if st.button("Write Prometheus File"):
+            st.success(f"Wrote {metrics.write_prometheus(entities, path)}")
+    with col3:
+        if st.button("Reset Counters"):
+            metrics.reset(entities)
+            st.rerun()
+    st.download_button("Download metrics", metrics.prometheus_text(entities), file_name="protoplay.prom",
+                       mime="text/plain")
+
+def reachability_panel(entities):
+    st.subheader("Reachability")
+    hosts = [e for e in entities if isinstance(e, EndDevice)]
+    if len(hosts) < 2:
+        st.info("Add at least two end devices to analyze reachability.")
+        return
+
+    layer = st.radio("Layer", REACH_LAYERS, horizontal=True, key="reach_layer",
+                     format_func=lambda x: {"l2": "Layer 2 (broadcast domains)", "l3": "Layer 3 (subnets, gateways, routes)"}[x])
+    start = time.perf_counter()
+    reach = cached_reachability(entities)
+    elapsed = time.perf_counter() - start
+    summary = reach.summary(layer)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Hosts", summary['hosts'])
+    col2.metric("Reachable Pairs", f"{summary['ratio']:.1%}")
+    col3.metric("Isolated Hosts", summary['isolated'])
+    col4.metric("Analysis", f"{elapsed * 1000:.0f} ms")
+    st.caption("Computed from VLANs, subnets, gateways and routing tables; access lists and NAT are not considered.")
+
+    tables = cached_snapshot(f"reachability_{layer}", reachability_snapshot, reach, layer)
+    if summary['hosts'] > MATRIX_LIMIT:
+        st.caption(f"Matrix shows the first {MATRIX_LIMIT} of {summary['hosts']} hosts by address")
+    st.dataframe(tables["matrix"], hide_index=True, use_container_width=True)
+    st.write("**Unreachable Pairs:**")
+    paginated_dataframe(tables["unreachable"], f"reach_unreachable_{layer}", empty_message="Every host reaches every other host.")
 
 def vlan_configuration():
     switches = list(st.session_state.switches.values())
@@ -482,6 +994,19 @@ def layerSimulation():
     graph_placeholder = st.empty()
     initialize_session_state(Network)
     # restore_connections()
+
+    # Instrumentation switches apply before anything is sent in this run
+    wire_mode = st.sidebar.checkbox("Wire mode", key="wire_mode",
+                                    help="Send frames as encoded Ethernet/IPv4 bytes with checksums and FCS")
+    entities = session_entities()
+    for entity in entities:
+        entity.wire_mode = wire_mode  # On this session's entities; Entity.wire_mode is shared by every session
+    if st.sidebar.checkbox("Collect metrics", key="collect_metrics",
+                           help="Count frames, bytes, floods and drops on every entity"):
+        metrics.enable(entities)
+    else:
+        metrics.disable(entities)
+
     # Create a two-column layout
     col1, col2 = st.columns([2, 3])
 
@@ -500,21 +1025,45 @@ def layerSimulation():
             add_router()
 
         with st.expander("Router Configuration", expanded=True):
+            automatic_routing()
             router_interface_configuration()
             router_routing_configuration()
+            router_qos()
+            router_nat()
+            router_acl()
+            router_dhcp()
+            forwarding_check()
+
+        with st.expander("Configuration Check", expanded=False):
+            config_lint()
             
         with st.expander("Create Connections", expanded=True):
-            available_entities = list(st.session_state.devices.values()) + list(st.session_state.hubs.values())
-            available_entities += list(st.session_state.switches.values()) + list(st.session_state.bridges.values()) + list(st.session_state.routers.values())
+            available_entities = session_entities()
             
             if len(available_entities) >= 2:
                 create_conns(available_entities)
+            link_aggregation()
 
         # Data Transmission 
         with st.expander("Send Data", expanded=True):
             devices = list(st.session_state.devices.values())
             if len(devices) >= 2:
                 send_data(devices, graph_placeholder)
+        
+        with st.expander("Transport Benchmark", expanded=False):
+            devices = list(st.session_state.devices.values())
+            if len(devices) >= 2:
+                transport_benchmark(devices)
+
+        with st.expander("Traffic Generator", expanded=False):
+            devices = list(st.session_state.devices.values())
+            if len(devices) >= 2:
+                traffic_generator(devices)
+
+        with st.expander("Packet Capture", expanded=False):
+            entities = session_entities()
+            if entities:
+                packet_capture(entities)
 
         with st.expander("Network Layer Features", expanded=True):
             tab1, tab2, tab3 = st.tabs(["MAC Tables", "VLANs", "ARP Tables"])
@@ -549,6 +1098,8 @@ def layerSimulation():
             with tab3:
                 arp_management()
 
+    all_entities = session_entities()
+
     if st.sidebar.button("Restore Connections"):
         restore_connections()
         st.sidebar.success("Connections restored!")
@@ -559,212 +1110,106 @@ def layerSimulation():
         # Include all connections for visualization
         visible_connections = st.session_state.connections
         
-        html = visualize_topology(st.session_state.network, visible_connections)
+        link_load = None
+        if st.session_state.get("collect_metrics") and st.checkbox("Link utilization heatmap", key="link_heatmap"):
+            col_a, col_b = st.columns(2)
+            window = col_a.number_input("Window (simulated s)", min_value=0.1, max_value=3600.0, value=10.0, key="heatmap_window")
+            capacity = col_b.number_input("Link Capacity (Mbps)", min_value=0.01, max_value=100000.0, value=10.0, key="heatmap_capacity")
+            load = st.session_state.get('link_load')
+            if load is None:
+                load = st.session_state.link_load = metrics.LinkLoad(clock=st.session_state.sim_clock)
+            load.window = window
+            load.capacity = capacity * 1e6
+            load.sample(all_entities)
+            link_load = load.links()
+            st.caption("Edge width: bytes carried so far. Colour: utilization over the window of simulated time, green idle "
+                       "to red saturated. Only transport and traffic runs (and sends held in egress queues) advance "
+                       "that clock, so links used only by layer 1-3 sends stay grey.")
+        
+        html = visualize_topology(st.session_state.network, visible_connections, link_load=link_load)
         graph_placeholder.empty()  
         st.components.v1.html(html, height=500)  
         
         with st.expander("Message History", expanded=True):
-            layer_messages = st.session_state.messages
-            
-            if layer_messages:
-                for idx, msg in enumerate(reversed(layer_messages)):
-                    st.write(f"**{msg['timestamp']}**: {msg['source']} → {msg['destination']}")
-                    
-                    # Show layer-specific details
-                    if msg['layer'] <= 3:
-                        st.text(f"Data: {msg['data']}")
-                        st.text(f"Path: {' → '.join(msg['path'])}")
-                        st.text(f"Layer: {msg['layer']} ({['Physical', 'Data Link', 'Network'][msg['layer']-1]})")
-                        
-                        if 'source_mac' in msg and 'dest_mac' in msg:
-                            st.text(f"Source MAC: {msg['source_mac']}, Destination MAC: {msg['dest_mac']}")
-                            
-                        if 'source_ip' in msg and 'dest_ip' in msg:
-                            st.text(f"Source IP: {msg['source_ip']}, Destination IP: {msg['dest_ip']}")
-                    else:
-                        # Transport/Application layer messages
-                        st.text(f"Layer: {msg['layer']} ({['Transport', 'Application'][msg['layer']-4]})")
-                        st.text(f"Protocol: {msg.get('protocol', '').upper()}")
-                        st.text(f"Source Port: {msg.get('source_port', '')}")
-                        st.text(f"Dest Port: {msg.get('dest_port', '')}")
-                        st.code(msg['data'])
-                    
-                    if idx < len(layer_messages) - 1:
-                        st.divider()
-            else:
-                st.info("No messages sent yet.")
+            history = cached_snapshot("messages", message_snapshot, st.session_state.messages)
+            paginated_dataframe(history, "history", empty_message="No messages sent yet.")
         
         with st.expander("Network Information", expanded=True):
-            tab1, tab2, tab3 = st.tabs(["End Devices", "Networking Devices", "Routers"])
+            tab1, tab2, tab3, tab4, tab5 = st.tabs(["End Devices", "Networking Devices", "Routers", "Metrics", "Reachability"])
             
             with tab1:
                 st.subheader("End Devices")
                 if st.session_state.devices:
-                    for device_id, device in st.session_state.devices.items():
-                        st.write(f"**Device**: {device_id}")
-                        st.write(f"MAC: {device.mac}")
-                        st.write(f"IP: {device.ip}/{device.subnet_mask}")
-                        
-                        if device.default_gateway:
-                            st.write(f"Default Gateway: {device.default_gateway}")
-                        else:
-                            st.write("Default Gateway: Not set")
-                        
-                        connected_to = [conn_entity.id for conn_entity in device.connected_to]
-                        
-                        if connected_to:
-                            st.write(f"Connected to: {', '.join(connected_to)}")
-                        else:
-                            st.write("Connected to: None")
-                        
-                        # Show ARP table
-                        if hasattr(device, 'arp_table') and device.arp_table:
-                            st.write("**ARP Table:**")
-                            for ip, mac in device.arp_table.items():
-                                st.write(f"IP: {ip} → MAC: {mac}")
-                        
-                        # Show services
-                        if hasattr(device, 'ports') and device.ports:
-                            st.write("**Services:**")
-                            for port_num, port_info in device.ports.items():
-                                st.write(f"Port {port_num}/{port_info['protocol']}: {port_info['service']}")
-                        
-                        # Show received data 
-                        if hasattr(device, 'received_data') and device.received_data:
-                            st.write(f"**Received Data ({len(device.received_data)}):**")
-                            for data in device.received_data:
-                                layer = data.get('layer', 1)
-                                source = data.get('source', 'Unknown')
-                                
-                                if layer == 1:
-                                    st.write(f"Layer 1 data from {source}")
-                                elif layer == 2:
-                                    frame = data.get('frame', {})
-                                    src_mac = frame.get('source_mac', 'Unknown')
-                                    st.write(f"Layer 2 frame from {source} (MAC: {src_mac})")
-                                elif layer == 3:
-                                    packet = data.get('packet', {})
-                                    src_ip = packet.get('source_ip', 'Unknown')
-                                    st.write(f"Layer 3 packet from {source} (IP: {src_ip})")
-                                elif layer >= 4:
-                                    protocol = data.get('protocol', '').upper()
-                                    src_port = data.get('source_port', '')
-                                    st.write(f"Layer {layer} {protocol} data from {source}:{src_port}")
-                        st.divider()
+                    device_tables = cached_snapshot("devices", device_snapshot, st.session_state.devices)
+                    paginated_dataframe(device_tables["devices"], "info_devices")
+                    
+                    st.write("**ARP Tables:**")
+                    paginated_dataframe(device_tables["arp"], "info_arp", empty_message="ARP tables are empty.")
+                    
+                    st.write("**Services:**")
+                    paginated_dataframe(device_tables["services"], "info_services", empty_message="No services assigned.")
+                    
+                    st.write("**Received Data:**")
+                    paginated_dataframe(device_tables["received"], "info_received", empty_message="No data received yet.")
                 else:
                     st.info("No devices added yet.")
             
             with tab2:
-                st.subheader("Hubs")
-                if st.session_state.hubs:
-                    for hub_id, hub in st.session_state.hubs.items():
-                        st.write(f"**Hub**: {hub_id}")
-                        
-                        connected_to = [conn_entity.id for conn_entity in hub.connected_to]
-                        
-                        if connected_to:
-                            st.write(f"Connected to: {', '.join(connected_to)}")
-                        else:
-                            st.write("Connected to: None")
-                        
-                        st.divider()
-                else:
-                    st.info("No hubs added yet.")
-                
-                st.subheader("Switches")
-                if st.session_state.switches:
-                    for switch_id, switch in st.session_state.switches.items():
-                        st.write(f"**Switch**: {switch_id}")
-                        
-                        connected_to = [conn_entity.id for conn_entity in switch.connected_to]
-                        
-                        if connected_to:
-                            st.write(f"Connected to: {', '.join(connected_to)}")
-                        else:
-                            st.write("Connected to: None")
-                        
-                        if hasattr(switch, 'mac_table') and switch.mac_table:
-                            st.write("**MAC Address Table:**")
-                            for mac, port in switch.mac_table.items():
-                                device_name = "Unknown"
-                                for device, port_num in switch.port_table.items():
-                                    if port_num == port:
-                                        device_name = device.id
-                                        break
-                                st.write(f"MAC: {mac} → Port: {port} ({device_name})")
-                        
-                        if hasattr(switch, 'vlan_table') and switch.vlan_table:
-                            st.write("**VLAN Table:**")
-                            for port, vlan in switch.vlan_table.items():
-                                device_name = "Unknown"
-                                for device, port_num in switch.port_table.items():
-                                    if port_num == port:
-                                        device_name = device.id
-                                        break
-                                st.write(f"Port: {port} ({device_name}) → VLAN: {vlan}")
-                        
-                        st.divider()
-                else:
-                    st.info("No switches added yet.")
-                
-                st.subheader("Bridges")
-                if st.session_state.bridges:
-                    for bridge_id, bridge in st.session_state.bridges.items():
-                        st.write(f"**Bridge**: {bridge_id}")
-                
-                        connected_to = [conn_entity.id for conn_entity in bridge.connected_to]
-                        st.write(f"Connected to: {', '.join(connected_to) if connected_to else 'None'}")
-                
-                        if hasattr(bridge, 'mac_table') and bridge.mac_table:
-                            st.write("**MAC Address Table:**")
-                            for mac, port in bridge.mac_table.items():
-                                device_name = "Unknown"
-                                for device, port_num in bridge.port_table.items():
-                                    if port_num == port:
-                                        device_name = device.id
-                                        break
-                                st.write(f"MAC: {mac} → Port: {port} ({device_name})")
-                
-                        st.divider()
+                st.subheader("Hubs, Switches and Bridges")
+                if st.session_state.hubs or st.session_state.switches or st.session_state.bridges:
+                    l2_tables = cached_snapshot("l2", l2_snapshot, st.session_state.hubs,
+                                                st.session_state.switches, st.session_state.bridges)
+                    paginated_dataframe(l2_tables["nodes"], "info_l2")
+                    
+                    st.write("**MAC Address Tables:**")
+                    paginated_dataframe(l2_tables["macs"], "info_macs", empty_message="MAC tables are empty.")
+                    
+                    st.write("**VLAN Tables:**")
+                    paginated_dataframe(l2_tables["vlans"], "info_vlans", empty_message="No VLAN assignments.")
+
+                    if not l2_tables["lags"].empty:
+                        st.write("**Link Aggregation (transmit side):**")
+                        paginated_dataframe(l2_tables["lags"], "info_lags")
                 else:
-                    st.info("No bridges added yet.")
+                    st.info("No hubs, switches or bridges added yet.")
             
             with tab3:
                 st.subheader("Routers")
                 if st.session_state.routers:
-                    for router_id, router in st.session_state.routers.items():
-                        st.write(f"**Router**: {router_id}")
-                        
-                        connected_to = [conn_entity.id for conn_entity in router.connected_to]
-                        st.write(f"Connected to: {', '.join(connected_to) if connected_to else 'None'}")
-                        
-                        # Show interfaces
-                        if hasattr(router, 'interfaces') and router.interfaces:
-                            st.write("**Interfaces:**")
-                            for name, details in router.interfaces.items():
-                                st.write(f"Interface: {name}")
-                                st.write(f"  IP: {details['ip']}")
-                                st.write(f"  MAC: {details['mac']}")
-                                st.write(f"  Subnet: {details['subnet_mask']}")
-                        else:
-                            st.write("No interfaces configured")
-                            
-                        # Show routing table
-                        if hasattr(router, 'routing_table') and router.routing_table:
-                            st.write("**Routing Table:**")
-                            for route in router.routing_table:
-                                if route['network'] == "0.0.0.0" and route['subnet_mask'] == "0.0.0.0":
-                                    st.write(f"Default route → Next Hop: {route['next_hop']}, Interface: {route['interface']}")
-                                else:
-                                    next_hop = route['next_hop'] if route['next_hop'] else "Direct"
-                                    st.write(f"Network: {route['network']}/{route['subnet_mask']} → Next Hop: {next_hop}, Interface: {route['interface']}")
-                        else:
-                            st.write("Routing table is empty")
-                        
-                        st.divider()
+                    router_tables = cached_snapshot("routers", router_snapshot, st.session_state.routers)
+                    paginated_dataframe(router_tables["routers"], "info_routers")
+                    
+                    st.write("**Interfaces:**")
+                    paginated_dataframe(router_tables["interfaces"], "info_interfaces", empty_message="No interfaces configured.")
+                    
+                    st.write("**Routing Tables:**")
+                    paginated_dataframe(router_tables["routes"], "info_routes", empty_message="Routing tables are empty.")
+
+                    if not router_tables["ecmp"].empty:
+                        st.write("**Equal-Cost Multipath Load:**")
+                        paginated_dataframe(router_tables["ecmp"], "info_ecmp")
+
+                    if not router_tables["acls"].empty:
+                        st.write("**Access Lists:**")
+                        paginated_dataframe(router_tables["acls"], "info_acls")
+
+                    if any(router.dhcp for router in st.session_state.routers.values()):
+                        st.write("**DHCP Leases:**")
+                        paginated_dataframe(router_tables["leases"], "info_leases", empty_message="No leases handed out yet.")
+
+                    if any(router.nat is not None for router in st.session_state.routers.values()):
+                        st.write("**NAT Tables:**")
+                        paginated_dataframe(router_tables["nat"], "info_nat", empty_message="No translations yet.")
+                        paginated_dataframe(router_tables["translations"], "info_translations", empty_message="No active translations.")
                 else:
                     st.info("No routers added yet.")
             
+            with tab4:
+                metrics_panel(all_entities)
+            
+            with tab5:
+                reachability_panel(all_entities)
+            
             st.subheader("Network Statistics")
             total_devices = len(st.session_state.devices)
             total_hubs = len(st.session_state.hubs)
@@ -780,33 +1225,13 @@ def layerSimulation():
             st.write(f"Total Routers: {total_routers}")
             st.write(f"Total Connections: {total_connections}")
             
-            # Calculate broadcast domains
-            broadcast_domains = total_switches + total_routers
-            
-            if total_bridges > 0:
-                broadcast_domains += 1
-            
-            if broadcast_domains == 0 and (total_hubs > 0 or total_devices > 0):
-                broadcast_domains = 1  # At least one broadcast domain if devices exist
+            domains = cached_domains(visible_connections, st.session_state.devices.values())
+            broadcast_domains = domains['broadcast_domains']
+            collision_domains = domains['collision_domains']
             
             st.write(f"Total Broadcast Domains: {broadcast_domains}")
-            
-            # Calculate collision domains
-            collision_domains = sum(len([conn for conn in switch.connected_to if not isinstance(conn, Hub)]) 
-                                  for switch in st.session_state.switches.values())
-            collision_domains += sum(len([conn for conn in bridge.connected_to if not isinstance(conn, Hub)]) 
-                                    for bridge in st.session_state.bridges.values())
-            collision_domains += sum(len([conn for conn in router.connected_to if not isinstance(conn, Hub)]) 
-                                    for router in st.session_state.routers.values())
-            collision_domains += total_hubs
-            
-            if collision_domains == 0 and total_devices > 0:
-                collision_domains = 1
-                
             st.write(f"Total Collision Domains: {collision_domains}")
 
     if st.button("Reset Network"):
-        for key in ['network', 'devices', 'hubs', 'switches', 'bridges', 'connections', 'messages', 'routers', 'transport_sim']:
-            if key in st.session_state:
-                del st.session_state[key]
+        reset_network_state()
         st.rerun()
\ No newline at end of file
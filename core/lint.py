@@ -0,0 +1,401 @@
+import re
+import socket
+from bisect import bisect_left, bisect_right, insort
+from core.devices import Entity, EndDevice, Router
+
+DUPLICATE_IP = "duplicate IP"
+DUPLICATE_MAC = "duplicate MAC"
+OVERLAP = "overlapping subnets"
+BAD_GATEWAY = "bad gateway"
+INVALID = "invalid address"
+KINDS = (DUPLICATE_IP, DUPLICATE_MAC, OVERLAP, BAD_GATEWAY, INVALID)
+
+UNASSIGNED = ("", "0.0.0.0")  # What a device holds before DHCP binds it; never a duplicate
+MAC_PATTERN = re.compile(r"^[0-9A-F]{2}(:[0-9A-F]{2}){5}$")
+
+
+def _ip_int(ip):
+    try:
+        return int.from_bytes(socket.inet_aton(ip), 'big') if ip.count(".") == 3 else None
+    except (OSError, TypeError, AttributeError):
+        return None
+
+
+def _mask_length(subnet_mask):
+    """Prefix length of a contiguous mask, or None"""
+    mask = _ip_int(subnet_mask)
+    if mask is None:
+        return None
+    length = bin(mask).count("1")
+    return length if mask == (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF else None
+
+
+def _network(address, length):
+    return address & ((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF)
+
+
+def _normal_mac(mac):
+    return mac.strip().upper().replace("-", ":") if isinstance(mac, str) else None
+
+
+def format_prefix(prefix):
+    network, length = prefix
+    return f"{socket.inet_ntoa(network.to_bytes(4, 'big'))}/{length}"
+
+
+def _name(owner):
+    entity, interface = owner
+    return f"{entity.id} {interface}" if interface else entity.id
+
+
+def _names(owners):
+    return sorted(_name(owner) for owner in owners)
+
+
+class ConfigLinter:
+    """Addressing checks kept up to date as the configuration changes.
+
+    Every address sits in a hashed index: IP -> owners, MAC -> owners,
+    interface subnet -> owners and gateway IP -> hosts using it, where an
+    owner is (entity, interface name or None). Subnets are prefixes, so two
+    overlap only if one contains the other: the interval index is the
+    sorted list of (network, length), in which the prefixes inside one form
+    a contiguous run, plus the set of lengths in use, which finds the
+    prefixes around one in at most 32 hash lookups.
+
+    refresh() looks only at the indexed entities touched since the last run
+    (the linter watches each one it indexes) and, when there are more
+    entities than last time, the ones not indexed yet. It re-indexes those
+    whose addresses changed and re-checks only the index keys they touched,
+    so a mutation costs a few lookups and an imported topology is linted in
+    one linear run. Fewer entities than last time falls back to comparing a
+    cheap signature for every entity. A subnet shared by
+    several routers is normal (the link between them); the same subnet
+    twice on one router, or one subnet inside another, is not.
+    """
+
+    def __init__(self):
+        self.ips = {}  # address int -> {owner}
+        self.macs = {}  # normalized MAC -> {owner}
+        self.subnets = {}  # (network, length) -> {owner}
+        self.starts = []  # sorted keys of self.subnets
+        self.lengths = {}  # prefix length -> number of subnets that long
+        self.gateways = {}  # gateway address int -> {host}
+        self.entries = {}  # entity -> (signature, index keys it holds)
+        self.issues = {}  # issue key -> issue
+        self.overlaps = {}  # prefix -> {overlap issue keys involving it}
+        self.dirty = set()  # Entities touched since the last refresh
+        self.full = True
+        self.count = 0  # Entities passed to the last refresh
+        self.version = None
+        self.stats = {'refreshes': 0, 'full': 0, 'indexed': 0, 'checked': 0}
+
+    def touched(self, entities):
+        self.dirty.update(entities)
+
+    @staticmethod
+    def _signature(entity):
+        if isinstance(entity, EndDevice):
+            return (entity.ip, entity.mac, entity.subnet_mask, entity.default_gateway)
+        if isinstance(entity, Router):
+            return tuple(sorted((name, d['ip'], d['mac'], d['subnet_mask']) for name, d in entity.interfaces.items()))
+        return None
+
+    @staticmethod
+    def _addresses(entity):
+        """(owner, ip, mac, subnet mask) for every address the entity holds"""
+        if isinstance(entity, EndDevice):
+            return [((entity, None), entity.ip, entity.mac, entity.subnet_mask)]
+        return [((entity, name), d['ip'], d['mac'], d['subnet_mask']) for name, d in entity.interfaces.items()]
+
+    # ----- indexing -----
+
+    def _add(self, entity, signature):
+        keys = []
+        for owner, ip, mac, subnet_mask in self._addresses(entity):
+            address = _ip_int(ip)
+            if ip not in UNASSIGNED:
+                if address is None:
+                    self._invalid(keys, owner, f"IP {ip!r} is not a dotted-quad address")
+                else:
+                    self.ips.setdefault(address, set()).add(owner)
+                    keys.append(('ip', address))
+            normal = _normal_mac(mac)
+            if normal and MAC_PATTERN.match(normal):
+                self.macs.setdefault(normal, set()).add(owner)
+                keys.append(('mac', normal))
+            else:
+                self._invalid(keys, owner, f"MAC {mac!r} is not XX:XX:XX:XX:XX:XX")
+            length = _mask_length(subnet_mask)
+            if length is None:
+                self._invalid(keys, owner, f"subnet mask {subnet_mask!r} is not a contiguous mask")
+            elif owner[1] is not None and address is not None:
+                prefix = (_network(address, length), length)
+                owners = self.subnets.setdefault(prefix, set())
+                if not owners:
+                    insort(self.starts, prefix)
+                    self.lengths[length] = self.lengths.get(length, 0) + 1
+                owners.add(owner)
+                keys.append(('subnet', prefix))
+        if isinstance(entity, EndDevice) and entity.default_gateway:
+            gateway = _ip_int(entity.default_gateway)
+            self.gateways.setdefault(gateway, set()).add(entity)
+            keys.append(('gateway', entity, gateway))
+        self.entries[entity] = (signature, keys)
+        entity.watch(self)
+        self.stats['indexed'] += 1
+        return keys
+
+    def _invalid(self, keys, owner, detail):
+        key = ('invalid', owner, detail)
+        self.issues[key] = {'kind': INVALID, 'entities': [_name(owner)], 'detail': f"{_name(owner)}: {detail}"}
+        keys.append(key)
+
+    @staticmethod
+    def _discard(index, key, entity):
+        """Drop the entity's owners under key; True if nothing is left there"""
+        owners = index.get(key)
+        if owners is None:
+            return False
+        owners.difference_update([owner for owner in owners if owner[0] is entity])
+        if not owners:
+            del index[key]
+            return True
+        return False
+
+    def _remove(self, entity):
+        _, keys = self.entries.pop(entity, (None, []))
+        for key in keys:
+            kind = key[0]
+            if kind == 'ip':
+                self._discard(self.ips, key[1], entity)
+            elif kind == 'mac':
+                self._discard(self.macs, key[1], entity)
+            elif kind == 'subnet' and self._discard(self.subnets, key[1], entity):
+                prefix = key[1]
+                del self.starts[bisect_left(self.starts, prefix)]
+                self.lengths[prefix[1]] -= 1
+                if not self.lengths[prefix[1]]:
+                    del self.lengths[prefix[1]]
+            elif kind == 'gateway':
+                hosts = self.gateways[key[2]]
+                hosts.discard(entity)
+                if not hosts:
+                    del self.gateways[key[2]]
+            elif kind == 'invalid':
+                self.issues.pop(key, None)
+        return keys
+
+    # ----- checks -----
+
+    def _recheck(self, keys):
+        hosts = set()
+        for key in keys:
+            kind = key[0]
+            self.stats['checked'] += 1
+            if kind == 'ip':
+                address = key[1]
+                self._duplicate(key, DUPLICATE_IP, socket.inet_ntoa(address.to_bytes(4, 'big')), self.ips.get(address))
+                hosts.update(self.gateways.get(address, ()))  # Their gateway may have appeared or gone
+            elif kind == 'mac':
+                self._duplicate(key, DUPLICATE_MAC, key[1], self.macs.get(key[1]))
+            elif kind == 'subnet':
+                self._overlap_check(key[1])
+            elif kind == 'gateway':
+                hosts.add(key[1])
+        for host in hosts:
+            self._gateway_check(host)
+
+    def _duplicate(self, key, kind, label, owners):
+        if owners and len(owners) > 1:
+            names = _names(owners)
+            self.issues[key] = {'kind': kind, 'entities': names, 'detail': f"{label} is used by {', '.join(names)}"}
+        else:
+            self.issues.pop(key, None)
+
+    def _around(self, prefix):
+        """Existing subnets containing prefix, then those inside it (laminar, so one contiguous run)"""
+        network, length = prefix
+        outer = []
+        for shorter in self.lengths:
+            if shorter < length:
+                candidate = (_network(network, shorter), shorter)
+                if candidate in self.subnets:
+                    outer.append(candidate)
+        inner = []
+        end = network + (1 << (32 - length)) - 1
+        for i in range(bisect_right(self.starts, prefix), len(self.starts)):
+            if self.starts[i][0] > end:
+                break
+            inner.append(self.starts[i])
+        return outer, inner
+
+    def _overlap_check(self, prefix):
+        for key in self.overlaps.pop(prefix, ()):
+            self.issues.pop(key, None)
+            for other in key[1:]:
+                if other != prefix:
+                    self.overlaps.get(other, set()).discard(key)
+        owners = self.subnets.get(prefix)
+        if not owners:
+            return
+        routers = {}
+        for entity, interface in owners:
+            routers.setdefault(entity, []).append(interface)
+        for router, interfaces in routers.items():
+            if len(interfaces) > 1:
+                key = ('overlap', prefix, prefix, router)
+                self.issues[key] = {'kind': OVERLAP, 'entities': [router.id],
+                                    'detail': f"{router.id} has {format_prefix(prefix)} on {', '.join(sorted(interfaces))}"}
+                self.overlaps.setdefault(prefix, set()).add(key)
+        outer, inner = self._around(prefix)
+        for pair in [(o, prefix) for o in outer] + [(prefix, i) for i in inner]:
+            key = ('overlap',) + pair
+            wide, narrow = (_names(self.subnets[p]) for p in pair)
+            self.issues[key] = {'kind': OVERLAP, 'entities': wide + narrow,
+                                'detail': f"{format_prefix(pair[1])} ({', '.join(narrow)}) lies inside "
+                                          f"{format_prefix(pair[0])} ({', '.join(wide)})"}
+            for p in pair:
+                self.overlaps.setdefault(p, set()).add(key)
+
+    def _gateway_check(self, host):
+        key = ('gateway', host)
+        self.issues.pop(key, None)
+        if host not in self.entries or not host.default_gateway:
+            return
+        gateway = _ip_int(host.default_gateway)
+        interfaces = [owner for owner in self.ips.get(gateway, ()) if owner[1] is not None]
+        address, length = _ip_int(host.ip), _mask_length(host.subnet_mask)
+        if gateway is None:
+            detail = f"{host.id}'s gateway {host.default_gateway!r} is not an IP address"
+        elif not interfaces:
+            detail = f"{host.id}'s gateway {host.default_gateway} is not a router interface"
+        elif host.ip not in UNASSIGNED and address is not None and length is not None \
+                and _network(gateway, length) != _network(address, length):
+            detail = f"{host.id}'s gateway {host.default_gateway} is outside {host.ip}/{length}"
+        else:
+            return
+        self.issues[key] = {'kind': BAD_GATEWAY, 'entities': [host.id] + _names(interfaces), 'detail': detail}
+
+    # ----- public -----
+
+    def refresh(self, entities, force=False):
+        """Re-index what changed since the last run; skipped while the topology version stands still"""
+        if not force and self.version == Entity.topology_version:
+            return self
+        self.stats['refreshes'] += 1
+        dirty, full = self.dirty, self.full or force
+        self.dirty, self.full = set(), False
+        entities = entities if isinstance(entities, (list, tuple)) else list(entities)
+        touched = []
+        if full or len(entities) < self.count:
+            self.stats['full'] += 1
+            present = set()
+            for entity in entities:
+                signature = self._signature(entity)
+                if signature is None:
+                    continue
+                present.add(entity)
+                entry = self.entries.get(entity)
+                if entry is None or entry[0] != signature:
+                    touched += self._remove(entity)
+                    touched += self._add(entity, signature)
+            for entity in [e for e in self.entries if e not in present]:
+                touched += self._remove(entity)
+        else:
+            if len(entities) > self.count:  # New entities are not watched until indexed
+                dirty.update(e for e in entities if e not in self.entries)
+            for entity in dirty:
+                signature = self._signature(entity)
+                if self.entries.get(entity, (None,))[0] != signature:
+                    touched += self._remove(entity)
+                    touched += self._add(entity, signature)
+        self.count = len(entities)
+        self._recheck(set(touched))
+        self.version = Entity.topology_version
+        return self
+
+    def conflicts(self, ip, mac, subnet_mask=None, entity=None, interface=None):
+        """Why adding this address would break the configuration; empty if it would not.
+
+        Pass the entity (and interface) it will belong to, so an address being
+        replaced does not conflict with itself.
+        """
+        problems = []
+        address = _ip_int(ip)
+        if address is None:
+            problems.append(f"IP {ip!r} is not a dotted-quad address")
+        else:
+            others = [o for o in self.ips.get(address, ()) if o != (entity, interface)]
+            if others:
+                problems.append(f"IP {ip} is already used by {', '.join(_names(others))}")
+        normal = _normal_mac(mac)
+        if not normal or not MAC_PATTERN.match(normal):
+            problems.append(f"MAC {mac!r} is not XX:XX:XX:XX:XX:XX")
+        else:
+            others = [o for o in self.macs.get(normal, ()) if o != (entity, interface)]
+            if others:
+                problems.append(f"MAC {mac} is already used by {', '.join(_names(others))}")
+        if subnet_mask is not None:
+            length = _mask_length(subnet_mask)
+            if length is None:
+                problems.append(f"subnet mask {subnet_mask!r} is not a contiguous mask")
+            elif interface is not None and address is not None:
+                prefix = (_network(address, length), length)
+                same = [o for o in self.subnets.get(prefix, ()) if o[0] is entity and o[1] != interface]
+                if same:
+                    problems.append(f"{format_prefix(prefix)} is already on {', '.join(_names(same))}")
+                outer, inner = self._around(prefix)
+                for other in outer + inner:
+                    owners = [o for o in self.subnets[other] if o != (entity, interface)]
+                    if owners:
+                        problems.append(f"{format_prefix(prefix)} overlaps {format_prefix(other)} on {', '.join(_names(owners))}")
+        return problems
+
+    def report(self):
+        """Every issue, grouped by kind"""
+        order = {kind: i for i, kind in enumerate(KINDS)}
+        return sorted(self.issues.values(), key=lambda issue: (order[issue['kind']], issue['detail']))
+
+    def summary(self):
+        counts = {kind: 0 for kind in KINDS}
+        for issue in self.issues.values():
+            counts[issue['kind']] += 1
+        return counts
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import time
+
+    # Campus: routers with a /22 LAN each and hosts behind them, plus a few planted mistakes
+    for routers_count, hosts_per_router in ((50, 200), (200, 500), (500, 1000)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            entities = []
+            for r in range(routers_count):
+                router = Router(f"R{r}")
+                router.add_interface("lan", f"10.{r >> 6}.{(r & 63) << 2}.1", f"02:00:00:00:{r >> 8:02X}:{r & 255:02X}", "255.255.252.0")
+                router.add_interface("wan", f"172.16.{r >> 6}.{(r & 63) << 2 | 1}", f"02:00:00:01:{r >> 8:02X}:{r & 255:02X}", "255.255.255.252")
+                entities.append(router)
+                for h in range(hosts_per_router):
+                    host = EndDevice(f"H{r}-{h}", f"02:01:{r >> 8:02X}:{r & 255:02X}:{h >> 8:02X}:{h & 255:02X}",
+                                     f"10.{r >> 6}.{(r & 63) << 2 | (h + 2) >> 8}.{(h + 2) & 255}", "255.255.252.0")
+                    host.set_gateway(f"10.{r >> 6}.{(r & 63) << 2}.1")
+                    entities.append(host)
+            entities[2].ip = entities[3].ip  # Duplicate IP
+            entities[-1].mac = entities[-2].mac  # Duplicate MAC
+            entities[0].add_interface("lab", "10.0.3.250", "02:00:00:02:00:00", "255.255.255.128")  # Inside its own LAN
+            entities[-2].default_gateway = "10.255.255.1"  # Nothing there
+        linter = ConfigLinter()
+        start = time.perf_counter()
+        linter.refresh(entities)
+        bulk = time.perf_counter() - start
+        found = {kind: count for kind, count in linter.summary().items() if count}
+
+        entities[hosts_per_router + 5].set_gateway(entities[0].interfaces['lan']['ip'])  # Another LAN's router
+        start = time.perf_counter()
+        linter.refresh(entities)
+        incremental = time.perf_counter() - start
+        print(f"{routers_count} routers, {len(entities) - routers_count} hosts: bulk lint {bulk:.2f} s, found {found}; "
+              f"one gateway changed: {incremental * 1000:.1f} ms, {linter.summary()[BAD_GATEWAY]} bad gateways now")
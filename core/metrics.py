@@ -0,0 +1,184 @@
+import os
+import time
+from collections import deque
+from collections.abc import Mapping
+from core.codec import WireFrame, WirePacket, ETH_HEADER_SIZE, FCS_SIZE
+from core.fragmentation import packet_size, payload_length
+
+DEFAULT_METRICS_FILE = "protoplay.prom"
+DEFAULT_WINDOW = 10.0  # Seconds of history behind link utilization
+DEFAULT_LINK_CAPACITY = 10e6  # bits/s, matches TransportLayerSimulator's default bottleneck
+
+# name -> help text; every entity gets all of them, unused ones stay at 0
+COUNTERS = {
+    'frames_in': "Frames received",
+    'frames_out': "Frames sent to a neighbour",
+    'bytes_in': "Bytes received",
+    'bytes_out': "Bytes sent to a neighbour",
+    'floods': "Frames flooded out of every eligible port",
+    'mac_learns': "MAC table entries learned or moved",
+    'route_lookups': "Longest-prefix route lookups",
+    'ttl_drops': "Packets dropped because the TTL expired",
+    'no_route_drops': "Packets dropped for lack of a route",
+    'acl_drops': "Packets denied by an access list",
+    'vlan_drops': "Frames whose destination sits on another VLAN",
+    'arp_failures': "Packets dropped because no device answers for the next hop",
+    'checksum_drops': "Wire frames dropped for a bad FCS or checksum",
+}
+
+
+def new_counters():
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters['links'] = {}  # neighbour id -> [frames, bytes] received from it
+    return counters
+
+
+def frame_bytes(data, layer):
+    """Size of a frame on the wire, estimated from dict frames without encoding them"""
+    if isinstance(data, WireFrame):
+        return data.length
+    if layer >= 2 and isinstance(data, Mapping) and 'dest_mac' in data:
+        inner = data.get('data')
+        if isinstance(inner, WirePacket):
+            body = len(inner.raw)
+        elif isinstance(inner, Mapping) and 'dest_ip' in inner:
+            body = packet_size(inner)
+        else:
+            body = payload_length(inner)
+        return ETH_HEADER_SIZE + body + FCS_SIZE
+    return payload_length(data)
+
+
+def enable(entities):
+    """Start counting on these entities; already enabled ones keep their counts"""
+    for entity in entities:
+        if entity.counters is None:
+            entity.counters = new_counters()
+
+
+def disable(entities):
+    for entity in entities:
+        entity.counters = None
+
+
+def reset(entities):
+    for entity in entities:
+        if entity.counters is not None:
+            entity.counters = new_counters()
+
+
+def snapshot(entities):
+    """Copy of every enabled entity's counters.
+
+    Returns {'entities': {id: {'kind', counter: value, ...}},
+             'links': [{'source', 'dest', 'frames', 'bytes'}, ...]}
+    """
+    result = {'entities': {}, 'links': []}
+    for entity in entities:
+        counters = entity.counters
+        if counters is None:
+            continue
+        values = {name: counters[name] for name in COUNTERS}
+        values['kind'] = entity.__class__.__name__
+        result['entities'][entity.id] = values
+        for peer, (frames, size) in counters['links'].items():
+            result['links'].append({'source': peer, 'dest': entity.id, 'frames': frames, 'bytes': size})
+    return result
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(entities, prefix="protoplay"):
+    """Counters in the Prometheus text exposition format"""
+    data = snapshot(entities)
+    lines = []
+    for name, help_text in COUNTERS.items():
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for entity_id, values in data['entities'].items():
+            lines.append(f'{metric}{{entity="{_label(entity_id)}",kind="{values["kind"].lower()}"}} {values[name]}')
+
+    for field in ('frames', 'bytes'):
+        metric = f"{prefix}_link_{field}_total"
+        lines.append(f"# HELP {metric} {field.capitalize()} carried by each link direction")
+        lines.append(f"# TYPE {metric} counter")
+        for link in data['links']:
+            lines.append(f'{metric}{{source="{_label(link["source"])}",dest="{_label(link["dest"])}"}} {link[field]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(entities, path=DEFAULT_METRICS_FILE):
+    """Write the exposition to `path` atomically, as a textfile collector expects"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp = f"{path}.tmp"
+    with open(temp, 'w') as f:
+        f.write(prometheus_text(entities))
+    os.replace(temp, path)
+    return path
+
+
+def link_totals(entities):
+    """Cumulative [frames, bytes] per undirected link, summed from the receivers' counters"""
+    totals = {}
+    for entity in entities:
+        counters = entity.counters
+        if counters is None:
+            continue
+        for peer, (frames, size) in counters['links'].items():
+            link = (peer, entity.id) if peer < entity.id else (entity.id, peer)
+            total = totals.get(link)
+            if total is None:
+                totals[link] = [frames, size]
+            else:
+                total[0] += frames
+                total[1] += size
+    return totals
+
+
+class LinkLoad:
+    """Sliding-window link utilization from periodic samples of the link counters.
+
+    Each sample() stores the cumulative totals with a timestamp from `clock`
+    (a SimClock, so rates are in simulated time) or the wall clock. The rate
+    of a link is the growth between the oldest sample inside `window` and
+    the newest one. Layer 1-3 sends do not advance the simulated clock, so
+    until it moves (transport and traffic runs, queued sends) there is no
+    elapsed time to divide by and the rate is None.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, capacity=DEFAULT_LINK_CAPACITY, clock=None):
+        self.window = window
+        self.capacity = capacity
+        self.clock = clock
+        self.history = deque()  # (time, totals), oldest first
+
+    def sample(self, entities, now=None):
+        if now is None:
+            now = self.clock.now if self.clock is not None else time.monotonic()
+        if len(self.history) > 1 and self.history[-1][0] == now:
+            self.history.pop()  # The clock stood still; the newer totals replace the last sample
+        self.history.append((now, link_totals(entities)))
+        # Keep one sample at or before the window start as the baseline
+        while len(self.history) > 2 and self.history[1][0] <= now - self.window:
+            self.history.popleft()
+
+    def links(self):
+        """{(a, b): {'frames', 'bytes', 'rate_bps', 'utilization'}} for every link that carried traffic"""
+        if not self.history:
+            return {}
+        now, latest = self.history[-1]
+        then, baseline = self.history[0]
+        elapsed = now - then
+        result = {}
+        for link, (frames, size) in latest.items():
+            if elapsed > 0:
+                rate = max(size - baseline.get(link, (0, 0))[1], 0) * 8 / elapsed  # Counters may have been reset
+                utilization = min(rate / self.capacity, 1.0) if self.capacity else 0.0
+            else:
+                rate = utilization = None
+            result[link] = {'frames': frames, 'bytes': size, 'rate_bps': rate, 'utilization': utilization}
+        return result
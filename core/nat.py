@@ -0,0 +1,291 @@
+import time
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from core.devices import Entity
+
+PORT_RANGE = (1024, 65535)  # Public ports handed out per address and protocol
+# Idle timeouts in seconds: RFC 5382 (TCP established, 2 h 4 min), RFC 4787 (UDP, recommended 5 min)
+DEFAULT_TIMEOUTS = {'tcp': 7440.0, 'udp': 300.0, 'ip': 60.0}
+PORT_PROTOCOLS = ('tcp', 'udp')
+ADDRESS_ONLY = 'ip'  # Packets without visible ports: fragments, raw payloads
+
+
+class NatEntry:
+    __slots__ = ('protocol', 'inside_ip', 'inside_port', 'public_ip', 'public_port',
+                 'remote_ip', 'remote_port', 'created', 'last_used', 'packets_out', 'packets_in')
+
+    def __init__(self, key, public_ip, public_port, now):
+        self.protocol, self.inside_ip, self.inside_port, self.remote_ip, self.remote_port = key
+        self.public_ip = public_ip
+        self.public_port = public_port
+        self.created = now
+        self.last_used = now
+        self.packets_out = 0
+        self.packets_in = 0
+
+    @property
+    def key(self):
+        return self.protocol, self.inside_ip, self.inside_port, self.remote_ip, self.remote_port
+
+
+class NatTable:
+    """Source NAT/PAT for the outside interfaces of one Router.
+
+    Each outbound TCP/UDP 5-tuple gets its own public (address, port) from
+    a pool of `addresses` x `ports`; return traffic is accepted only from
+    the remote that mapping was made for. Packets without visible ports
+    (fragments, raw payloads) get an address-only mapping, one inside host
+    per (public address, remote) pair.
+
+    Both directions are single dict lookups. Entries sit in one LRU
+    OrderedDict per protocol, so idle ones are expired from the front as
+    traffic passes, and when a protocol's ports run out the least recently
+    used entry is evicted to make room. `clock` is a SimClock; without one
+    the wall clock is used.
+    """
+
+    def __init__(self, addresses, outside, ports=PORT_RANGE, timeouts=None, clock=None):
+        self.addresses = list(addresses)
+        self.outside = set(outside)  # Interface names
+        self.low, self.high = ports
+        self.span = self.high - self.low + 1
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.clock = clock
+        self.entries = {}  # protocol -> OrderedDict(5-tuple -> NatEntry), least recently used first
+        self.reverse = {}  # (protocol, public_ip, public_port) or (ADDRESS_ONLY, public_ip, remote_ip) -> NatEntry
+        self.free = {}  # protocol -> deque of released (public_ip, public_port)
+        self.cursor = {}  # protocol -> index of the next never-used slot in the pool
+        self.stats = {'outbound': 0, 'inbound': 0, 'created': 0, 'expired': 0, 'evicted': 0,
+                      'exhausted': 0, 'misses': 0, 'filtered': 0}
+
+    def _now(self):
+        return self.clock.now if self.clock is not None else time.monotonic()
+
+    def __len__(self):
+        return len(self.reverse)
+
+    def capacity(self, protocol):
+        """Mappings a port protocol can hold; address-only mappings are limited per remote instead"""
+        return len(self.addresses) * self.span if protocol in PORT_PROTOCOLS else None
+
+    def _release(self, entry):
+        if entry.protocol == ADDRESS_ONLY:
+            del self.reverse[(ADDRESS_ONLY, entry.public_ip, entry.remote_ip)]
+        else:
+            del self.reverse[(entry.protocol, entry.public_ip, entry.public_port)]
+            self.free[entry.protocol].append((entry.public_ip, entry.public_port))
+
+    def expire(self, protocol, now):
+        table = self.entries.get(protocol)
+        if not table:
+            return
+        timeout = self.timeouts.get(protocol, DEFAULT_TIMEOUTS[ADDRESS_ONLY])
+        while table:
+            key, entry = next(iter(table.items()))
+            if entry.last_used + timeout > now:
+                break
+            del table[key]
+            self._release(entry)
+            self.stats['expired'] += 1
+
+    def _evict(self, protocol):
+        key, entry = self.entries[protocol].popitem(last=False)
+        self._release(entry)
+        self.stats['evicted'] += 1
+
+    def _allocate_port(self, protocol):
+        free = self.free.setdefault(protocol, deque())
+        if not free:
+            slot = self.cursor.get(protocol, 0)
+            if slot < self.capacity(protocol):
+                self.cursor[protocol] = slot + 1
+                return self.addresses[slot // self.span], self.low + slot % self.span
+            if not self.entries.get(protocol):
+                return None
+            self._evict(protocol)
+        return free.popleft()
+
+    def _allocate_address(self, remote_ip):
+        for address in self.addresses:
+            if (ADDRESS_ONLY, address, remote_ip) not in self.reverse:
+                return address, None
+        return None
+
+    def _create(self, key, now):
+        protocol = key[0]
+        public = self._allocate_address(key[3]) if protocol == ADDRESS_ONLY else self._allocate_port(protocol)
+        if public is None:
+            self.stats['exhausted'] += 1
+            return None
+        entry = NatEntry(key, public[0], public[1], now)
+        self.entries.setdefault(protocol, OrderedDict())[key] = entry
+        if protocol == ADDRESS_ONLY:
+            self.reverse[(ADDRESS_ONLY, entry.public_ip, entry.remote_ip)] = entry
+        else:
+            self.reverse[(protocol, entry.public_ip, entry.public_port)] = entry
+        self.stats['created'] += 1
+        return entry
+
+    @staticmethod
+    def _ports(packet):
+        segment = packet.get('data')
+        if isinstance(segment, Mapping) and segment.get('protocol') in PORT_PROTOCOLS:
+            return segment
+        return None
+
+    def outbound(self, packet, now=None):
+        """Translated copy of an inside-to-outside packet, or None when no mapping can be made"""
+        if now is None:
+            now = self._now()
+        segment = self._ports(packet)
+        if segment is not None:
+            key = (segment['protocol'], packet['source_ip'], segment['source_port'], packet['dest_ip'], segment['dest_port'])
+        else:
+            key = (ADDRESS_ONLY, packet['source_ip'], None, packet['dest_ip'], None)
+        protocol = key[0]
+        self.expire(protocol, now)
+
+        table = self.entries.get(protocol)
+        entry = table.get(key) if table else None
+        if entry is None:
+            entry = self._create(key, now)
+            if entry is None:
+                return None
+        else:
+            table.move_to_end(key)
+        entry.last_used = now
+        entry.packets_out += 1
+        self.stats['outbound'] += 1
+
+        if segment is None:
+            return dict(packet, source_ip=entry.public_ip)
+        return dict(packet, source_ip=entry.public_ip, data=dict(segment, source_port=entry.public_port))
+
+    def inbound(self, packet, now=None):
+        """Translated copy of a packet sent to a public address, or None if it matches no mapping"""
+        if now is None:
+            now = self._now()
+        segment = self._ports(packet)
+        protocol = segment['protocol'] if segment is not None else ADDRESS_ONLY
+        self.expire(protocol, now)
+        if segment is not None:
+            entry = self.reverse.get((protocol, packet['dest_ip'], segment['dest_port']))
+        else:
+            entry = self.reverse.get((ADDRESS_ONLY, packet['dest_ip'], packet['source_ip']))
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        if entry.remote_ip != packet['source_ip'] or (segment is not None and entry.remote_port != segment['source_port']):
+            self.stats['filtered'] += 1
+            return None
+
+        self.entries[protocol].move_to_end(entry.key)
+        entry.last_used = now
+        entry.packets_in += 1
+        self.stats['inbound'] += 1
+
+        if segment is None:
+            return dict(packet, dest_ip=entry.inside_ip)
+        return dict(packet, dest_ip=entry.inside_ip, data=dict(segment, dest_port=entry.inside_port))
+
+    def occupancy(self):
+        """{protocol: {'entries', 'capacity', 'occupancy'}} for every protocol seen so far"""
+        result = {}
+        for protocol, table in self.entries.items():
+            capacity = self.capacity(protocol)
+            result[protocol] = {'entries': len(table), 'capacity': capacity,
+                                'occupancy': len(table) / capacity if capacity else None}
+        return result
+
+    def clear(self):
+        self.entries = {}
+        self.reverse = {}
+        self.free = {}
+        self.cursor = {}
+
+
+def enable_nat(router, outside, public_ips=None, clock=None, **options):
+    """Translate traffic leaving `router` through the `outside` interface(s).
+
+    The public addresses default to router.public_ip, or else the first
+    outside interface's own address.
+    """
+    outside = [outside] if isinstance(outside, str) else list(outside)
+    if not public_ips:
+        public_ips = [router.public_ip or router.interfaces[outside[0]]['ip']]
+    router.public_ip = public_ips[0]
+    router.nat = NatTable(public_ips, outside, clock=clock, **options)
+    Entity.touch_state()
+    return router.nat
+
+
+def disable_nat(router):
+    router.nat = None
+    router.public_ip = None
+    Entity.touch_state()
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    from core.clock import SimClock
+    from core.devices import EndDevice, Router, TransportLayerSimulator, http_handler
+    from core.transport import udp_datagram
+
+    # Round trip through a NAT router: TCP and UDP replies are addressed to the public mapping and translated back
+    with contextlib.redirect_stdout(io.StringIO()):
+        inside, edge, core_router, server = (EndDevice("Inside", "02:00:00:00:00:01", "10.0.0.2"), Router("Edge"),
+                                             Router("Core"), EndDevice("Server", "02:00:00:00:00:02", "40.0.0.2"))
+        edge.add_interface("lan", "10.0.0.1", "02:00:00:00:01:01")
+        edge.add_interface("wan", "20.0.0.1", "02:00:00:00:01:02")
+        core_router.add_interface("wan", "20.0.0.2", "02:00:00:00:02:01")
+        core_router.add_interface("lan", "40.0.0.1", "02:00:00:00:02:02")
+        edge.connect(inside, "lan")
+        edge.connect(core_router, "wan", "wan")
+        core_router.connect(server, "lan")
+        edge.add_default_route("20.0.0.2", "wan")
+        inside.set_gateway("10.0.0.1")
+        server.set_gateway("40.0.0.1")
+        server.assign_port(80, 'tcp', 'http', http_handler)
+        server.assign_port(7, 'udp', 'echo', lambda request: request)
+        clock = SimClock()
+        table = enable_nat(edge, "wan", clock=clock)
+        sim = TransportLayerSimulator(clock=clock, seed=1)
+        tcp = sim.tcp_request(inside, server, 80, "GET / HTTP/1.1\r\n\r\n")
+        udp = sim.udp_request(inside, server, 7, "ping")
+    assert tcp['delivered'] and tcp['response'].startswith("HTTP/1.1 200"), tcp
+    assert udp['response'] == "ping", udp
+    print(f"NAT round trip: TCP {tcp['response'].splitlines()[0]!r}, UDP echo {udp['response']!r}, "
+          f"{table.stats['outbound']} packets out, {table.stats['inbound']} back in")
+
+    # Translation table throughput at scale: open flows, answer each one, let them idle out
+    payload = udp_datagram(5000, 53, b"x")
+    for flows in (10000, 100000, 300000):
+        table = NatTable(["203.0.113.1", "203.0.113.2", "203.0.113.3", "203.0.113.4", "203.0.113.5"], ["wan"])
+        packets = [{'source_ip': f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 'dest_ip': "198.51.100.7", 'ttl': 64,
+                    'data': dict(payload, source_port=1024 + i % 50000)} for i in range(flows)]
+        start = time.perf_counter()
+        replies = [table.outbound(packet, now=0.0) for packet in packets]
+        opened = time.perf_counter() - start
+
+        replies = [{'source_ip': r['dest_ip'], 'dest_ip': r['source_ip'], 'ttl': 64,
+                    'data': dict(r['data'], source_port=r['data']['dest_port'], dest_port=r['data']['source_port'])}
+                   for r in replies]
+        start = time.perf_counter()
+        back = [table.inbound(reply, now=1.0) for reply in replies]
+        answered = time.perf_counter() - start
+        assert all(b['dest_ip'] == p['source_ip'] and b['data']['dest_port'] == p['data']['source_port']
+                   for b, p in zip(back, packets))
+
+        start = time.perf_counter()
+        for packet in packets:
+            table.outbound(packet, now=2.0)
+        refreshed = time.perf_counter() - start
+        occupancy = table.occupancy()['udp']
+
+        start = time.perf_counter()
+        table.expire('udp', 2.0 + table.timeouts['udp'])
+        expired = time.perf_counter() - start
+        print(f"{flows:>7} flows: new {opened / flows * 1e6:.2f} us, reverse {answered / flows * 1e6:.2f} us, "
+              f"hit {refreshed / flows * 1e6:.2f} us, occupancy {occupancy['occupancy']:.1%}, "
+              f"expire all {expired * 1000:.0f} ms, left {len(table)}")
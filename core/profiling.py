@@ -0,0 +1,173 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+import streamlit as st
+
+DEFAULT_INTERVAL = 0.005  # Seconds between stack samples
+DEFAULT_TOP = 25
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Profiler:
+    """Sampling profile and tracemalloc diff of one run.
+
+    A background thread snapshots the profiled thread's stack every
+    `interval` seconds; stacks are cut at the frame that opened the
+    profiler, so they start at the page function. With `memory` on,
+    tracemalloc snapshots taken before and after show which allocation
+    sites grew. A disabled profiler does nothing.
+    """
+
+    def __init__(self, enabled=True, interval=DEFAULT_INTERVAL, memory=True):
+        self.enabled = enabled
+        self.interval = interval
+        self.memory = memory
+        self.stacks = {}  # (outermost, ..., innermost) -> samples
+        self.samples = 0
+        self.elapsed = 0.0
+        self.memory_before = None
+        self.memory_after = None
+
+    def _sample(self, ident, outer, stop):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                if id(frame) in outer:
+                    break
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        self._started_tracing = False
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self.memory_before = tracemalloc.take_snapshot()
+
+        # Frames that were already running when profiling started
+        self._outer = []
+        frame = sys._getframe(1)
+        while frame is not None:
+            self._outer.append(frame)
+            frame = frame.f_back
+        outer = {id(frame) for frame in self._outer}
+
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), outer, self._stop), daemon=True)
+        self._start = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed = time.perf_counter() - self._start
+        self._outer = []
+        if self.memory:
+            self.memory_after = tracemalloc.take_snapshot()
+            if self._started_tracing:
+                tracemalloc.stop()
+        return False
+
+    def top_functions(self, limit=DEFAULT_TOP):
+        """Rows of {function, cumulative %, self %, est. seconds}, by cumulative time"""
+        cumulative = {}
+        own = {}
+        for stack, count in self.stacks.items():
+            for name in set(stack):  # Recursion counts once per sample
+                cumulative[name] = cumulative.get(name, 0) + count
+            own[stack[-1]] = own.get(stack[-1], 0) + count
+        total = self.samples or 1
+        rows = [{'function': name, 'cumulative %': 100.0 * count / total,
+                 'self %': 100.0 * own.get(name, 0) / total, 'est. seconds': self.elapsed * count / total}
+                for name, count in cumulative.items()]
+        rows.sort(key=lambda row: (-row['cumulative %'], -row['self %']))
+        return rows[:limit]
+
+    def collapsed(self):
+        """Sampled stacks in collapsed format (flamegraph.pl, speedscope, inferno)"""
+        lines = [f"{';'.join(stack)} {count}" for stack, count in sorted(self.stacks.items())]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def memory_growth(self, limit=DEFAULT_TOP):
+        """Allocation sites that grew the most during the run"""
+        if self.memory_before is None or self.memory_after is None:
+            return []
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        before = self.memory_before.filter_traces(ignore)
+        after = self.memory_after.filter_traces(ignore)
+        rows = []
+        for diff in after.compare_to(before, 'lineno'):
+            if diff.size_diff <= 0:
+                continue
+            frame = diff.traceback[0]
+            rows.append({'site': f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                         'grew_kib': diff.size_diff / 1024, 'new_blocks': diff.count_diff,
+                         'total_kib': diff.size / 1024})
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def result(self):
+        return {
+            'elapsed': self.elapsed,
+            'samples': self.samples,
+            'top': self.top_functions(),
+            'collapsed': self.collapsed(),
+            'memory': self.memory_growth(),
+        }
+
+
+def profile_toggle(key):
+    """Checkbox for profiling the next run on a page"""
+    return st.checkbox("Profile this run", key=f"{key}_profiling",
+                       help="Record call times, sampled stacks and memory growth (slows the run down)")
+
+
+@contextmanager
+def profile_run(key):
+    """Profile the enclosed run when the page's toggle is on, then show the result.
+
+    The result stays in the session so show_profile can render it again on
+    later reruns (e.g. after the download button is clicked).
+    """
+    profiler = Profiler(enabled=st.session_state.get(f"{key}_profiling", False))
+    with profiler:
+        yield profiler
+    if profiler.enabled:
+        st.session_state[f"{key}_profile"] = profiler.result()
+        show_profile(key)
+
+
+def show_profile(key):
+    """Render the last saved profile of a page"""
+    result = st.session_state.get(f"{key}_profile")
+    if not result:
+        return
+    with st.container(border=True):  # Not an expander: Send Data already lives inside one
+        st.write("**Profile**")
+        st.caption(f"{result['elapsed']:.3f}s profiled, {result['samples']} stack samples")
+        st.write("Top functions by cumulative time:")
+        st.dataframe(pd.DataFrame(result['top']), hide_index=True, use_container_width=True)
+        if result['memory']:
+            st.write("Memory growth by allocation site:")
+            st.dataframe(pd.DataFrame(result['memory']), hide_index=True, use_container_width=True)
+        if result['collapsed']:
+            st.download_button("Download collapsed stacks", result['collapsed'], file_name=f"{key}.folded",
+                               mime="text/plain", key=f"{key}_profile_download")
@@ -0,0 +1,356 @@
+import heapq
+import itertools
+import random
+from collections import deque
+from collections.abc import Mapping
+from core.codec import WirePacket
+from core.fragmentation import packet_size
+from core.traffic import percentile
+
+DEFAULT_RATE = 1250000  # bytes/s (10 Mbps), TransportLayerSimulator's default bottleneck
+DEFAULT_LIMIT = 64 * 1024  # Buffer bytes per queue (per class for the multi-queue schedulers)
+DEFAULT_CLASS = "default"
+SOJOURN_SAMPLES = 4096  # Reservoir kept per class for percentiles; averages and maxima are exact
+
+# Common DSCP code points
+DSCP = {'BE': 0, 'CS1': 8, 'AF11': 10, 'AF21': 18, 'AF31': 26, 'AF41': 34, 'AF42': 36, 'AF43': 38, 'CS5': 40, 'EF': 46, 'CS6': 48}
+
+# Voice on EF, video on AF4x, scavenger bulk on CS1, everything else best effort
+DEFAULT_RULES = [
+    {'dscp': {46}, 'class': "voice"},
+    {'dscp': {34, 36, 38}, 'class': "video"},
+    {'dscp': {8}, 'class': "bulk"},
+]
+DEFAULT_PRIORITIES = {"voice": 0, "video": 1, DEFAULT_CLASS: 2, "bulk": 3}  # Lower is served first
+DEFAULT_WEIGHTS = {"voice": 8, "video": 4, DEFAULT_CLASS: 2, "bulk": 1}
+
+
+def _size(packet):
+    return len(packet.raw) if isinstance(packet, WirePacket) else packet_size(packet)
+
+
+class Classifier:
+    """Maps a packet to a traffic class name.
+
+    Rules are tried in order; each is a dict with 'class' and any of
+    'dscp', 'protocol', 'source_port', 'dest_port' or 'port' (either
+    direction), given as a value or a set of values. Ports are only known
+    for unfragmented packets, so later fragments fall back to DSCP rules.
+    """
+
+    def __init__(self, rules=None, default=DEFAULT_CLASS):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.default = default
+
+    @staticmethod
+    def _matches(value, wanted):
+        return value in wanted if isinstance(wanted, (set, frozenset, list, tuple)) else value == wanted
+
+    def __call__(self, packet):
+        dscp = packet.get('dscp', 0)
+        segment = packet.get('data')
+        fields = {'dscp': dscp}
+        if isinstance(segment, Mapping):
+            fields['protocol'] = segment.get('protocol')
+            fields['source_port'] = segment.get('source_port')
+            fields['dest_port'] = segment.get('dest_port')
+        for rule in self.rules:
+            matched = True
+            for key, wanted in rule.items():
+                if key == 'class':
+                    continue
+                if key == 'port':
+                    if not (self._matches(fields.get('source_port'), wanted) or self._matches(fields.get('dest_port'), wanted)):
+                        matched = False
+                        break
+                elif key not in fields or not self._matches(fields[key], wanted):
+                    matched = False
+                    break
+            if matched:
+                return rule['class']
+        return self.default
+
+
+# ----- schedulers: enqueue(cls, item, size) -> admitted, dequeue() -> (cls, item) or None -----
+
+class FifoScheduler:
+    """One tail-drop FIFO shared by every class"""
+    name = "FIFO"
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.queue = deque()
+        self.backlog = 0
+
+    def enqueue(self, cls, item, size):
+        if self.backlog + size > self.limit:
+            return False
+        self.queue.append((cls, item, size))
+        self.backlog += size
+        return True
+
+    def dequeue(self):
+        if not self.queue:
+            return None
+        cls, item, size = self.queue.popleft()
+        self.backlog -= size
+        return cls, item
+
+
+class PriorityScheduler:
+    """Strict priority: a class is served only while every higher one is empty"""
+    name = "Strict Priority"
+
+    def __init__(self, priorities=None, limit=DEFAULT_LIMIT):
+        self.priorities = DEFAULT_PRIORITIES if priorities is None else priorities
+        self.limit = limit
+        self.queues = {}  # cls -> deque of (item, size)
+        self.backlog = {}
+        self.order = []
+
+    def _queue(self, cls):
+        queue = self.queues.get(cls)
+        if queue is None:
+            queue = self.queues[cls] = deque()
+            self.backlog[cls] = 0
+            lowest = max(self.priorities.values(), default=0) + 1
+            self.order = sorted(self.queues, key=lambda c: (self.priorities.get(c, lowest), c))
+        return queue
+
+    def enqueue(self, cls, item, size):
+        queue = self._queue(cls)
+        if self.backlog[cls] + size > self.limit:
+            return False
+        queue.append((item, size))
+        self.backlog[cls] += size
+        return True
+
+    def dequeue(self):
+        for cls in self.order:
+            queue = self.queues[cls]
+            if queue:
+                item, size = queue.popleft()
+                self.backlog[cls] -= size
+                return cls, item
+        return None
+
+
+class WfqScheduler:
+    """Weighted fair queuing, self-clocked (SCFQ).
+
+    Each packet gets a virtual finish time max(V, last finish of its class)
+    + size / weight, where V is the finish time of the packet in service;
+    the smallest finish time goes next. Backlogged classes share the link
+    in proportion to their weights.
+    """
+    name = "WFQ"
+
+    def __init__(self, weights=None, limit=DEFAULT_LIMIT):
+        self.weights = DEFAULT_WEIGHTS if weights is None else weights
+        self.limit = limit
+        self.heap = []
+        self.order = itertools.count()
+        self.virtual_time = 0.0
+        self.last_finish = {}
+        self.backlog = {}
+
+    def enqueue(self, cls, item, size):
+        if self.backlog.get(cls, 0) + size > self.limit:
+            return False
+        finish = max(self.virtual_time, self.last_finish.get(cls, 0.0)) + size / self.weights.get(cls, 1)
+        self.last_finish[cls] = finish
+        self.backlog[cls] = self.backlog.get(cls, 0) + size
+        heapq.heappush(self.heap, (finish, next(self.order), cls, item, size))
+        return True
+
+    def dequeue(self):
+        if not self.heap:
+            return None
+        finish, _, cls, item, size = heapq.heappop(self.heap)
+        self.virtual_time = finish
+        self.backlog[cls] -= size
+        return cls, item
+
+
+class RedScheduler(FifoScheduler):
+    """Random early detection on a FIFO (Floyd & Jacobson 1993).
+
+    An EWMA of the backlog (bytes) is kept on each arrival; below `min_th`
+    everything is admitted, above `max_th` everything is dropped, and in
+    between packets are dropped with a probability rising to `max_p`,
+    spread out by the count since the last drop.
+    """
+    name = "RED"
+
+    def __init__(self, limit=DEFAULT_LIMIT, min_th=None, max_th=None, max_p=0.1, weight=0.002, seed=0):
+        super().__init__(limit)
+        self.min_th = limit / 4 if min_th is None else min_th
+        self.max_th = limit * 3 / 4 if max_th is None else max_th
+        self.max_p = max_p
+        self.weight = weight
+        self.average = 0.0
+        self.count = -1
+        self.rng = random.Random(seed)
+        self.early_drops = 0
+
+    def enqueue(self, cls, item, size):
+        self.average += self.weight * (self.backlog - self.average)
+        if self.average >= self.max_th:
+            self.count = 0
+            self.early_drops += 1
+            return False
+        if self.average >= self.min_th:
+            self.count += 1
+            p = self.max_p * (self.average - self.min_th) / (self.max_th - self.min_th)
+            p = p / (1 - self.count * p) if self.count * p < 1 else 1.0
+            if self.rng.random() < p:
+                self.count = 0
+                self.early_drops += 1
+                return False
+        else:
+            self.count = -1
+        return super().enqueue(cls, item, size)
+
+
+SCHEDULERS = {cls.name: cls for cls in (FifoScheduler, PriorityScheduler, WfqScheduler, RedScheduler)}
+
+
+class EgressQueue:
+    """Output queue of one router interface on a SimClock.
+
+    Packets are classified, handed to the scheduler, and sent one at a time
+    at `rate` bytes/s; when a packet finishes serialization, `send(*args)`
+    continues its journey. Per class it records admissions, drops, the
+    time-averaged and peak depth, and sojourn times (enqueue to start of
+    transmission), of which a uniform reservoir of SOJOURN_SAMPLES is kept
+    for the p99.
+    """
+
+    def __init__(self, clock, scheduler=None, rate=DEFAULT_RATE, classifier=None):
+        self.clock = clock
+        self.scheduler = scheduler or FifoScheduler()
+        self.rate = rate
+        self.classifier = classifier or Classifier()
+        self.busy = False
+        self.classes = {}
+        self.rng = random.Random(0)  # Reservoir sampling only
+
+    def _class(self, cls):
+        stats = self.classes.get(cls)
+        if stats is None:
+            stats = self.classes[cls] = {'enqueued': 0, 'sent': 0, 'drops': 0, 'bytes_sent': 0, 'depth': 0,
+                                         'max_depth': 0, 'depth_area': 0.0, 'since': self.clock.now,
+                                         'changed': self.clock.now, 'sojourns': [], 'sojourn_count': 0,
+                                         'sojourn_total': 0.0, 'sojourn_max': 0.0}
+        return stats
+
+    def _depth(self, stats, delta):
+        now = self.clock.now
+        stats['depth_area'] += stats['depth'] * (now - stats['changed'])
+        stats['changed'] = now
+        stats['depth'] += delta
+        stats['max_depth'] = max(stats['max_depth'], stats['depth'])
+
+    def enqueue(self, packet, send, *args):
+        """Queue a packet; False when the scheduler drops it"""
+        cls = self.classifier(packet)
+        stats = self._class(cls)
+        size = _size(packet)
+        if not self.scheduler.enqueue(cls, (self.clock.now, size, send, args), size):
+            stats['drops'] += 1
+            print(f"Egress queue dropped a {size}-byte {cls} packet for {packet.get('dest_ip')}")
+            return False
+        stats['enqueued'] += 1
+        self._depth(stats, 1)
+        if not self.busy:
+            self._next()
+        return True
+
+    def _next(self):
+        entry = self.scheduler.dequeue()
+        if entry is None:
+            self.busy = False
+            return
+        cls, (arrived, size, send, args) = entry
+        stats = self.classes[cls]
+        self._depth(stats, -1)
+        self._sojourn(stats, self.clock.now - arrived)
+        self.busy = True
+        self.clock.schedule(size / self.rate, self._sent, cls, size, send, args)
+
+    def _sojourn(self, stats, sojourn):
+        stats['sojourn_count'] += 1
+        stats['sojourn_total'] += sojourn
+        stats['sojourn_max'] = max(stats['sojourn_max'], sojourn)
+        samples = stats['sojourns']
+        if len(samples) < SOJOURN_SAMPLES:
+            samples.append(sojourn)
+        else:
+            slot = self.rng.randrange(stats['sojourn_count'])
+            if slot < SOJOURN_SAMPLES:
+                samples[slot] = sojourn
+
+    def _sent(self, cls, size, send, args):
+        stats = self.classes[cls]
+        stats['sent'] += 1
+        stats['bytes_sent'] += size
+        send(*args)
+        self._next()
+
+    def report(self):
+        """One row per class"""
+        rows = []
+        now = self.clock.now
+        for cls, stats in sorted(self.classes.items()):
+            sojourns = sorted(stats['sojourns'])
+            offered = stats['enqueued'] + stats['drops']
+            elapsed = now - stats['since']
+            area = stats['depth_area'] + stats['depth'] * (now - stats['changed'])
+            rows.append({
+                'class': cls,
+                'enqueued': stats['enqueued'],
+                'drops': stats['drops'],
+                'drop_rate': stats['drops'] / offered if offered else 0.0,
+                'sent': stats['sent'],
+                'throughput_bps': stats['bytes_sent'] * 8 / elapsed if elapsed > 0 else 0.0,
+                'avg_depth': area / elapsed if elapsed > 0 else 0.0,
+                'max_depth': stats['max_depth'],
+                'sojourn_avg_ms': stats['sojourn_total'] / stats['sojourn_count'] * 1000 if sojourns else None,
+                'sojourn_p99_ms': percentile(sojourns, 99) * 1000 if sojourns else None,
+                'sojourn_max_ms': stats['sojourn_max'] * 1000 if sojourns else None,
+            })
+        return rows
+
+
+def attach_queue(router, interface, clock, scheduler=None, rate=DEFAULT_RATE, classifier=None):
+    """Put an egress queue on one router interface; replaces any existing one"""
+    queue = EgressQueue(clock, scheduler, rate, classifier)
+    router.egress[interface] = queue
+    return queue
+
+
+def detach_queue(router, interface):
+    return router.egress.pop(interface, None) is not None
+
+
+def drain(clock, routers):
+    """Run the clock until no egress queue holds a packet, for sends made outside a transport run.
+
+    Timers due before then (RIP, DHCP) fire as well. Returns the simulated
+    seconds it took; 0 when nothing was queued.
+    """
+    started = clock.now
+    queues = [queue for router in routers for queue in router.egress.values()]
+    while any(queue.busy for queue in queues) and clock.step():
+        pass
+    return clock.now - started
+
+
+def queue_report(routers):
+    """Rows of every egress queue's per-class report, tagged with router and interface"""
+    rows = []
+    for router in routers:
+        for interface, queue in router.egress.items():
+            for row in queue.report():
+                rows.append({'router': router.id, 'interface': interface, 'scheduler': queue.scheduler.name, **row})
+    return rows
@@ -0,0 +1,303 @@
+import socket
+from bisect import bisect_left, bisect_right
+import streamlit as st
+from core.devices import Entity, EndDevice, Router
+from core.domains import UnionFind, _attachment
+
+LAYERS = ("l2", "l3")
+
+
+def _ip_int(ip):
+    try:
+        return int.from_bytes(socket.inet_aton(ip), 'big')
+    except (OSError, TypeError):
+        return None
+
+
+def _prefix(network, subnet_mask):
+    mask = _ip_int(subnet_mask) or 0
+    return (_ip_int(network) or 0) & mask, mask
+
+
+def _route_order(route):
+    """Longest prefix first; each prefix's routes stay together, in table order"""
+    network, mask = _prefix(route['network'], route['subnet_mask'])
+    return -bin(mask).count("1"), network
+
+
+def _broadcast_domains(entities):
+    """{attachment node: domain root}, built from the links like core.domains"""
+    domains = UnionFind()
+    for entity in entities:
+        if isinstance(entity, EndDevice):
+            domains.add((entity.id,))
+        for peer in entity.connected_to:
+            a, b = _attachment(entity, peer), _attachment(peer, entity)
+            domains.add(a)
+            domains.add(b)
+            domains.union(a, b)
+    return domains
+
+
+class Reachability:
+    """Host-to-host reachability computed from the configuration alone.
+
+    Hosts are numbered in address order, so every prefix covers a
+    contiguous run of host bits and a set of hosts is a Python int.
+
+    L2: hosts in the same broadcast domain (VLAN-split, router-bounded, as
+    in core.domains) reach each other.
+
+    L3: a host reaches hosts in its own subnet over L2 and everything else
+    through its default gateway. Each router's delivery set is the least
+    fixpoint of
+        deliver[R] = OR over routes of (hosts the route wins by longest
+                     prefix) AND (hosts on the connected segment, or
+                     deliver[next-hop router])
+    iterated with bitset ANDs/ORs until nothing changes, so routing loops
+    and blackholes simply never gain bits. Equal-cost routes count if any
+    of them delivers. Access lists and NAT are not considered.
+    """
+
+    def __init__(self, entities):
+        entities = list(entities)
+        self.hosts = sorted((e for e in entities if isinstance(e, EndDevice)), key=lambda h: (_ip_int(h.ip) or 0, h.id))
+        self.index = {host.id: i for i, host in enumerate(self.hosts)}
+        self.routers = [e for e in entities if isinstance(e, Router)]
+        self.addresses = [_ip_int(host.ip) for host in self.hosts]
+        self._sorted = [a if a is not None else -1 for a in self.addresses]
+        self.iterations = 0
+
+        domains = _broadcast_domains(entities)
+        self.domain_bits = {}
+        self.host_domain = []
+        for i, host in enumerate(self.hosts):
+            root = domains.find((host.id,))
+            self.host_domain.append(root)
+            self.domain_bits[root] = self.domain_bits.get(root, 0) | (1 << i)
+
+        # Router interface addresses by broadcast domain, to resolve gateways and next hops
+        self.interface_domain = {}
+        owners = {}  # (domain root, ip) -> router
+        for router in self.routers:
+            for name, details in router.interfaces.items():
+                node = (router.id, 'interface', name)
+                if node in domains.parent:
+                    root = domains.find(node)
+                    self.interface_domain[(router, name)] = root
+                    owners[(root, details['ip'])] = router
+        self._owners = owners
+
+        self.deliver = self._propagate()
+        self.l2 = [self.domain_bits[self.host_domain[i]] for i in range(len(self.hosts))]
+        self.l3 = [self._l3_row(i) for i in range(len(self.hosts))]
+
+    def range_bits(self, network, mask):
+        """Bits of the hosts whose address falls in network/mask"""
+        size = (~mask & 0xFFFFFFFF) + 1
+        low = bisect_left(self._sorted, network)
+        high = bisect_right(self._sorted, network + size - 1)
+        return ((1 << (high - low)) - 1) << low
+
+    def _next_router(self, router, route):
+        interface = route['interface']
+        next_hop = route['next_hop']
+        for entity, name in router.port_table.items():
+            if name == interface and isinstance(entity, Router) and entity.has_ip(next_hop):
+                return entity
+        root = self.interface_domain.get((router, interface))
+        return self._owners.get((root, next_hop))
+
+    def _propagate(self):
+        terms = {}  # router -> [(matched bits, segment bits or None, next router or None)]
+        for router in self.routers:
+            claimed = 0
+            router_terms = []
+            routes = sorted(router.routing_table, key=_route_order)
+            group = None
+            group_claim = 0
+            for route in routes:
+                network, mask = _prefix(route['network'], route['subnet_mask'])
+                if (network, mask) != group:
+                    claimed |= group_claim
+                    group = (network, mask)
+                    group_claim = 0
+                    ecmp = route.get('ecmp')  # Later routes for the prefix are used only as its ECMP group
+                elif not (ecmp and route.get('ecmp')):
+                    continue
+                matched = self.range_bits(network, mask) & ~claimed
+                group_claim |= matched
+                if not matched:
+                    continue
+                if not route['next_hop']:
+                    root = self.interface_domain.get((router, route['interface']))
+                    router_terms.append((matched, self.domain_bits.get(root, 0), None))
+                else:
+                    router_terms.append((matched, None, self._next_router(router, route)))
+            terms[router] = router_terms
+
+        deliver = {router: 0 for router in self.routers}
+        changed = True
+        self.iterations = 0
+        while changed:
+            changed = False
+            self.iterations += 1
+            for router in self.routers:
+                bits = 0
+                for matched, segment, peer in terms[router]:
+                    if segment is not None:
+                        bits |= matched & segment
+                    elif peer is not None:
+                        bits |= matched & deliver.get(peer, 0)
+                if bits != deliver[router]:
+                    deliver[router] = bits
+                    changed = True
+        return deliver
+
+    def gateway_of(self, host):
+        """Router owning the host's default gateway address on its segment, or None"""
+        if not host.default_gateway:
+            return None
+        return self._owners.get((self.host_domain[self.index[host.id]], host.default_gateway))
+
+    def _l3_row(self, i):
+        host = self.hosts[i]
+        if self.addresses[i] is None or host.ip == "0.0.0.0":
+            return 0
+        network, mask = _prefix(host.ip, host.subnet_mask)
+        local = self.range_bits(network, mask)
+        row = self.domain_bits[self.host_domain[i]] & local
+        gateway = self.gateway_of(host)
+        if gateway is not None:
+            row |= self.deliver[gateway] & ~local
+        return row
+
+    def reachable(self, source, dest, layer="l3"):
+        row = getattr(self, layer)[self.index[source.id]]
+        return bool(row >> self.index[dest.id] & 1)
+
+    def row(self, host, layer="l3"):
+        """Hosts reachable from one host"""
+        bits = getattr(self, layer)[self.index[host.id]]
+        return [self.hosts[i] for i in range(len(self.hosts)) if bits >> i & 1]
+
+    def summary(self, layer="l3"):
+        rows = getattr(self, layer)
+        n = len(self.hosts)
+        reachable = sum((bits & ~(1 << i)).bit_count() for i, bits in enumerate(rows))
+        isolated = sum(1 for i, bits in enumerate(rows) if not bits & ~(1 << i))
+        pairs = n * (n - 1)  # Ordered pairs of distinct hosts
+        return {'hosts': n, 'pairs': pairs, 'reachable': reachable, 'ratio': reachable / pairs if pairs else 0.0,
+                'isolated': isolated}
+
+    @staticmethod
+    def _lookup(router, ip):
+        address = _ip_int(ip)
+        best, best_mask = None, -1
+        for route in router.routing_table:
+            network, mask = _prefix(route['network'], route['subnet_mask'])
+            if address & mask == network and mask > best_mask:
+                best, best_mask = route, mask
+        return best
+
+    def explain(self, source, dest, layer="l3"):
+        """Why source does not reach dest, or None if it does"""
+        if self.reachable(source, dest, layer):
+            return None
+        i = self.index[source.id]
+        same_domain = self.host_domain[i] == self.host_domain[self.index[dest.id]]
+        if layer == "l2":
+            return "different broadcast domain"
+        if self.addresses[i] is None or source.ip == "0.0.0.0":
+            return f"{source.id} has no address"
+        network, mask = _prefix(source.ip, source.subnet_mask)
+        if (_ip_int(dest.ip) or 0) & mask == network:
+            return "same subnet, different broadcast domain" if not same_domain else "unreachable"
+        if not source.default_gateway:
+            return f"{source.id} has no default gateway"
+        router = self.gateway_of(source)
+        if router is None:
+            return f"gateway {source.default_gateway} is not on {source.id}'s segment"
+        seen = set()
+        while router is not None:
+            if router in seen:
+                return f"routing loop through {router.id}"
+            seen.add(router)
+            route = self._lookup(router, dest.ip)
+            if route is None:
+                return f"no route to {dest.ip} at {router.id}"
+            if not route['next_hop']:
+                return f"{dest.ip} is not on {router.id} {route['interface']}'s segment"
+            peer = self._next_router(router, route)
+            if peer is None:
+                return f"next hop {route['next_hop']} unresolved at {router.id}"
+            router = peer
+        return "unreachable"
+
+    def unreachable_pairs(self, layer="l3", limit=None):
+        """(source, dest) pairs of distinct hosts that do not reach, in host order"""
+        pairs = []
+        rows = getattr(self, layer)
+        n = len(self.hosts)
+        full = (1 << n) - 1
+        for i, bits in enumerate(rows):
+            missing = full & ~bits & ~(1 << i)
+            while missing:
+                low = missing & -missing
+                pairs.append((self.hosts[i], self.hosts[low.bit_length() - 1]))
+                if limit is not None and len(pairs) >= limit:
+                    return pairs
+                missing ^= low
+        return pairs
+
+
+def cached_reachability(entities):
+    """Reachability, recomputed only when the topology version or the entity set changes; kept per session"""
+    entities = list(entities)
+    key = (Entity.topology_version, len(entities), id(entities[0]) if entities else None)
+    entry = st.session_state.get('reachability_cache')
+    if entry is None or entry[0] != key:
+        entry = st.session_state.reachability_cache = (key, Reachability(entities))
+    return entry[1]
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import time
+    from core.devices import Switch
+
+    # Campus: a core router chain, each router with access switches of hosts
+    for routers_count, hosts_per_router in ((10, 200), (40, 50), (20, 500)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            routers = []
+            entities = []
+            for r in range(routers_count):
+                router = Router(f"R{r}")
+                router.add_interface("lan", f"10.{r}.0.1", f"02:00:00:00:{r:02X}:01", "255.255.0.0")
+                if r:
+                    router.add_interface("up", f"172.16.{r}.2", f"02:00:00:00:{r:02X}:02", "255.255.255.252")
+                    parent = routers[r - 1]
+                    parent.add_interface(f"down{r}", f"172.16.{r}.1", f"02:00:00:01:{r:02X}:01", "255.255.255.252")
+                    router.connect(parent, "up", f"down{r}")
+                    router.add_default_route(f"172.16.{r}.1", "up")
+                routers.append(router)
+                switch = Switch(f"S{r}")
+                router.connect(switch, "lan")
+                switch.port_table[router] = len(switch.port_table)
+                entities += [router, switch]
+                for h in range(hosts_per_router):
+                    host = EndDevice(f"H{r}-{h}", f"02:01:00:{r:02X}:{h >> 8:02X}:{h & 255:02X}", f"10.{r}.{(h >> 8) + 1}.{h & 255}", "255.255.0.0")
+                    host.set_gateway(f"10.{r}.0.1")
+                    switch.connect(host)
+                    entities.append(host)
+            # Each parent routes to its subtree (everything further down the chain)
+            for r in range(1, routers_count):
+                for below in range(r, routers_count):
+                    routers[r - 1].add_route(f"10.{below}.0.0", "255.255.0.0", f"172.16.{r}.2", f"down{r}")
+        start = time.perf_counter()
+        result = Reachability(entities)
+        elapsed = time.perf_counter() - start
+        summary = result.summary()
+        print(f"{routers_count} routers, {len(result.hosts)} hosts: {elapsed:.2f} s, {result.iterations} iterations, "
+              f"{summary['reachable']}/{summary['pairs']} pairs reachable")
@@ -0,0 +1,418 @@
+import random
+from core.clock import SimClock
+from core.devices import Entity
+from core.routing import router_graph
+from pyRIP.pyrip_lib import (RipPacket, RipRoute, IP2Int, Int2IP, MaskInt2PrefixLen, PrefixLen2MaskInt,
+                             RIP_COMMAND_REQUEST, RIP_COMMAND_RESPONSE, RIP_METRIC_INFINITY, RIP_MAX_ROUTE_ENTRY,
+                             RIP_DEFAULT_UPDATE, RIP_DEFAULT_TIMEOUT, RIP_DEFAULT_GARBAGE, RIP_DEFAULT_JITTER_SCALE)
+
+DEFAULT_LINK_DELAY = 0.005  # Seconds for a RIP message to cross one link, as TransportLayerSimulator's hop_delay
+TRIGGER_DELAY = (1.0, 5.0)  # RFC 2453 3.10.1: triggered updates wait a random 1-5 s
+
+
+def _prefix(network, subnet_mask):
+    return IP2Int(network), MaskInt2PrefixLen(IP2Int(subnet_mask))
+
+
+class RipProcess:
+    """RIPv2 on one simulated Router.
+
+    Keeps the RIP table {(prefix int, prefix length): entry}, answers
+    requests, applies responses (RFC 2453 3.9.2) and installs the learned
+    routes into router.routing_table. Connected subnets are originated with
+    metric 1; routes the router already has from elsewhere (connected or
+    static) are never overridden.
+    """
+
+    def __init__(self, domain, router):
+        self.domain = domain
+        self.router = router
+        self.table = {}
+        self.trigger = None
+        self.update_timer = None
+        self.stats = {'sent': 0, 'received': 0, 'bytes_sent': 0, 'triggered_updates': 0}
+
+    def _other_routes(self):
+        ours = {id(entry['route']) for entry in self.table.values() if entry['route'] is not None}
+        return {_prefix(route['network'], route['subnet_mask']) for route in self.router.routing_table
+                if id(route) not in ours}
+
+    def originate(self):
+        """(Re)read the connected subnets; called at start and when interfaces change"""
+        connected = {}
+        for name, details in self.router.interfaces.items():
+            network = self.router._get_network(details['ip'], details['subnet_mask'])
+            connected[_prefix(network, details['subnet_mask'])] = name
+
+        for key, entry in list(self.table.items()):
+            if entry['next_hop'] is None and key not in connected:
+                self._poison(key, entry)  # Interface went away
+        for key, name in connected.items():
+            entry = self.table.get(key)
+            if entry is None or entry['next_hop'] is not None:
+                if entry is not None:
+                    self._uninstall(entry)
+                self.table[key] = {'metric': 1, 'next_hop': None, 'interface': name, 'expires': None,
+                                   'garbage': None, 'changed': True, 'route': None}
+                self.domain._route_changed(self)
+
+    def drop_lost_neighbours(self):
+        """Poison routes through neighbours that are no longer linked, as on a link-down event"""
+        reachable = {(interface, IP2Int(neighbour.interfaces[their_interface]['ip']))
+                     for interface, peers in self.domain.links.get(self.router, {}).items()
+                     for neighbour, their_interface, our_ip, cost in peers}
+        for key, entry in list(self.table.items()):
+            if entry['next_hop'] is not None and entry['metric'] < RIP_METRIC_INFINITY \
+                    and (entry['interface'], entry['next_hop']) not in reachable:
+                self._poison(key, entry)
+
+    # ----- route installation -----
+
+    def _install(self, key, entry):
+        own = self.domain.version == Entity.topology_version
+        prefix, length = key
+        network, mask = Int2IP(prefix), Int2IP(PrefixLen2MaskInt(length))
+        route = entry['route']
+        if route is None:
+            self.router.add_route(network, mask, Int2IP(entry['next_hop']), entry['interface'])
+            entry['route'] = self.router.routing_table[-1]
+        else:
+            route['next_hop'] = Int2IP(entry['next_hop'])
+            route['interface'] = entry['interface']
+            Entity.touch_topology(self.router)
+        if own:
+            self.domain.version = Entity.topology_version  # Our own route installs are not topology changes
+
+    def _uninstall(self, entry):
+        route = entry['route']
+        if route is not None:
+            own = self.domain.version == Entity.topology_version
+            self.router.routing_table[:] = [r for r in self.router.routing_table if r is not route]
+            entry['route'] = None
+            Entity.touch_topology(self.router)
+            if own:
+                self.domain.version = Entity.topology_version
+
+    # ----- timers -----
+
+    def _arm_timeout(self, key, entry):
+        entry['expires'] = self.domain.clock.now + self.domain.timeout
+        if not entry.get('timer'):
+            entry['timer'] = True
+            self.domain.clock.schedule(self.domain.timeout, self._check_timeout, key, entry)
+
+    def _check_timeout(self, key, entry):
+        # One pending check per route; refreshes just move 'expires' forward
+        entry['timer'] = False
+        if self.table.get(key) is not entry or entry['garbage'] is not None or entry['expires'] is None:
+            return
+        now = self.domain.clock.now
+        if now < entry['expires']:
+            entry['timer'] = True
+            self.domain.clock.schedule(entry['expires'] - now, self._check_timeout, key, entry)
+        else:
+            print(f"RIP {self.router.id}: route {Int2IP(key[0])}/{key[1]} timed out")
+            self._poison(key, entry)
+
+    def _poison(self, key, entry):
+        """Start deleting a route: advertise it as unreachable until garbage collection"""
+        entry['metric'] = RIP_METRIC_INFINITY
+        entry['changed'] = True
+        self._uninstall(entry)
+        if entry['garbage'] is None:
+            entry['garbage'] = self.domain.clock.schedule(self.domain.garbage, self._collect, key, entry)
+        self.domain._route_changed(self)
+
+    def _collect(self, key, entry):
+        if self.table.get(key) is entry and entry['metric'] >= RIP_METRIC_INFINITY:
+            del self.table[key]
+
+    # ----- sending -----
+
+    def _packets(self, entries, interface):
+        packets = []
+        packet = None
+        for key, entry in entries:
+            metric = entry['metric']
+            if entry['next_hop'] is not None and entry['interface'] == interface and self.domain.split_horizon:
+                if not self.domain.poison_reverse:
+                    continue
+                metric = RIP_METRIC_INFINITY
+            if packet is None or len(packet.entry) >= RIP_MAX_ROUTE_ENTRY:
+                packet = RipPacket(RIP_COMMAND_RESPONSE)
+                packets.append(packet)
+            packet.entry.append(RipRoute(key[0], key[1], 0, metric))
+        return [packet.pack() for packet in packets]
+
+    def send_update(self, changed_only=False, neighbours=None):
+        """Send the table (or only changed routes) out of every interface with RIP neighbours"""
+        self.domain._check_topology()
+        entries = [(key, entry) for key, entry in self.table.items() if entry['changed'] or not changed_only]
+        for interface, peers in self.domain.links.get(self.router, {}).items():
+            if neighbours is not None:
+                peers = [peer for peer in peers if peer[0] in neighbours]
+            if not peers:
+                continue
+            for data in self._packets(entries, interface):
+                for peer in peers:
+                    self.domain._deliver(self, peer, data)
+        if neighbours is None:
+            for key, entry in entries:
+                entry['changed'] = False
+
+    def request(self):
+        """Ask every neighbour for its whole table (RFC 2453 3.9.1)"""
+        packet = RipPacket(RIP_COMMAND_REQUEST)
+        packet.entry.append(RipRoute(0, 0, 0, RIP_METRIC_INFINITY, family=0))
+        data = packet.pack()
+        for interface, peers in self.domain.links.get(self.router, {}).items():
+            for peer in peers:
+                self.domain._deliver(self, peer, data)
+
+    def _periodic(self):
+        self.send_update()
+        self.update_timer = self.domain.clock.schedule(self.domain._interval(), self._periodic)
+
+    def _triggered(self):
+        self.trigger = None
+        self.stats['triggered_updates'] += 1
+        self.send_update(changed_only=True)
+
+    def schedule_trigger(self):
+        if self.trigger is None and self.update_timer is not None:
+            self.trigger = self.domain.clock.schedule(self.domain.rng.uniform(*TRIGGER_DELAY), self._triggered)
+
+    # ----- receiving -----
+
+    def receive(self, data, sender, interface, sender_ip, cost):
+        self.stats['received'] += 1
+        packet = RipPacket.unpack(data)
+        if packet.command == RIP_COMMAND_REQUEST:
+            self.send_update(neighbours={sender})
+            return
+
+        source = IP2Int(sender_ip)
+        other = None
+        for route in packet.entry:
+            key = (route.prefix, route.prefixLen)
+            metric = min(route.metric + cost, RIP_METRIC_INFINITY)
+            entry = self.table.get(key)
+            if entry is not None and entry['next_hop'] is None:
+                continue  # Connected
+            if entry is None:
+                if metric >= RIP_METRIC_INFINITY:
+                    continue
+                if other is None:
+                    other = self._other_routes()
+                if key in other:
+                    continue  # Static or connected route of the router itself
+                entry = self.table[key] = {'metric': metric, 'next_hop': source, 'interface': interface,
+                                           'expires': None, 'garbage': None, 'changed': True, 'route': None}
+                self._arm_timeout(key, entry)
+                self._install(key, entry)
+                self.domain._route_changed(self)
+            elif entry['next_hop'] == source:
+                if metric < RIP_METRIC_INFINITY:
+                    self._arm_timeout(key, entry)
+                if metric == entry['metric']:
+                    continue
+                if metric >= RIP_METRIC_INFINITY:
+                    self._poison(key, entry)
+                    continue
+                if entry['garbage'] is not None:
+                    entry['garbage'].cancel()
+                    entry['garbage'] = None
+                entry['metric'] = metric
+                entry['changed'] = True
+                self._install(key, entry)
+                self.domain._route_changed(self)
+            elif metric < entry['metric']:
+                if entry['garbage'] is not None:
+                    entry['garbage'].cancel()
+                    entry['garbage'] = None
+                entry.update(metric=metric, next_hop=source, interface=interface, changed=True)
+                self._arm_timeout(key, entry)
+                self._install(key, entry)
+                self.domain._route_changed(self)
+
+    def stop(self):
+        for timer in (self.update_timer, self.trigger):
+            if timer is not None:
+                timer.cancel()
+        self.update_timer = self.trigger = None
+        for entry in self.table.values():
+            if entry['garbage'] is not None:
+                entry['garbage'].cancel()
+            entry['expires'] = None
+            self._uninstall(entry)
+        self.table = {}
+
+
+class RipDomain:
+    """RIPv2 running on a set of Routers over a SimClock.
+
+    Messages are the real RIPv2 encoding (pyRIP's RipPacket/RipRoute) and
+    travel between neighbouring routers (see core.routing.router_graph)
+    after `link_delay` virtual seconds. Periodic updates are jittered,
+    route changes send triggered updates, split horizon with poison
+    reverse is on by default, and routes time out and are garbage
+    collected as in RFC 2453. Changes to links or interfaces are picked up
+    at the next update.
+    """
+
+    def __init__(self, routers, clock=None, update_interval=RIP_DEFAULT_UPDATE, timeout=RIP_DEFAULT_TIMEOUT,
+                 garbage=RIP_DEFAULT_GARBAGE, link_delay=DEFAULT_LINK_DELAY, split_horizon=True,
+                 poison_reverse=True, seed=0):
+        self.routers = list(routers)
+        self.clock = clock or SimClock()
+        self.update_interval = update_interval
+        self.timeout = timeout
+        self.garbage = garbage
+        self.link_delay = link_delay
+        self.split_horizon = split_horizon
+        self.poison_reverse = poison_reverse
+        self.rng = random.Random(seed)
+        self.processes = {router: RipProcess(self, router) for router in self.routers}
+        self.links = {}  # router -> {interface: [(neighbour, its interface, our ip, cost)]}
+        self.version = None
+        self.started = None
+        self.last_change = None
+        self.stats = {'messages': 0, 'bytes': 0, 'route_changes': 0}
+        self.stats_at_change = dict(self.stats)
+        self.baseline = dict(self.stats)  # Totals when the current measurement began
+
+    def _interval(self):
+        jitter = self.update_interval * RIP_DEFAULT_JITTER_SCALE
+        return self.update_interval + self.rng.uniform(-jitter, jitter)
+
+    def _check_topology(self):
+        if self.version != Entity.topology_version:
+            self.refresh()
+
+    def refresh(self):
+        """Re-read links and interfaces after the topology changed"""
+        adjacency, prefixes = router_graph(self.routers)
+        links = {}
+        for router, neighbours in adjacency.items():
+            for neighbour, cost, interface, next_hop in neighbours:
+                our_ip = router.interfaces[interface]['ip']
+                # The neighbour's side of the link is its entry pointing back at our address
+                for back, back_cost, back_interface, back_ip in adjacency.get(neighbour, ()):
+                    if back is router and back_ip == our_ip:
+                        links.setdefault(router, {}).setdefault(interface, []).append((neighbour, back_interface, our_ip, back_cost))
+        self.links = links
+        if self.started is not None:
+            for process in self.processes.values():
+                process.originate()
+                process.drop_lost_neighbours()
+        self.version = Entity.topology_version
+
+    def _deliver(self, process, peer, data):
+        neighbour, interface, sender_ip, cost = peer
+        self.stats['messages'] += 1
+        self.stats['bytes'] += len(data)
+        process.stats['sent'] += 1
+        process.stats['bytes_sent'] += len(data)
+        target = self.processes.get(neighbour)
+        if target is not None:
+            self.clock.schedule(self.link_delay, target.receive, data, process.router, interface, sender_ip, cost)
+
+    def _route_changed(self, process):
+        self.stats['route_changes'] += 1
+        self.last_change = self.clock.now
+        self.stats_at_change = dict(self.stats)
+        process.schedule_trigger()
+
+    def start(self):
+        """Originate connected routes, ask the neighbours for theirs and start the update timers"""
+        self.started = self.clock.now
+        self.refresh()
+        for process in self.processes.values():
+            process.originate()
+        for process in self.processes.values():
+            process.update_timer = self.clock.schedule(self.rng.uniform(0, self.update_interval), process._periodic)
+            process.request()
+        self.version = Entity.topology_version
+
+    def stop(self):
+        """Stop every process and withdraw the routes RIP installed"""
+        for process in self.processes.values():
+            process.stop()
+
+    def run(self, duration):
+        self.clock.run(until=self.clock.now + duration)
+
+    def converge(self, max_time=3600.0, quiet=None):
+        """Run until no route changed for `quiet` seconds, or `max_time` passed.
+
+        The default quiet period outlasts the route timeout, so a stale
+        route would have expired before convergence is declared. Returns
+        report(); converged is False when max_time ran out first.
+        """
+        if self.started is None:
+            self.start()
+        begin = self.clock.now
+        self.baseline = dict(self.stats)
+        if quiet is None:
+            quiet = self.timeout + self.update_interval * (1 + RIP_DEFAULT_JITTER_SCALE)
+        converged = False
+        while self.clock.now - begin < max_time:
+            self.clock.run(until=min(self.clock.now + self.update_interval, begin + max_time))
+            since = self.last_change if self.last_change is not None else self.started
+            if self.clock.now - since >= quiet:
+                converged = True
+                break
+        return self.report(converged, begin)
+
+    def report(self, converged=None, since=None):
+        """Convergence time and message counts since `since` (default: start)"""
+        since = self.started if since is None else since
+        last = self.last_change if self.last_change is not None and self.last_change >= since else since
+        at_change = self.stats_at_change if last > since else self.baseline
+        return {
+            'converged': converged,
+            'convergence_time': last - since,
+            'messages_to_converge': at_change['messages'] - self.baseline['messages'],
+            'bytes_to_converge': at_change['bytes'] - self.baseline['bytes'],
+            'messages': self.stats['messages'] - self.baseline['messages'],
+            'bytes': self.stats['bytes'] - self.baseline['bytes'],
+            'route_changes': self.stats['route_changes'] - self.baseline['route_changes'],
+            'routers': len(self.routers),
+            'routes': sum(1 for p in self.processes.values() for e in p.table.values()
+                          if e['next_hop'] is not None and e['metric'] < RIP_METRIC_INFINITY),
+        }
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    from core.devices import Router
+
+    def ring(size, chords, seed=0):
+        """`size` routers in a ring plus random chords, one /24 per link"""
+        routers = [Router(f"R{i}") for i in range(size)]
+        rng = random.Random(seed)
+        pairs = [(i, (i + 1) % size) for i in range(size)] + [tuple(rng.sample(range(size), 2)) for _ in range(chords)]
+        for subnet, (a, b) in enumerate(pairs, 1):
+            a, b = routers[a], routers[b]
+            ours, theirs = f"eth{len(a.interfaces)}", f"eth{len(b.interfaces)}"
+            a.add_interface(ours, f"10.{subnet >> 8}.{subnet & 255}.1", f"02:00:00:00:{subnet >> 8:02X}:{subnet & 255:02X}")
+            b.add_interface(theirs, f"10.{subnet >> 8}.{subnet & 255}.2", f"02:00:00:01:{subnet >> 8:02X}:{subnet & 255:02X}")
+            a.connect(b, ours, theirs)
+        return routers
+
+    print(f"{'routers':>8} {'links':>6} {'converge s':>11} {'messages':>9} {'kB':>9} {'cut: s':>8} {'messages':>9}")
+    for size in (10, 50, 100, 200):
+        routers = ring(size, size // 2)
+        domain = RipDomain(routers)
+        with contextlib.redirect_stdout(io.StringIO()):
+            first = domain.converge()
+            a = routers[0]
+            b = next(peer for peer in a.port_table if isinstance(peer, Router))
+            del a.port_table[b], b.port_table[a]
+            a.connected_to.remove(b)
+            b.connected_to.remove(a)
+            Entity.touch_topology(a, b)
+            cut = domain.converge()
+        print(f"{size:>8} {size + size // 2:>6} {first['convergence_time']:>11.1f} {first['messages_to_converge']:>9} "
+              f"{first['bytes_to_converge'] / 1000:>9.1f} {cut['convergence_time']:>8.1f} {cut['messages_to_converge']:>9}")
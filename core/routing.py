@@ -0,0 +1,360 @@
+import heapq
+import itertools
+import math
+from core.devices import Entity, Router, Switch, Hub, Bridge
+
+DEFAULT_COST = 1  # Per-interface link cost when the interface has no 'cost'; hop count, like RIP
+
+
+def _segment(start):
+    """Every entity reachable from a switch, hub or bridge without crossing a router"""
+    seen = {start}
+    stack = [start]
+    while stack:
+        entity = stack.pop()
+        for peer in entity.connected_to:
+            if peer not in seen and isinstance(peer, (Switch, Hub, Bridge)):
+                seen.add(peer)
+                stack.append(peer)
+    return seen
+
+
+def router_graph(routers):
+    """Router adjacency and connected prefixes of a topology.
+
+    Two routers are neighbours when they are cabled together or share an L2
+    segment (switches, hubs, bridges) on interfaces in the same subnet.
+    Returns (adjacency, prefixes): adjacency maps each router to a sorted
+    list of (neighbour, cost, interface, next_hop_ip); prefixes maps each
+    router to the set of (network, subnet_mask) it is attached to.
+    """
+    routers = list(routers)
+    members = set(routers)
+    adjacency = {router: [] for router in routers}
+    prefixes = {}
+    attached = {}  # L2 segment -> [(router, interface, prefix)]
+    segment_of = {}
+
+    for router in routers:
+        prefixes[router] = {(router._get_network(details['ip'], details['subnet_mask']), details['subnet_mask'])
+                            for details in router.interfaces.values()}
+        for entity, interface in router.port_table.items():
+            details = router.interfaces.get(interface)
+            if details is None:
+                continue
+            cost = details.get('cost', DEFAULT_COST)
+            if isinstance(entity, Router):
+                peer_interface = entity.interfaces.get(entity.port_table.get(router))
+                if entity in members and peer_interface is not None:
+                    adjacency[router].append((entity, cost, interface, peer_interface['ip']))
+            elif isinstance(entity, (Switch, Hub, Bridge)):
+                segment = segment_of.get(entity)
+                if segment is None:
+                    segment = frozenset(_segment(entity))
+                    for member in segment:
+                        segment_of[member] = segment
+                prefix = (router._get_network(details['ip'], details['subnet_mask']), details['subnet_mask'])
+                attached.setdefault(segment, []).append((router, interface, prefix))
+
+    for ports in attached.values():
+        for router, interface, prefix in ports:
+            cost = router.interfaces[interface].get('cost', DEFAULT_COST)
+            for peer, peer_interface, peer_prefix in ports:
+                if peer is not router and peer_prefix == prefix:
+                    adjacency[router].append((peer, cost, interface, peer.interfaces[peer_interface]['ip']))
+
+    for links in adjacency.values():
+        links.sort(key=lambda link: (link[0].id, link[2], link[3]))
+    return adjacency, prefixes
+
+
+def shortest_paths(source, adjacency, multipath=False):
+    """Dijkstra from one router.
+
+    Returns (dist, parents, first_hops): cost to every reachable router,
+    the previous routers on its shortest paths, and the tuple of
+    (interface, next_hop_ip) the source uses to reach it. Without
+    `multipath` each router keeps one path, ties going to the lower router
+    id; with it, every equal-cost first hop is kept. first_hops is filled
+    in (cost, id) order.
+    """
+    dist = {source: 0}
+    parents = {}
+    hops = {}
+    first_hops = {}
+    order = itertools.count()
+    heap = [(0, source.id, next(order), source)]
+    while heap:
+        cost, _, _, router = heapq.heappop(heap)
+        if cost > dist[router]:
+            continue  # Superseded by a cheaper path
+        own = hops.get(router)
+        if own is not None:
+            first_hops[router] = own = tuple(sorted(set(own))) if len(own) > 1 else own
+        for neighbour, link_cost, interface, next_hop in adjacency.get(router, ()):
+            total = cost + link_cost
+            best = dist.get(neighbour, math.inf)
+            if total < best:
+                dist[neighbour] = total
+                parents[neighbour] = (router,)
+                hops[neighbour] = own or ((interface, next_hop),)
+                heapq.heappush(heap, (total, neighbour.id, next(order), neighbour))
+            elif multipath and total == best:
+                parents[neighbour] += (router,)
+                hops[neighbour] += own or ((interface, next_hop),)
+    return dist, parents, first_hops
+
+
+class RoutingSolver:
+    """Computes shortest-path routing tables for every Router.
+
+    Each router gets a route to every subnet attached to another router,
+    via the first hop of its Dijkstra shortest path; routes are installed
+    with Router.add_route. The solver remembers the routes it installed,
+    so update() only touches what changed: it rebuilds the router graph,
+    reruns Dijkstra only from routers whose shortest-path tree can be
+    affected by the changed links, and rewrites only the routes whose next
+    hop moved. Static routes for the same subnet take precedence; the solver
+    watches its routers, so a route added or edited by hand makes it
+    re-read that router's table.
+
+    With `multipath`, a subnet reachable over several equal-cost paths gets
+    one route per first hop, installed as an ECMP group that Router.forward
+    hashes flows across.
+    """
+
+    def __init__(self, multipath=True):
+        self.multipath = multipath
+        self.adjacency = {}
+        self.prefixes = {}
+        self.owners = {}  # (network, mask) -> routers attached to it
+        self.paths = {}  # router -> (dist, parents, first_hops)
+        self.installed = {}  # router -> {(network, mask): {(interface, next_hop): route dict}}
+        self.static = {}  # router -> prefixes of its other routes, as of its last full refresh
+        self.stale = set()  # Routers whose tables changed outside the solver since the last update
+        self.applying = False  # Set while the solver edits tables, so its own changes do not mark them stale
+        self.version = None
+        self.stats = {'updates': 0, 'spf_runs': 0, 'routes_added': 0, 'routes_changed': 0, 'routes_removed': 0}
+
+    def touched(self, entities):
+        if not self.applying:
+            self.stale.update(entities)
+
+    def _owners(self, prefixes):
+        owners = {}
+        for router, attached in prefixes.items():
+            for prefix in attached:
+                owners.setdefault(prefix, set()).add(router)
+        return owners
+
+    def _affected(self, old_adjacency, adjacency):
+        """Sources whose shortest-path tree may change with the new links"""
+        removed = []
+        added = []
+        for router in adjacency.keys() | old_adjacency.keys():
+            old = set(old_adjacency.get(router, ()))
+            new = set(adjacency.get(router, ()))
+            removed += [(router, link) for link in old - new]
+            added += [(router, link) for link in new - old]
+
+        affected = set()
+        for source, (dist, parents, first_hops) in self.paths.items():
+            if source not in adjacency:
+                continue
+            if any(router in parents.get(link[0], ()) for router, link in removed):
+                affected.add(source)
+                continue
+            for router, (neighbour, cost, interface, next_hop) in added:
+                if router in dist:
+                    total = dist[router] + cost
+                    best = dist.get(neighbour, math.inf)
+                    if total < best or (self.multipath and total == best):
+                        affected.add(source)
+                        break
+        return affected
+
+    @staticmethod
+    def _mark(group):
+        """Flag a prefix's routes as an ECMP group while it has several next hops"""
+        ecmp = len(group) > 1
+        for route in group.values():
+            if ecmp:
+                route['ecmp'] = True
+            else:
+                route.pop('ecmp', None)
+
+    def _withdraw(self, router, groups):
+        gone = {id(route) for group in groups for route in group.values()}
+        if gone:
+            router.routing_table[:] = [route for route in router.routing_table if id(route) not in gone]
+
+    def _refresh(self, router, prefixes=None):
+        """Bring the router's solver routes in line with its shortest paths.
+
+        Only the given prefixes are looked at, or all of them when None.
+        Returns (added, changed, removed) counts.
+        """
+        installed = self.installed.setdefault(router, {})
+        dist, parents, first_hops = self.paths.get(router, ({router: 0}, {}, {}))
+        if prefixes is None:
+            ours = {id(route) for group in installed.values() for route in group.values()}
+            self.static[router] = {(route['network'], route['subnet_mask'])
+                                   for route in router.routing_table if id(route) not in ours}
+        static = self.static[router]
+        own = self.prefixes.get(router, ())
+
+        desired = {}  # prefix -> (cost, first hops)
+        if prefixes is None:
+            for owner, hops in first_hops.items():  # Nearest owner first
+                for prefix in self.prefixes.get(owner, ()):
+                    if prefix in own or prefix in static:
+                        continue
+                    best = desired.get(prefix)
+                    if best is None:
+                        desired[prefix] = (dist[owner], hops)
+                    elif self.multipath and best[0] == dist[owner]:
+                        desired[prefix] = (best[0], tuple(sorted(set(best[1] + hops))))
+        else:
+            for prefix in prefixes:
+                owners = self.owners.get(prefix, ())
+                if router in owners or prefix in static:
+                    continue
+                reachable = sorted((dist[owner], owner.id, owner) for owner in owners if owner in first_hops)
+                if not reachable:
+                    continue
+                cost = reachable[0][0]
+                if self.multipath:
+                    hops = tuple(sorted({hop for c, _, owner in reachable if c == cost for hop in first_hops[owner]}))
+                else:
+                    hops = first_hops[reachable[0][2]]
+                desired[prefix] = (cost, hops)
+
+        candidates = installed.keys() if prefixes is None else [p for p in prefixes if p in installed]
+        stale = [prefix for prefix in candidates if prefix not in desired]
+        removed = sum(len(installed[prefix]) for prefix in stale)
+        self._withdraw(router, [installed.pop(prefix) for prefix in stale])
+
+        added = changed = 0
+        table = router.routing_table
+        for (network, mask), (cost, hops) in desired.items():
+            group = installed.get((network, mask))
+            if group is None:
+                group = installed[(network, mask)] = {}
+                for hop in hops:
+                    group[hop] = route = {'network': network, 'subnet_mask': mask, 'next_hop': hop[1], 'interface': hop[0]}
+                    table.append(route)
+                self._mark(group)
+                added += len(hops)
+                continue
+            wanted = set(hops)
+            if wanted == group.keys():
+                continue
+            old = [hop for hop in group if hop not in wanted]
+            for hop in hops:
+                if hop in group:
+                    continue
+                if old:  # Repoint a route that lost its next hop
+                    route = group.pop(old.pop())
+                    route['interface'], route['next_hop'] = hop
+                    changed += 1
+                else:
+                    route = {'network': network, 'subnet_mask': mask, 'next_hop': hop[1], 'interface': hop[0]}
+                    table.append(route)
+                    added += 1
+                group[hop] = route
+            if old:
+                removed += len(old)
+                self._withdraw(router, [{hop: group.pop(hop) for hop in old}])
+            self._mark(group)
+        return added, changed, removed
+
+    def update(self, routers, full=False):
+        """Recompute routes after links, interfaces or routers changed.
+
+        Cheap when nothing changed since the last call. Returns a summary
+        of the work done in this call.
+        """
+        routers = list(routers)
+        summary = {'routers': len(routers), 'spf_runs': 0, 'routes_added': 0, 'routes_changed': 0, 'routes_removed': 0}
+        if not full and self.version == Entity.topology_version and set(routers) == self.adjacency.keys():
+            return summary
+
+        adjacency, prefixes = router_graph(routers)
+        owners = self._owners(prefixes)
+        edited = []
+
+        # Routers that left the topology lose their solver routes
+        for router in list(self.installed):
+            if router not in adjacency:
+                self._withdraw(router, self.installed.pop(router).values())
+                edited.append(router)
+                self.paths.pop(router, None)
+                self.static.pop(router, None)
+
+        if full:
+            sources = set(routers)
+        else:
+            sources = self._affected(self.adjacency, adjacency)
+            sources |= {router for router in routers if router not in self.paths}
+        changed_prefixes = [prefix for prefix in owners.keys() | self.owners.keys()
+                            if owners.get(prefix) != self.owners.get(prefix)]
+
+        self.adjacency = adjacency
+        self.prefixes = prefixes
+        self.owners = owners
+        stale, self.stale = self.stale, set()
+
+        # Per source, the prefixes whose best path may have moved
+        dirty = {}
+        for router in sources:
+            old = self.paths.get(router)
+            self.paths[router] = dist, parents, first_hops = shortest_paths(router, adjacency, self.multipath)
+            if old is None or full:
+                dirty[router] = None
+                continue
+            old_dist, _, old_first_hops = old
+            moved = set(changed_prefixes)
+            for target, cost in dist.items():
+                if cost != old_dist.get(target) or first_hops.get(target) != old_first_hops.get(target):
+                    moved.update(prefixes.get(target, ()))
+            for target in old_dist:
+                if target not in dist:
+                    moved.update(prefixes.get(target, ()))
+            dirty[router] = moved
+        summary['spf_runs'] = len(sources)
+
+        self.applying = True
+        try:
+            for router in routers:
+                if router in stale or router not in self.static:
+                    router.watch(self)
+                    counts = self._refresh(router)
+                elif router in dirty:
+                    counts = self._refresh(router, dirty[router])
+                elif changed_prefixes:
+                    counts = self._refresh(router, changed_prefixes)
+                else:
+                    continue
+                summary['routes_added'] += counts[0]
+                summary['routes_changed'] += counts[1]
+                summary['routes_removed'] += counts[2]
+                if any(counts):
+                    edited.append(router)
+            if edited:
+                Entity.touch_topology(*edited)  # Routes added, repointed or dropped in place
+        finally:
+            self.applying = False
+
+        self.version = Entity.topology_version
+        self.stats['updates'] += 1
+        for key in ('spf_runs', 'routes_added', 'routes_changed', 'routes_removed'):
+            self.stats[key] += summary[key]
+        return summary
+
+    def clear(self):
+        """Withdraw every route the solver installed"""
+        routers = list(self.installed)
+        for router, installed in self.installed.items():
+            self._withdraw(router, installed.values())
+        self.__init__(self.multipath)
+        Entity.touch_topology(*routers)
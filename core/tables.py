@@ -0,0 +1,347 @@
+from collections import defaultdict
+import pandas as pd
+import streamlit as st
+from core.devices import Entity, Router
+from core.fragmentation import DEFAULT_MTU
+from core.metrics import COUNTERS, snapshot
+
+LAYER_NAMES = {1: "Physical", 2: "Data Link", 3: "Network", 4: "Transport", 5: "Application"}
+DEFAULT_PAGE_SIZE = 25
+MATRIX_LIMIT = 60  # Hosts shown in the reachability matrix
+PAIR_LIMIT = 10000  # Unreachable pairs listed with a reason
+
+
+def _frame(columns):
+    """Build a dataframe from a dict of column lists plus a lowercase search column"""
+    df = pd.DataFrame(columns)
+    search = pd.Series("", index=df.index, dtype=str)
+    for column in df.columns:
+        search = search + " " + df[column].astype(str)
+    df["_search"] = search.str.lower()
+    return df
+
+
+def _port_owners(entity):
+    """Reverse the port table once so port -> device lookups are O(1)"""
+    return {port: device.id for device, port in entity.port_table.items()}
+
+
+def message_snapshot(messages):
+    columns = {
+        "#": [], "Time": [], "Source": [], "Destination": [], "Layer": [],
+        "Protocol": [], "Source Port": [], "Dest Port": [],
+        "Source MAC": [], "Dest MAC": [], "Source IP": [], "Dest IP": [],
+        "Path": [], "Data": []
+    }
+    for idx in range(len(messages) - 1, -1, -1):
+        msg = messages[idx]
+        layer = msg.get('layer', 1)
+        columns["#"].append(idx + 1)
+        columns["Time"].append(msg.get('timestamp', ''))
+        columns["Source"].append(msg.get('source', ''))
+        columns["Destination"].append(msg.get('destination', ''))
+        columns["Layer"].append(f"{layer} ({LAYER_NAMES.get(layer, '')})")
+        columns["Protocol"].append((msg.get('protocol') or '').upper())
+        columns["Source Port"].append(str(msg.get('source_port') or ''))
+        columns["Dest Port"].append(str(msg.get('dest_port') or ''))
+        columns["Source MAC"].append(msg.get('source_mac', ''))
+        columns["Dest MAC"].append(msg.get('dest_mac', ''))
+        columns["Source IP"].append(msg.get('source_ip', ''))
+        columns["Dest IP"].append(msg.get('dest_ip', ''))
+        columns["Path"].append(' → '.join(msg.get('path') or []))
+        columns["Data"].append(str(msg.get('data', '')))
+    return _frame(columns)
+
+
+def _received_summary(data):
+    layer = data.get('layer', 1)
+    if layer == 2:
+        return f"frame from MAC {data.get('frame', {}).get('source_mac', 'Unknown')}"
+    if layer == 3:
+        return f"packet from IP {data.get('packet', {}).get('source_ip', 'Unknown')}"
+    if layer >= 4:
+        return f"{(data.get('protocol') or '').upper()} data from port {data.get('source_port', '')}"
+    return "raw data"
+
+
+def device_snapshot(devices):
+    table = {"Device": [], "MAC": [], "IP": [], "Gateway": [], "Connected To": [],
+             "ARP Entries": [], "Services": [], "Received": []}
+    arp = {"Device": [], "IP": [], "MAC": []}
+    services = {"Device": [], "Port": [], "Protocol": [], "Service": []}
+    received = {"Device": [], "Layer": [], "Source": [], "Details": []}
+
+    for device_id, device in devices.items():
+        table["Device"].append(device_id)
+        table["MAC"].append(device.mac)
+        table["IP"].append(f"{device.ip}/{device.subnet_mask}")
+        table["Gateway"].append(device.default_gateway or "Not set")
+        table["Connected To"].append(', '.join(e.id for e in device.connected_to) or "None")
+        table["ARP Entries"].append(len(device.arp_table))
+        table["Services"].append(len(device.ports))
+        table["Received"].append(len(device.received_data))
+
+        for ip, mac in device.arp_table.items():
+            arp["Device"].append(device_id)
+            arp["IP"].append(ip)
+            arp["MAC"].append(mac)
+
+        for port_num, port_info in device.ports.items():
+            services["Device"].append(device_id)
+            services["Port"].append(port_num)
+            services["Protocol"].append(port_info['protocol'])
+            services["Service"].append(port_info['service'])
+
+        for data in device.received_data:
+            received["Device"].append(device_id)
+            received["Layer"].append(data.get('layer', 1))
+            received["Source"].append(str(data.get('source', 'Unknown')))
+            received["Details"].append(_received_summary(data))
+
+    return {"devices": _frame(table), "arp": _frame(arp),
+            "services": _frame(services), "received": _frame(received)}
+
+
+def l2_snapshot(hubs, switches, bridges):
+    nodes = {"Type": [], "ID": [], "Connected To": [], "MAC Entries": []}
+    macs = {"Device": [], "MAC": [], "Port": [], "Attached": []}
+    vlans = {"Switch": [], "Port": [], "Attached": [], "VLAN": []}
+    lags = {"Switch": [], "Port": [], "Peer": [], "Member": [], "Status": [], "Frames": [], "Bytes": [], "Share %": []}
+
+    for kind, entities in (("Hub", hubs), ("Switch", switches), ("Bridge", bridges)):
+        for entity_id, entity in entities.items():
+            nodes["Type"].append(kind)
+            nodes["ID"].append(entity_id)
+            nodes["Connected To"].append(', '.join(e.id for e in entity.connected_to) or "None")
+            nodes["MAC Entries"].append(len(getattr(entity, 'mac_table', {})))
+
+            if kind == "Hub":
+                continue
+            owners = _port_owners(entity)
+            for mac, port in entity.mac_table.items():
+                macs["Device"].append(entity_id)
+                macs["MAC"].append(mac)
+                macs["Port"].append(port)
+                macs["Attached"].append(owners.get(port, "Unknown"))
+
+            if kind == "Switch":
+                for port, vlan in entity.vlan_table.items():
+                    vlans["Switch"].append(entity_id)
+                    vlans["Port"].append(port)
+                    vlans["Attached"].append(owners.get(port, "Unknown"))
+                    vlans["VLAN"].append(vlan)
+
+                for port, lag in entity.lags.items():
+                    total = sum(size for frames, size in lag['tx'].values())
+                    for member in lag['members']:
+                        frames, size = lag['tx'][member['name']]
+                        lags["Switch"].append(entity_id)
+                        lags["Port"].append(port)
+                        lags["Peer"].append(lag['peer'].id)
+                        lags["Member"].append(member['name'])
+                        lags["Status"].append("Up" if member['up'] else "Down")
+                        lags["Frames"].append(frames)
+                        lags["Bytes"].append(size)
+                        lags["Share %"].append(round(100.0 * size / total, 1) if total else 0.0)
+
+    return {"nodes": _frame(nodes), "macs": _frame(macs), "vlans": _frame(vlans), "lags": _frame(lags)}
+
+
+def router_snapshot(routers):
+    table = {"Router": [], "Connected To": [], "Interfaces": [], "Routes": []}
+    interfaces = {"Router": [], "Interface": [], "IP": [], "MAC": [], "Subnet": [], "MTU": []}
+    routes = {"Router": [], "Network": [], "Subnet Mask": [], "Next Hop": [], "Interface": []}
+    ecmp = {"Router": [], "Network": [], "Subnet Mask": [], "Next Hop": [], "Interface": [], "Packets": [], "Share %": []}
+    nat = {"Router": [], "Protocol": [], "Entries": [], "Capacity": [], "Occupancy %": [], "Created": [], "Expired": [], "Evicted": [], "Dropped": []}
+    translations = {"Router": [], "Protocol": [], "Inside": [], "Public": [], "Remote": [], "Packets Out": [], "Packets In": [], "Idle (s)": []}
+    acls = {"Router": [], "Interface": [], "Direction": [], "ACL": [], "Seq": [], "Rule": [], "Hits": []}
+    leases = {"Router": [], "Interface": [], "MAC": [], "IP": [], "State": [], "Expires In (s)": []}
+
+    for router_id, router in routers.items():
+        table["Router"].append(router_id)
+        table["Connected To"].append(', '.join(e.id for e in router.connected_to) or "None")
+        table["Interfaces"].append(len(router.interfaces))
+        table["Routes"].append(len(router.routing_table))
+
+        for name, details in router.interfaces.items():
+            interfaces["Router"].append(router_id)
+            interfaces["Interface"].append(name)
+            interfaces["IP"].append(details['ip'])
+            interfaces["MAC"].append(details['mac'])
+            interfaces["Subnet"].append(details['subnet_mask'])
+            interfaces["MTU"].append(details.get('mtu', DEFAULT_MTU))
+
+        for route in router.routing_table:
+            is_default = route['network'] == "0.0.0.0" and route['subnet_mask'] == "0.0.0.0"
+            routes["Router"].append(router_id)
+            routes["Network"].append("Default" if is_default else route['network'])
+            routes["Subnet Mask"].append(route['subnet_mask'])
+            routes["Next Hop"].append(route['next_hop'] or "Direct")
+            routes["Interface"].append(route['interface'])
+
+        groups = defaultdict(list)
+        for route in router.routing_table:
+            groups[(route['network'], route['subnet_mask'])].append(route)
+        for prefix, members in groups.items():
+            members = Router.forwarding_group(members)
+            if len(members) < 2:
+                continue
+            load = router.next_hop_load.get(prefix, {})
+            total = sum(load.values())
+            for route in members:
+                packets = load.get((route['interface'], route['next_hop']), 0)
+                ecmp["Router"].append(router_id)
+                ecmp["Network"].append(prefix[0])
+                ecmp["Subnet Mask"].append(prefix[1])
+                ecmp["Next Hop"].append(route['next_hop'] or "Direct")
+                ecmp["Interface"].append(route['interface'])
+                ecmp["Packets"].append(packets)
+                ecmp["Share %"].append(round(100.0 * packets / total, 1) if total else 0.0)
+
+        for (interface, direction), access_list in router.acls.items():
+            for index, rule in enumerate(access_list.rules + [None]):
+                acls["Router"].append(router_id)
+                acls["Interface"].append(interface)
+                acls["Direction"].append(direction)
+                acls["ACL"].append(access_list.name)
+                if rule is None:
+                    acls["Seq"].append("implicit")
+                    acls["Rule"].append(f"{access_list.default} any")
+                    acls["Hits"].append(access_list.default_hits)
+                else:
+                    acls["Seq"].append(str((index + 1) * 10))
+                    acls["Rule"].append(access_list.describe(index))
+                    acls["Hits"].append(rule['hits'])
+
+        for interface, server in router.dhcp.items():
+            for lease in server.report():
+                leases["Router"].append(router_id)
+                leases["Interface"].append(interface)
+                leases["MAC"].append(lease['mac'])
+                leases["IP"].append(lease['ip'])
+                leases["State"].append(lease['state'])
+                leases["Expires In (s)"].append(round(lease['expires_in'], 1))
+
+        if router.nat is not None:
+            stats = router.nat.stats
+            for protocol, usage in sorted(router.nat.occupancy().items()):
+                nat["Router"].append(router_id)
+                nat["Protocol"].append(protocol.upper())
+                nat["Entries"].append(usage['entries'])
+                nat["Capacity"].append(usage['capacity'])
+                nat["Occupancy %"].append(round(100.0 * usage['occupancy'], 2) if usage['occupancy'] is not None else None)
+                # Table-wide counters, repeated on each protocol row
+                nat["Created"].append(stats['created'])
+                nat["Expired"].append(stats['expired'])
+                nat["Evicted"].append(stats['evicted'])
+                nat["Dropped"].append(stats['exhausted'] + stats['misses'] + stats['filtered'])
+            now = router.nat._now()
+            for protocol, entries in router.nat.entries.items():
+                for entry in entries.values():
+                    inside, public, remote = entry.inside_ip, entry.public_ip, entry.remote_ip
+                    if entry.public_port is not None:
+                        inside, public, remote = f"{inside}:{entry.inside_port}", f"{public}:{entry.public_port}", f"{remote}:{entry.remote_port}"
+                    translations["Router"].append(router_id)
+                    translations["Protocol"].append(protocol.upper())
+                    translations["Inside"].append(inside)
+                    translations["Public"].append(public)
+                    translations["Remote"].append(remote)
+                    translations["Packets Out"].append(entry.packets_out)
+                    translations["Packets In"].append(entry.packets_in)
+                    translations["Idle (s)"].append(round(now - entry.last_used, 1))
+
+    return {"routers": _frame(table), "interfaces": _frame(interfaces), "routes": _frame(routes), "ecmp": _frame(ecmp),
+            "nat": _frame(nat), "translations": _frame(translations), "acls": _frame(acls),
+            "leases": _frame(leases)}
+
+
+def reachability_snapshot(reach, layer, matrix_limit=MATRIX_LIMIT, pair_limit=PAIR_LIMIT):
+    """Matrix of the first hosts (by address) and the unreachable pairs with their reasons"""
+    rows = getattr(reach, layer)
+    shown = reach.hosts[:matrix_limit]
+    matrix = {"Source": [host.id for host in shown]}
+    for j, dest in enumerate(shown):
+        matrix[dest.id] = ["✓" if rows[i] >> j & 1 else "" for i in range(len(shown))]
+
+    unreachable = {"Source": [], "Source IP": [], "Destination": [], "Destination IP": [], "Reason": []}
+    for source, dest in reach.unreachable_pairs(layer, limit=pair_limit):
+        unreachable["Source"].append(source.id)
+        unreachable["Source IP"].append(source.ip)
+        unreachable["Destination"].append(dest.id)
+        unreachable["Destination IP"].append(dest.ip)
+        unreachable["Reason"].append(reach.explain(source, dest, layer))
+
+    return {"matrix": pd.DataFrame(matrix), "unreachable": _frame(unreachable)}
+
+
+def forwarding_snapshot(issues):
+    """Forwarding check issues, one row each"""
+    table = {"Prefix": [], "Problem": [], "Routers": [], "Detail": []}
+    for issue in issues:
+        table["Prefix"].append(issue['prefix'])
+        table["Problem"].append(issue['kind'])
+        table["Routers"].append(", ".join(issue['routers']))
+        table["Detail"].append(issue['detail'])
+    return _frame(table)
+
+
+def lint_snapshot(issues):
+    """Configuration lint issues, one row each"""
+    table = {"Problem": [], "Entities": [], "Detail": []}
+    for issue in issues:
+        table["Problem"].append(issue['kind'])
+        table["Entities"].append(", ".join(issue['entities']))
+        table["Detail"].append(issue['detail'])
+    return _frame(table)
+
+
+def metrics_snapshot(entities):
+    """Counter tables; not cached, since counters move without a version bump"""
+    data = snapshot(entities)
+    table = {"Entity": [], "Type": []}
+    table.update({name: [] for name in COUNTERS})
+    for entity_id, values in data['entities'].items():
+        table["Entity"].append(entity_id)
+        table["Type"].append(values['kind'])
+        for name in COUNTERS:
+            table[name].append(values[name])
+
+    links = {"From": [], "To": [], "Frames": [], "Bytes": []}
+    for link in sorted(data['links'], key=lambda l: -l['bytes']):
+        links["From"].append(link['source'])
+        links["To"].append(link['dest'])
+        links["Frames"].append(link['frames'])
+        links["Bytes"].append(link['bytes'])
+    return {"entities": _frame(table), "links": _frame(links)}
+
+
+def cached_snapshot(name, builder, *args):
+    """Return builder(*args), rebuilt only when the network or message log changed"""
+    version = (Entity.topology_version, Entity.state_version, len(st.session_state.messages))
+    cache = st.session_state.setdefault('snapshot_cache', {})
+    entry = cache.get(name)
+    if entry is None or entry[0] != version:
+        entry = (version, builder(*args))
+        cache[name] = entry
+    return entry[1]
+
+
+def paginated_dataframe(df, key, page_size=DEFAULT_PAGE_SIZE, empty_message="Nothing to show."):
+    """Render a filterable dataframe one page at a time"""
+    if df.empty:
+        st.info(empty_message)
+        return
+
+    query = st.text_input("Filter", key=f"{key}_filter", placeholder="Type to filter rows")
+    if query:
+        df = df[df["_search"].str.contains(query.lower(), regex=False)]
+
+    total = len(df)
+    pages = max(1, (total + page_size - 1) // page_size)
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+
+    st.dataframe(df.iloc[start:start + page_size].drop(columns="_search"), hide_index=True, use_container_width=True)
+    st.caption(f"Showing {min(start + 1, total)}-{min(start + page_size, total)} of {total} rows")
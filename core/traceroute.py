@@ -0,0 +1,224 @@
+import copy
+from core.devices import Entity, EndDevice, Router, Switch, Bridge
+from core.metrics import new_counters, frame_bytes
+
+DEFAULT_MAX_HOPS = 30
+PROBE_PAYLOAD = b"\x00" * 32  # What most traceroute implementations send
+# Per link, as in TransportLayerSimulator: propagation plus serialization at the bottleneck rate
+DEFAULT_HOP_DELAY = 0.005
+DEFAULT_LINK_RATE = 1250000
+
+# Counter that marks a drop -> reason; the first one that moved explains the failure
+DROP_REASONS = [
+    ('ttl_drops', "TTL expired"),
+    ('acl_drops', "denied by access list"),
+    ('no_route_drops', "no route"),
+    ('vlan_drops', "VLAN mismatch"),
+    ('arp_failures', "ARP failure"),
+    ('checksum_drops', "bad checksum"),
+]
+# Counters shown as per-hop processing work
+PROCESSING = ('frames_in', 'route_lookups', 'floods', 'mac_learns')
+
+
+class _Probe:
+    """Instrumentation for one probe: fresh counters and a tap on every entity"""
+
+    def __init__(self, entities):
+        self.entities = entities
+        self.arrivals = []  # (entity, from, frame bytes) in the order frames arrived
+
+    def tap(self, entity, data, source, layer):
+        self.arrivals.append((entity, source, frame_bytes(data, layer)))
+
+    def __enter__(self):
+        for entity in self.entities:
+            entity.counters = new_counters()
+            entity.add_tap(self.tap)
+        return self
+
+    def __exit__(self, *exc):
+        for entity in self.entities:
+            entity.remove_tap(self.tap)
+
+    def chain(self, target, origin):
+        """Links from origin to target, following who handed each frame on.
+
+        The target is reached by its last arrival, so a probe that came back
+        around a routing loop shows the whole loop; every other entity by its
+        first.
+        """
+        parents = {}
+        for entity, source, size in self.arrivals:
+            if entity not in parents:
+                parents[entity] = (source, size)
+        links = []
+        for entity, source, size in reversed(self.arrivals):
+            if entity is target:
+                links.append((source, target, size))
+                break
+        node = links[0][0] if links else target
+        while node is not origin and node in parents and len(links) <= len(parents):
+            source, size = parents[node]
+            links.append((source, node, size))
+            node = source
+        links.reverse()
+        return links if node is origin else []
+
+    def drop(self):
+        """(entity, reason) of the first entity whose drop counters moved, in arrival order"""
+        seen = []
+        for entity, _, _ in self.arrivals:
+            if entity not in seen:
+                seen.append(entity)
+        for counter, reason in DROP_REASONS:
+            for entity in seen + [e for e in self.entities if e not in seen]:
+                if entity.counters[counter]:
+                    return entity, reason
+        return None, None
+
+
+class _Preserved:
+    """Saves what probes would change (learned tables, counters, received data,
+    NAT mappings, ACL and LAG counters) and puts it back. Taps already on the
+    entities, such as a running capture, are detached so probes stay out of it."""
+
+    def __init__(self, entities):
+        self.entities = entities
+
+    def __enter__(self):
+        self.saved = []
+        for entity in self.entities:
+            state = {'counters': entity.counters, 'taps': entity.taps}
+            entity.taps = None
+            if isinstance(entity, (Switch, Bridge)):
+                state['mac_table'] = dict(entity.mac_table)
+            if isinstance(entity, Switch):
+                state['lag_tx'] = [(lag['tx'], {name: list(tx) for name, tx in lag['tx'].items()}) for lag in entity.lags.values()]
+            if isinstance(entity, (EndDevice, Router)):
+                state['arp_table'] = dict(entity.arp_table)
+            if isinstance(entity, EndDevice):
+                state['received'] = len(entity.received_data)
+            if isinstance(entity, Router):
+                state['egress'] = entity.egress
+                state['next_hop_load'] = {group: dict(load) for group, load in entity.next_hop_load.items()}
+                entity.egress = {}  # Probes measure the links, not queueing on the shared clock
+                state['acl_hits'] = [(acl, [rule['hits'] for rule in acl.rules], acl.default_hits) for acl in entity.acls.values()]
+                state['nat'] = entity.nat
+                if entity.nat is not None:
+                    # Probes translate through a copy, so mappings, LRU order and stats stay as they were
+                    entity.nat = copy.deepcopy(entity.nat, {id(entity.nat.clock): entity.nat.clock})
+            self.saved.append((entity, state))
+        return self
+
+    def __exit__(self, *exc):
+        for entity, state in self.saved:
+            entity.counters = state['counters']
+            entity.taps = state['taps']
+            if 'mac_table' in state:
+                entity.mac_table = state['mac_table']
+            if 'lag_tx' in state:
+                for tx, saved in state['lag_tx']:
+                    tx.clear()
+                    tx.update(saved)
+            if 'arp_table' in state:
+                entity.arp_table = state['arp_table']
+            if 'received' in state:
+                del entity.received_data[state['received']:]
+            if 'egress' in state:
+                entity.egress = state['egress']
+                entity.next_hop_load = state['next_hop_load']
+                for acl, hits, default_hits in state['acl_hits']:
+                    for rule, count in zip(acl.rules, hits):
+                        rule['hits'] = count
+                    acl.default_hits = default_hits
+                entity.nat = state['nat']
+        Entity.touch_state()
+
+
+def forwarding_links(source, destination, entities, send):
+    """The links (from, to) that send() carries a packet over from source to destination.
+
+    send() runs as a probe, so like traceroute it leaves tables, counters,
+    queues and NAT mappings as they were. Empty when nothing arrives.
+    """
+    entities = list(entities)
+    with _Preserved(entities), _Probe(entities) as probe:
+        send()
+    return [(node, peer) for node, peer, _ in probe.chain(destination, source)]
+
+
+def _link_delay(size, hop_delay, link_rate):
+    return hop_delay + size / link_rate
+
+
+def traceroute(source, destination, entities, max_hops=DEFAULT_MAX_HOPS, hop_delay=DEFAULT_HOP_DELAY, link_rate=DEFAULT_LINK_RATE):
+    """Send TTL-limited probes from one EndDevice to another, as traceroute does.
+
+    Probe n is dropped by the n-th router on the way, which becomes hop n.
+    Each hop records the entities the probe crossed to get there, the work
+    done along the way (frames, route lookups, floods) and a simulated round
+    trip over those links. The trace stops at the destination, or at the
+    first probe lost for another reason (no route, access list, VLAN
+    mismatch, ARP failure) or at a router seen twice (a routing loop),
+    which is reported on its last hop.
+
+    MAC and ARP tables, counters, egress queues, NAT mappings and ACL and
+    LAG counters are restored afterwards, and running captures see none of
+    the probes, so probing leaves the network as it was. Returns
+    {'reached', 'reason', 'hops': [{'hop', 'entity', 'address', 'status',
+    'path', 'rtt_ms', 'processing'}, ...], 'path'} where 'path' is the ids
+    of every entity on the forwarding path.
+    """
+    hops = []
+    path = [source.id]
+    result = {'reached': False, 'reason': None, 'hops': hops, 'path': path}
+    if not source.ip or source.ip == "0.0.0.0":
+        result['reason'] = f"{source.id} has no address"
+        return result
+    entities = list(entities)
+    with _Preserved(entities):
+        for ttl in range(1, max_hops + 1):
+            packet = {'source_ip': source.ip, 'dest_ip': destination.ip, 'ttl': ttl, 'id': ttl, 'data': PROBE_PAYLOAD}
+            with _Probe(entities) as probe:
+                delivered = source._send_packet(packet, destination, {source.id})
+            dropped_at, reason = probe.drop()
+
+            if delivered and destination.counters is not None and destination.counters['frames_in']:
+                status, answering = "reached", destination
+            elif reason == "TTL expired":
+                status, answering = "time exceeded", dropped_at
+            else:
+                status, answering = reason or "lost", dropped_at or (probe.arrivals[-1][0] if probe.arrivals else source)
+
+            links = probe.chain(answering, source)
+            rtt = 2 * sum(_link_delay(size, hop_delay, link_rate) for _, _, size in links)
+            crossed = [node.id for _, node, _ in links]
+            processing = {}
+            for _, node, _ in links:
+                work = {name: node.counters[name] for name in PROCESSING if node.counters[name]}
+                if work:
+                    processing[node.id] = work
+            address = None
+            if isinstance(answering, Router) and links:
+                interface = answering.port_table.get(links[-1][0])
+                address = answering.interfaces.get(interface, {}).get('ip')
+            elif isinstance(answering, EndDevice):
+                address = answering.ip
+
+            if status == "time exceeded" and any(hop['entity'] == answering.id for hop in hops):
+                status = "routing loop"  # The same router answered an earlier probe
+            hops.append({'hop': ttl, 'entity': answering.id, 'address': address, 'status': status,
+                         'path': crossed[len(path) - 1:], 'rtt_ms': rtt * 1000 if links else None,
+                         'processing': processing})
+            if links:
+                path[1:] = crossed
+            if status != "time exceeded":
+                result['reached'] = status == "reached"
+                if not result['reached']:
+                    result['reason'] = f"{status} at {answering.id}" + (f" ({address})" if address else "")
+                break
+        else:
+            result['reason'] = f"no answer within {max_hops} hops"
+    print(f"Traceroute {source.id} -> {destination.id}: " + ("reached" if result['reached'] else result['reason']))
+    return result
@@ -0,0 +1,254 @@
+import math
+import random
+import struct
+from core.transport import udp_datagram
+
+DISCARD_PORT = 9  # Flows land on a generator-owned UDP listener, like the discard service
+MAX_DATAGRAM_PAYLOAD = 65507
+DRAIN_TIME = 5.0  # Virtual seconds to wait for packets still in flight after the last departure
+
+_HEADER = struct.Struct("!IQ")  # flow id, sequence number; rides at the front of each payload
+_PAD = bytes(MAX_DATAGRAM_PAYLOAD)
+
+
+# ----- packet size distributions: callables rng -> payload bytes -----
+
+def constant_size(size):
+    return lambda rng: size
+
+
+def uniform_size(low, high):
+    return lambda rng: rng.randint(low, high)
+
+
+def exponential_size(mean, maximum=MAX_DATAGRAM_PAYLOAD):
+    return lambda rng: min(maximum, max(1, int(rng.expovariate(1.0 / mean))))
+
+
+def bimodal_size(small=64, large=1400, small_share=0.5):
+    """Mix of small (ACK-like) and large (MTU-sized) packets"""
+    return lambda rng: small if rng.random() < small_share else large
+
+
+def _clamp(size):
+    return max(_HEADER.size, min(int(size), MAX_DATAGRAM_PAYLOAD))
+
+
+# ----- flow models: next_gap(size, rng) gives seconds until the next departure -----
+
+class PoissonFlow:
+    """Poisson arrivals: exponential gaps at `rate` packets/s"""
+    name = "Poisson"
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def next_gap(self, size, rng):
+        return rng.expovariate(self.rate)
+
+
+class CbrFlow:
+    """Constant bit rate: each packet is spaced by its own size at `bit_rate` bits/s"""
+    name = "CBR"
+
+    def __init__(self, bit_rate):
+        self.bit_rate = bit_rate
+
+    def next_gap(self, size, rng):
+        return size * 8 / self.bit_rate
+
+
+class OnOffFlow:
+    """Bursty source: CBR at `bit_rate` during ON periods, silent during OFF.
+
+    Period lengths are exponential with the given means, or Pareto
+    (heavy-tailed, self-similar aggregate) when `shape` is set.
+    """
+    name = "On/Off"
+
+    def __init__(self, bit_rate, mean_on=0.5, mean_off=0.5, shape=None):
+        self.bit_rate = bit_rate
+        self.mean_on = mean_on
+        self.mean_off = mean_off
+        self.shape = shape
+        self.on_left = None
+
+    def _period(self, mean, rng):
+        if self.shape and self.shape > 1:
+            scale = mean * (self.shape - 1) / self.shape  # Pareto with this mean
+            return scale * rng.paretovariate(self.shape)
+        return rng.expovariate(1.0 / mean)
+
+    def next_gap(self, size, rng):
+        if self.on_left is None:
+            self.on_left = self._period(self.mean_on, rng)
+        gap = size * 8 / self.bit_rate
+        self.on_left -= gap
+        while self.on_left <= 0:  # Burst over: sleep through an OFF period into the next burst
+            gap += self._period(self.mean_off, rng)
+            self.on_left += self._period(self.mean_on, rng)
+        return gap
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Flow:
+    def __init__(self, flow_id, source, dest, model, size, dest_port, start, stop, dscp=0):
+        self.id = flow_id
+        self.source = source
+        self.dest = dest
+        self.model = model
+        self.size = size
+        self.dest_port = dest_port
+        self.start = start
+        self.stop = stop
+        self.dscp = dscp
+        self.source_port = None
+        self.sent_at = {}  # seq -> departure time, until delivered
+        self.latencies = []
+        self.stats = {'sent': 0, 'sent_bytes': 0, 'delivered': 0, 'delivered_bytes': 0, 'send_failures': 0}
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        duration = max(self.stop - self.start, 1e-9)
+        sent = self.stats['sent']
+        return {
+            'flow': self.id,
+            'source': self.source.id,
+            'dest': self.dest.id,
+            'model': self.model.name,
+            'dscp': self.dscp,
+            'sent': sent,
+            'delivered': self.stats['delivered'],
+            'loss': 1 - self.stats['delivered'] / sent if sent else 0.0,
+            'offered_bps': self.stats['sent_bytes'] * 8 / duration,
+            'delivered_bps': self.stats['delivered_bytes'] * 8 / duration,
+            'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+            'p95_ms': percentile(latencies, 95) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+            'max_ms': latencies[-1] * 1000 if latencies else None,
+        }
+
+
+class TrafficGenerator:
+    """Schedules UDP flows between EndDevices on a TransportLayerSimulator.
+
+    Every packet goes through TransportLayerSimulator.transmit, so it is
+    queued at the path bottleneck and carried hop by hop by EndDevice.send
+    like any other datagram. Each flow draws from its own RNG seeded from
+    `seed`, so runs are reproducible flow by flow.
+    """
+
+    def __init__(self, sim, seed=0):
+        self.sim = sim
+        self.seed = seed
+        self.flows = []
+        self._receivers = {}  # (dest device, port) -> {flow id: flow}
+
+    def add_flow(self, source, dest, model, size=None, dest_port=DISCARD_PORT, start=0.0, duration=10.0, dscp=0):
+        flow = Flow(len(self.flows), source, dest, model, size or constant_size(512), dest_port, start, start + duration, dscp)
+        self.flows.append(flow)
+        return flow
+
+    def add_flows(self, sources, dests, model_factory, pairs=None, **options):
+        """One flow per (source, dest) pair; all pairs of distinct devices unless `pairs` picks a random subset"""
+        candidates = [(s, d) for s in sources for d in dests if s is not d]
+        if pairs is not None and pairs < len(candidates):
+            candidates = random.Random(self.seed).sample(candidates, pairs)
+        return [self.add_flow(s, d, model_factory(), **options) for s, d in candidates]
+
+    def _on_receive(self, receivers):
+        def on_datagram(device, packet, datagram):
+            payload = datagram['payload']
+            if len(payload) < _HEADER.size:
+                return
+            # Matched on the flow id in the payload, not the source address, so flows survive NAT on the way
+            flow_id, seq = _HEADER.unpack_from(payload)
+            flow = receivers.get(flow_id)
+            sent_at = flow.sent_at.pop(seq, None) if flow is not None else None
+            if sent_at is None:
+                return  # Not ours, or a duplicate
+            flow.latencies.append(self.sim.clock.now - sent_at)
+            flow.stats['delivered'] += 1
+            flow.stats['delivered_bytes'] += len(payload)
+        return on_datagram
+
+    def _open(self, flow):
+        sim = self.sim
+        sim.attach(flow.source)
+        sim.attach(flow.dest)
+        flow.source_port = sim.get_ephemeral_port(flow.source, 'udp', flow.dest.ip, flow.dest_port)
+        key = (flow.dest, flow.dest_port)
+        receivers = self._receivers.get(key)
+        if receivers is None:
+            receivers = self._receivers[key] = {}
+            if not flow.dest.connections.listen('udp', flow.dest_port, self._on_receive(receivers)):
+                raise RuntimeError(f"UDP port {flow.dest_port} on {flow.dest.id} already has a listener")
+        receivers[flow.id] = flow
+
+    def _close(self, flow):
+        flow.source.connections.release_port(flow.source_port)
+
+    def _depart(self, flow, rng, seq):
+        clock = self.sim.clock
+        if clock.now >= flow.stop:
+            return
+        size = _clamp(flow.size(rng))
+        payload = _HEADER.pack(flow.id, seq) + _PAD[:size - _HEADER.size]
+        flow.sent_at[seq] = clock.now
+        flow.stats['sent'] += 1
+        flow.stats['sent_bytes'] += size
+        if not self.sim.transmit(flow.source, flow.dest, udp_datagram(flow.source_port, flow.dest_port, payload),
+                                 dscp=flow.dscp):
+            flow.stats['send_failures'] += 1
+            del flow.sent_at[seq]  # Dropped at the bottleneck or unroutable, never arrives
+        clock.schedule(flow.model.next_gap(size, rng), self._depart, flow, rng, seq + 1)
+
+    def run(self, drain=DRAIN_TIME):
+        """Run every flow to its stop time, then let in-flight packets land. Returns report()."""
+        clock = self.sim.clock
+        base = clock.now
+        for flow in self.flows:
+            flow.start += base
+            flow.stop += base
+            self._open(flow)
+            rng = random.Random(f"{self.seed}:{flow.id}")
+            clock.schedule_at(flow.start, self._depart, flow, rng, 0)
+
+        end = max((flow.stop for flow in self.flows), default=base)
+        clock.run(until=end + drain)
+
+        for flow in self.flows:
+            self._close(flow)
+        for dest, port in self._receivers:
+            dest.connections.unlisten('udp', port)
+        self._receivers = {}
+        return self.report()
+
+    def report(self):
+        flows = [flow.report() for flow in self.flows]
+        latencies = sorted(latency for flow in self.flows for latency in flow.latencies)
+        sent = sum(flow.stats['sent'] for flow in self.flows)
+        delivered = sum(flow.stats['delivered'] for flow in self.flows)
+        duration = max((flow.stop - flow.start for flow in self.flows), default=0) or 1e-9
+        return {
+            'flows': flows,
+            'totals': {
+                'flows': len(flows),
+                'sent': sent,
+                'delivered': delivered,
+                'loss': 1 - delivered / sent if sent else 0.0,
+                'offered_bps': sum(flow.stats['sent_bytes'] for flow in self.flows) * 8 / duration,
+                'delivered_bps': sum(flow.stats['delivered_bytes'] for flow in self.flows) * 8 / duration,
+                'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+                'p95_ms': percentile(latencies, 95) * 1000 if latencies else None,
+                'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+            },
+            'network': dict(self.sim.stats),
+        }
@@ -0,0 +1,694 @@
+DEFAULT_TTL = 64
+IPV4_HEADER_SIZE = 20
+TCP_HEADER_SIZE = 20
+UDP_HEADER_SIZE = 8
+
+DEFAULT_MSS = 1460
+DEFAULT_RCV_WINDOW = 65535
+INITIAL_CWND_SEGMENTS = 2
+INITIAL_SSTHRESH = 64 * 1024
+DUPACK_THRESHOLD = 3
+
+INITIAL_RTO = 1.0
+MIN_RTO = 0.2
+MAX_RTO = 60.0
+MAX_RETRIES = 12
+MSL = 2.0  # Short maximum segment lifetime keeps TIME_WAIT brief in simulations
+
+EPHEMERAL_PORT_MIN = 49152
+EPHEMERAL_PORT_MAX = 65535
+
+CLOSED = "CLOSED"
+LISTEN = "LISTEN"
+SYN_SENT = "SYN_SENT"
+SYN_RECEIVED = "SYN_RECEIVED"
+ESTABLISHED = "ESTABLISHED"
+FIN_WAIT_1 = "FIN_WAIT_1"
+FIN_WAIT_2 = "FIN_WAIT_2"
+CLOSING = "CLOSING"
+TIME_WAIT = "TIME_WAIT"
+CLOSE_WAIT = "CLOSE_WAIT"
+LAST_ACK = "LAST_ACK"
+
+
+def tcp_segment(source_port, dest_port, seq, ack, flags, window, payload=b""):
+    return {
+        'protocol': 'tcp',
+        'source_port': source_port,
+        'dest_port': dest_port,
+        'seq': seq,
+        'ack': ack,
+        'flags': flags,  # any of "S", "A", "F", "R"
+        'window': window,
+        'payload': payload
+    }
+
+
+def udp_datagram(source_port, dest_port, payload=b""):
+    return {
+        'protocol': 'udp',
+        'source_port': source_port,
+        'dest_port': dest_port,
+        'payload': payload
+    }
+
+
+def segment_size(segment):
+    """Bytes the segment occupies on the wire, IPv4 header included"""
+    header = TCP_HEADER_SIZE if segment['protocol'] == 'tcp' else UDP_HEADER_SIZE
+    return IPV4_HEADER_SIZE + header + len(segment['payload'])
+
+
+def to_bytes(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data)
+    return str(data).encode('utf-8')
+
+
+class PortAllocator:
+    """Bitmap allocator for a port range.
+
+    A rotating cursor makes the common case O(1). Ports may be shared by
+    several connections (to different remote endpoints) once the range is
+    exhausted; those extra holders are reference counted.
+    """
+
+    def __init__(self, low=EPHEMERAL_PORT_MIN, high=EPHEMERAL_PORT_MAX):
+        self.low = low
+        self.size = high - low + 1
+        self.bits = bytearray((self.size + 7) // 8)
+        self.cursor = 0
+        self.in_use = 0
+        self.shared = {}  # port -> extra holders beyond the first
+        self.stats = {'allocations': 0, 'releases': 0, 'reuses': 0, 'exhausted': 0}
+
+    def __contains__(self, port):
+        index = port - self.low
+        return 0 <= index < self.size and bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def allocate(self):
+        """Claim a free port, or return None when the range is exhausted"""
+        if self.in_use >= self.size:
+            self.stats['exhausted'] += 1
+            return None
+        bits = self.bits
+        nbytes = len(bits)
+        byte = self.cursor >> 3
+        for _ in range(nbytes + 1):
+            value = bits[byte]
+            if value != 0xFF:
+                bit = (~value & (value + 1)).bit_length() - 1  # Lowest clear bit
+                index = (byte << 3) + bit
+                if index < self.size:
+                    bits[byte] = value | (1 << bit)
+                    self.in_use += 1
+                    self.cursor = (index + 1) % self.size
+                    self.stats['allocations'] += 1
+                    return self.low + index
+            byte = (byte + 1) % nbytes
+        self.stats['exhausted'] += 1
+        return None
+
+    def reserve(self, port):
+        """Claim a specific port; shares it when already taken"""
+        index = port - self.low
+        if not 0 <= index < self.size:
+            return False
+        if port in self:
+            self.shared[port] = self.shared.get(port, 0) + 1
+            self.stats['reuses'] += 1
+        else:
+            self.bits[index >> 3] |= 1 << (index & 7)
+            self.in_use += 1
+            self.stats['allocations'] += 1
+        return True
+
+    def release(self, port):
+        index = port - self.low
+        if not 0 <= index < self.size or port not in self:
+            return False
+        if self.shared.get(port):
+            self.shared[port] -= 1
+            if not self.shared[port]:
+                del self.shared[port]
+        else:
+            self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+            self.in_use -= 1
+        self.stats['releases'] += 1
+        return True
+
+
+class ConnectionTable:
+    """Sockets of one device, keyed by the 5-tuple
+    (protocol, local_ip, local_port, remote_ip, remote_port) for O(1) demultiplexing.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.sockets = {}
+        self.listeners = {}  # (protocol, port) -> callback
+        self.ports = PortAllocator()
+        self.time_wait = 0
+        self.peak = 0
+
+    def key(self, protocol, local_port, remote_ip, remote_port):
+        return (protocol, self.device.ip, local_port, remote_ip, remote_port)
+
+    def lookup(self, protocol, local_port, remote_ip, remote_port):
+        return self.sockets.get((protocol, self.device.ip, local_port, remote_ip, remote_port))
+
+    def add(self, key, socket):
+        if key in self.sockets:
+            return False
+        self.sockets[key] = socket
+        if len(self.sockets) > self.peak:
+            self.peak = len(self.sockets)
+        return True
+
+    def remove(self, key, socket=None):
+        if key in self.sockets and (socket is None or self.sockets[key] is socket):
+            del self.sockets[key]
+            return True
+        return False
+
+    def allocate_port(self, protocol, remote_ip, remote_port):
+        """Pick a local port for a new flow towards (remote_ip, remote_port).
+
+        Free ports come from the bitmap. When it is exhausted a port is shared
+        with existing flows, as long as the resulting 5-tuple is unique.
+        """
+        port = self.ports.allocate()
+        while port is not None and port in self.device.ports:
+            port = self.ports.allocate()  # Leave ports held by services marked as used
+        if port is not None:
+            return port
+        start = self.ports.cursor
+        for offset in range(self.ports.size):
+            port = self.ports.low + (start + offset) % self.ports.size
+            if port not in self.device.ports and self.key(protocol, port, remote_ip, remote_port) not in self.sockets:
+                self.ports.reserve(port)
+                self.ports.cursor = (port - self.ports.low + 1) % self.ports.size
+                return port
+        return None
+
+    def release_port(self, port):
+        return self.ports.release(port)
+
+    def listen(self, protocol, port, callback):
+        if (protocol, port) in self.listeners:
+            return False
+        self.listeners[(protocol, port)] = callback
+        return True
+
+    def unlisten(self, protocol, port):
+        return self.listeners.pop((protocol, port), None) is not None
+
+    def listener(self, protocol, port):
+        return self.listeners.get((protocol, port))
+
+    def __len__(self):
+        return len(self.sockets)
+
+    def stats(self):
+        return {
+            'connections': len(self.sockets),
+            'peak_connections': self.peak,
+            'listeners': len(self.listeners),
+            'time_wait': self.time_wait,
+            'ephemeral_in_use': self.ports.in_use,
+            **self.ports.stats
+        }
+
+
+class TcpConnection:
+    """One end of a TCP connection driven by a TransportLayerSimulator.
+
+    Sequence numbers are not wrapped; the simulator never moves 4 GB on a
+    single connection.
+    """
+
+    def __init__(self, sim, device, local_port, remote_device, remote_port, mss=DEFAULT_MSS,
+                 rcv_window=DEFAULT_RCV_WINDOW, remote_ip=None):
+        self.sim = sim
+        self.device = device
+        self.local_port = local_port
+        self.remote_device = remote_device  # Or the NAT router whose public remote_ip the peer is behind
+        self.remote_ip = remote_ip or remote_device.ip
+        self.reply_ip = remote_ip
+        self.remote_port = remote_port
+        self.key = ('tcp', device.ip, local_port, self.remote_ip, remote_port)
+        self.ephemeral = False  # Local port came from the device's ephemeral allocator
+        self.mss = mss
+        self.state = CLOSED
+
+        # Sender state
+        self.iss = sim.rng.randrange(1 << 30)
+        self.snd_una = self.iss
+        self.snd_nxt = self.iss
+        self.snd_max = self.iss  # Highest sequence number sent so far
+        self.send_buffer = bytearray()  # Unacknowledged and unsent bytes, starting at snd_una (+1 before SYN is acked)
+        self.peer_window = DEFAULT_RCV_WINDOW
+        self.cwnd = INITIAL_CWND_SEGMENTS * mss
+        self.ssthresh = INITIAL_SSTHRESH
+        self.dupacks = 0
+        self.in_recovery = False
+        self.recover = 0
+        self.close_requested = False
+        self.fin_seq = None
+
+        # RTT estimation (RFC 6298), one timed segment at a time (Karn)
+        self.srtt = None
+        self.rttvar = None
+        self.rto = INITIAL_RTO
+        self.rtt_probe = None  # (seq, send_time)
+        self.retransmit_timer = None
+        self.retries = 0
+
+        # Receiver state
+        self.irs = None
+        self.rcv_nxt = None
+        self.rcv_window = rcv_window
+        self.out_of_order = {}  # seq -> payload
+        self.out_of_order_bytes = 0
+        self.peer_fin_seq = None
+
+        # Application callbacks
+        self.on_established = None
+        self.on_data = None
+        self.on_peer_close = None
+        self.on_closed = None
+        self.on_writable = None  # Called when ACKs free send buffer space; lets senders stream
+
+
+        self.stats = {
+            'segments_sent': 0,
+            'segments_received': 0,
+            'bytes_sent': 0,
+            'bytes_acked': 0,
+            'bytes_received': 0,
+            'retransmissions': 0,
+            'timeouts': 0,
+            'fast_retransmits': 0,
+            'established_at': None,
+            'last_acked_at': None,
+            'closed_at': None,
+            'refused': False
+        }
+        self.cwnd_trace = []  # (time, cwnd, ssthresh)
+        self.trace_limit = None  # Thin the trace to at most this many points on long transfers
+        self._trace_stride = 1
+        self._trace_skipped = 0
+
+    # ----- application interface -----
+
+    def open(self):
+        self.state = SYN_SENT
+        self.snd_nxt = self.snd_max = self.iss + 1
+        self._send_control("S", self.iss)
+        self._arm_retransmit()
+
+    def accept(self, syn):
+        """Answer a SYN received by a listening port"""
+        self.irs = syn['seq']
+        self.rcv_nxt = self.irs + 1
+        self.peer_window = syn['window']
+        self.state = SYN_RECEIVED
+        self.snd_nxt = self.snd_max = self.iss + 1
+        self._send_control("SA", self.iss)
+        self._arm_retransmit()
+
+    def send(self, data):
+        if self.close_requested or self.state not in (SYN_SENT, SYN_RECEIVED, ESTABLISHED, CLOSE_WAIT):
+            return False
+        self.send_buffer += to_bytes(data)
+        self._output()
+        return True
+
+    def close(self):
+        """Send FIN once all queued data is out"""
+        if self.state in (LISTEN, CLOSED):
+            self._finish()
+            return
+        self.close_requested = True
+        self._output()
+
+    @property
+    def bytes_in_flight(self):
+        return self.snd_nxt - self.snd_una
+
+    # ----- segment processing -----
+
+    def on_segment(self, segment):
+        self.stats['segments_received'] += 1
+        flags = segment['flags']
+
+        if "R" in flags:
+            if self.state == SYN_SENT:
+                self.stats['refused'] = True
+            self._finish()
+            return
+
+        if self.state == SYN_SENT:
+            if "S" in flags and "A" in flags and segment['ack'] == self.iss + 1:
+                self.irs = segment['seq']
+                self.rcv_nxt = self.irs + 1
+                self.snd_una = self.iss + 1
+                self.peer_window = segment['window']
+                self._established()
+                self._send_ack()
+                self._output()
+            return
+
+        if "S" in flags:
+            # Duplicate SYN or SYN-ACK: our handshake reply got lost
+            if self.state == SYN_RECEIVED:
+                self._send_control("SA", self.iss)
+            elif self.rcv_nxt is not None:
+                self._send_ack()
+            return
+
+        if "A" in flags:
+            self._process_ack(segment)
+            if self.state == CLOSED:
+                return
+
+        payload = segment['payload']
+        if payload:
+            self._process_data(segment['seq'], payload)
+
+        if "F" in flags:
+            self.peer_fin_seq = segment['seq'] + len(payload)
+        if self.peer_fin_seq is not None and self.rcv_nxt == self.peer_fin_seq:
+            self._process_fin()
+        elif payload or "F" in flags:
+            self._send_ack()
+
+    def _process_ack(self, segment):
+        ack = segment['ack']
+        self.peer_window = segment['window']
+
+        if self.state == SYN_RECEIVED:
+            if ack != self.iss + 1:
+                return
+            self.snd_una = ack
+            self._established()
+
+        if ack > self.snd_max:
+            return
+        if ack > self.snd_nxt:
+            self.snd_nxt = ack  # Original transmissions outran a go-back-N restart
+
+        if ack > self.snd_una:
+            acked = ack - self.snd_una
+            data_acked = min(acked, len(self.send_buffer))
+            del self.send_buffer[:data_acked]
+            self.snd_una = ack
+            self.stats['bytes_acked'] += data_acked
+            if data_acked:
+                self.stats['last_acked_at'] = self.sim.clock.now
+            self.retries = 0
+
+            if self.rtt_probe and ack > self.rtt_probe[0]:
+                self._update_rtt(self.sim.clock.now - self.rtt_probe[1])
+                self.rtt_probe = None
+
+            if self.in_recovery:
+                if ack >= self.recover:
+                    self.in_recovery = False
+                    self.cwnd = self.ssthresh
+                else:
+                    # NewReno partial ACK: the next hole is lost too
+                    self._retransmit_head()
+            elif self.cwnd < self.ssthresh:
+                self.cwnd += min(data_acked, self.mss)  # Slow start
+            else:
+                self.cwnd += max(1, self.mss * self.mss // self.cwnd)  # Additive increase
+            self.dupacks = 0
+            self._trace()
+
+            if self.snd_una == self.snd_nxt:
+                self._cancel_retransmit()
+            else:
+                self._arm_retransmit(restart=True)
+
+            if self.fin_seq is not None and ack > self.fin_seq:
+                self._fin_acked()
+                if self.state == CLOSED:
+                    return
+
+            if data_acked and self.on_writable:
+                self.on_writable(self)
+
+        elif ack == self.snd_una and self.snd_nxt > self.snd_una and not segment['payload'] and "F" not in segment['flags']:
+            self.dupacks += 1
+            if self.dupacks == DUPACK_THRESHOLD and not self.in_recovery:
+                self.stats['fast_retransmits'] += 1
+                self.ssthresh = max(self.bytes_in_flight // 2, 2 * self.mss)
+                self.cwnd = self.ssthresh + DUPACK_THRESHOLD * self.mss
+                self.in_recovery = True
+                self.recover = self.snd_nxt
+                self._retransmit_head()
+                self._trace()
+            elif self.in_recovery:
+                self.cwnd += self.mss  # Window inflation while dupacks drain the pipe
+
+        self._output()
+
+    def _process_data(self, seq, payload):
+        if self.rcv_nxt is None:
+            return
+        end = seq + len(payload)
+        if end <= self.rcv_nxt:
+            return  # Entirely old data
+        if seq > self.rcv_nxt:
+            if seq not in self.out_of_order and self.out_of_order_bytes + len(payload) <= self.rcv_window:
+                self.out_of_order[seq] = payload
+                self.out_of_order_bytes += len(payload)
+            return
+        if seq < self.rcv_nxt:
+            payload = payload[self.rcv_nxt - seq:]
+        self._deliver(payload)
+
+        while self.rcv_nxt in self.out_of_order:
+            chunk = self.out_of_order.pop(self.rcv_nxt)
+            self.out_of_order_bytes -= len(chunk)
+            self._deliver(chunk)
+        # Drop buffered segments that are now fully covered
+        for start in [s for s in self.out_of_order if s < self.rcv_nxt]:
+            chunk = self.out_of_order.pop(start)
+            self.out_of_order_bytes -= len(chunk)
+            if start + len(chunk) > self.rcv_nxt:
+                self._deliver(chunk[self.rcv_nxt - start:])
+
+    def _deliver(self, payload):
+        self.rcv_nxt += len(payload)
+        self.stats['bytes_received'] += len(payload)
+        if self.on_data:
+            self.on_data(self, payload)
+
+    def _process_fin(self):
+        self.rcv_nxt = self.peer_fin_seq + 1
+        self.peer_fin_seq = None
+        self._send_ack()
+        if self.state in (SYN_RECEIVED, ESTABLISHED):
+            self.state = CLOSE_WAIT
+            if self.on_peer_close:
+                self.on_peer_close(self)
+        elif self.state == FIN_WAIT_1:
+            self.state = CLOSING
+        elif self.state == FIN_WAIT_2:
+            self._time_wait()
+
+    def _fin_acked(self):
+        if self.state == FIN_WAIT_1:
+            self.state = FIN_WAIT_2
+        elif self.state == CLOSING:
+            self._time_wait()
+        elif self.state == LAST_ACK:
+            self._finish()
+
+    def _established(self):
+        self.state = ESTABLISHED
+        self.stats['established_at'] = self.sim.clock.now
+        self.retries = 0
+        if self.snd_una == self.snd_nxt:
+            self._cancel_retransmit()
+        self._trace()
+        if self.on_established:
+            self.on_established(self)
+
+    def _time_wait(self):
+        self.state = TIME_WAIT
+        self.device.connections.time_wait += 1
+        self._cancel_retransmit()
+        self.sim.clock.schedule(2 * MSL, self._finish)
+
+    def _finish(self):
+        if self.state == CLOSED and self.stats['closed_at'] is not None:
+            return
+        if self.state == TIME_WAIT:
+            self.device.connections.time_wait -= 1
+        self.state = CLOSED
+        self.stats['closed_at'] = self.sim.clock.now
+        self._cancel_retransmit()
+        self.sim.release(self)
+        if self.on_closed:
+            self.on_closed(self)
+
+    # ----- output -----
+
+    def _output(self):
+        if self.state not in (ESTABLISHED, CLOSE_WAIT, FIN_WAIT_1, CLOSING, LAST_ACK):
+            return
+        window = min(self.cwnd, self.peer_window)
+        data_end = self.snd_una + len(self.send_buffer)
+
+        while self.snd_nxt < data_end:
+            room = window - self.bytes_in_flight
+            length = min(self.mss, data_end - self.snd_nxt, room)
+            if length <= 0:
+                break
+            offset = self.snd_nxt - self.snd_una
+            self._send_data(self.snd_nxt, bytes(self.send_buffer[offset:offset + length]))
+            self.snd_nxt += length
+
+        if self.close_requested and self.fin_seq is None and self.snd_nxt == data_end:
+            self._send_fin(data_end)
+
+    def _send_fin(self, seq):
+        if self.state == ESTABLISHED:
+            self.state = FIN_WAIT_1
+        elif self.state == CLOSE_WAIT:
+            self.state = LAST_ACK
+        if seq < self.snd_max:
+            self.stats['retransmissions'] += 1
+        self.fin_seq = seq
+        self.snd_nxt = seq + 1
+        self.snd_max = max(self.snd_max, self.snd_nxt)
+        self._send_control("FA", seq)
+        self._arm_retransmit()
+
+    def _send_data(self, seq, payload):
+        segment = tcp_segment(self.local_port, self.remote_port, seq, self.rcv_nxt, "A",
+                              self._advertised_window(), payload)
+        if seq < self.snd_max:
+            # Karn: never time a retransmitted segment
+            self.stats['retransmissions'] += 1
+            if self.rtt_probe and self.rtt_probe[0] >= seq:
+                self.rtt_probe = None
+        elif self.rtt_probe is None:
+            self.rtt_probe = (seq, self.sim.clock.now)
+        self.snd_max = max(self.snd_max, seq + len(payload))
+        self.stats['bytes_sent'] += len(payload)
+        self._transmit(segment)
+        self._arm_retransmit()
+
+    def _send_control(self, flags, seq):
+        ack = self.rcv_nxt if self.rcv_nxt is not None else 0
+        if self.rcv_nxt is not None and "A" not in flags:
+            flags += "A"
+        self._transmit(tcp_segment(self.local_port, self.remote_port, seq, ack, flags, self._advertised_window()))
+
+    def _send_ack(self):
+        self._transmit(tcp_segment(self.local_port, self.remote_port, self.snd_nxt, self.rcv_nxt, "A",
+                                   self._advertised_window()))
+
+    def _advertised_window(self):
+        return max(0, self.rcv_window - self.out_of_order_bytes)
+
+    def _transmit(self, segment):
+        self.stats['segments_sent'] += 1
+        self.sim.transmit(self.device, self.remote_device, segment, dest_ip=self.reply_ip)
+
+    def _retransmit_head(self):
+        if self.state == SYN_SENT:
+            self._send_control("S", self.iss)
+        elif self.state == SYN_RECEIVED:
+            self._send_control("SA", self.iss)
+        elif self.send_buffer:
+            length = min(self.mss, len(self.send_buffer))
+            self._send_data(self.snd_una, bytes(self.send_buffer[:length]))
+        elif self.fin_seq is not None:
+            self._send_fin(self.fin_seq)
+
+    # ----- timers -----
+
+    def _update_rtt(self, sample):
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def _arm_retransmit(self, restart=False):
+        if self.retransmit_timer and not self.retransmit_timer.cancelled:
+            if not restart:
+                return
+            self.retransmit_timer.cancel()
+        self.retransmit_timer = self.sim.clock.schedule(self.rto, self._on_timeout)
+
+    def _cancel_retransmit(self):
+        if self.retransmit_timer:
+            self.retransmit_timer.cancel()
+            self.retransmit_timer = None
+
+    def _on_timeout(self):
+        self.retransmit_timer = None
+        if self.state in (CLOSED, TIME_WAIT):
+            return
+        if self.state not in (SYN_SENT, SYN_RECEIVED) and self.snd_una == self.snd_max:
+            return
+        self.retries += 1
+        if self.retries > MAX_RETRIES:
+            self._finish()
+            return
+
+        self.stats['timeouts'] += 1
+        if self.state in (ESTABLISHED, CLOSE_WAIT, FIN_WAIT_1, CLOSING, LAST_ACK):
+            self.ssthresh = max(self.bytes_in_flight // 2, 2 * self.mss)
+            self.cwnd = self.mss  # Loss window
+            self.in_recovery = False
+            self.dupacks = 0
+            self._trace()
+
+        self.rto = min(MAX_RTO, self.rto * 2)
+        self.rtt_probe = None
+        if self.state in (SYN_SENT, SYN_RECEIVED):
+            self._retransmit_head()
+        else:
+            # Go back to the first unacknowledged byte; a sent FIN follows the data again
+            self.snd_nxt = self.snd_una
+            if self.send_buffer:
+                self.fin_seq = None
+                self._output()
+            else:
+                self._retransmit_head()
+        self._arm_retransmit()
+
+    def _trace(self):
+        if self._trace_stride > 1:
+            self._trace_skipped += 1
+            if self._trace_skipped < self._trace_stride:
+                return
+            self._trace_skipped = 0
+        self.cwnd_trace.append((self.sim.clock.now, self.cwnd, self.ssthresh))
+        if self.trace_limit and len(self.cwnd_trace) >= self.trace_limit:
+            del self.cwnd_trace[1::2]  # Keep every other point and sample half as often from now on
+            self._trace_stride *= 2
+
+    def summary(self):
+        start = self.stats['established_at']
+        end = self.stats['last_acked_at']
+        duration = (end - start) if start is not None and end is not None else 0.0
+        return {
+            'state': self.state,
+            'duration': duration,
+            'goodput_bps': (self.stats['bytes_acked'] * 8 / duration) if duration > 0 else 0.0,
+            'srtt': self.srtt,
+            'rto': self.rto,
+            'cwnd': self.cwnd,
+            'ssthresh': self.ssthresh,
+            **self.stats
+        }
@@ -12,139 +12,6 @@ from twisted.internet import reactor
 
 from pyrip_lib import *
 
-'''
-    Provides methods to handle RIP routes
-'''
-class IRoute(object):
-    def __init__(self, prefix=0, prefixLen=0, nextHop=0, afi=0):
-        self.afi = afi
-        self.prefix = prefix
-        self.prefixLen = prefixLen
-        self.nextHop = nextHop
-
-    def __cmp__(self, other):
-        if self.afi < other.afi:
-            return -1
-        elif self.afi > other.afi:
-            return 1
-
-        if self.prefix < other.prefix:
-            return -1
-        elif self.prefix > other.prefix:
-            return 1
-
-        if self.prefixLen < other.prefixLen:
-            return -1
-        elif self.prefixLen > other.prefixLen:
-            return 1
-
-        if self.nextHop < other.nextHop:
-            return -1
-        elif self.nextHop > other.nextHop:
-            return 1
-
-        return 0
-
-    def __lt__(self, other):
-        return self.__cmp__(other)<0
-    def __le__(self, other):
-        return self.__cmp__(other)<=0
-    def __eq__(self, other):
-        return self.__cmp__(other)==0
-    def __ne__(self, other):
-        return self.__cmp__(other)!=0
-    def __gt__(self, other):
-        return self.__cmp__(other)>0
-    def __ge__(self, other):
-        return self.__cmp__(other)>=0
-
-class RipRoute(IRoute):
-    def __init__(self, prefix, prefixLen, nextHop, metric=RIP_METRIC_MIN, routeTag=0, family=RIP_ADDRESS_FAMILY):
-        self.family = family
-        self.routeTag = routeTag
-        self.prefix = prefix
-        self.prefixLen = prefixLen
-        self.nextHop = nextHop
-        self.afi = 1 # IPv4
-        
-        if metric >= RIP_METRIC_INFINITY:
-            self.metric = RIP_METRIC_INFINITY
-        elif metric <= RIP_METRIC_MIN:
-            self.metric = RIP_METRIC_MIN
-        else:
-            self.metric = metric
-
-    def pack(self):
-        mask = PrefixLen2MaskInt(self.prefixLen)
-        return struct.pack(RIP_ENTRY_PACK_FORMAT,
-            self.family, self.routeTag, self.prefix, mask, self.nextHop, self.metric)
-
-    def __str__(self):
-        return '{'+'{:s}/{:d}, {:s}, {:d}, {:d}'.format(Int2IP(self.prefix), self.prefixLen, Int2IP(self.nextHop), self.metric, self.routeTag)+'}'
-
-    def __repr__(self):
-        return '{:08x}/{:d}->{:08x} m{:d} t{:d}'.format(self.prefix, self.prefixLen, self.nextHop, self.metric, self.routeTag)
-
-'''
-    Provides methods to handle RIP packets
-'''
-class RipPacket(object):
-    def __init__(self, cmd = RIP_COMMAND_RESPONSE, version = 2):
-        self.command = cmd
-        self.version = version
-        self.entry = []
-
-    @property
-    def size(self):
-        return RIP_HEADER_SIZE + len(self.entry)*RIP_ENTRY_SIZE
-
-    def pack(self):
-        header = struct.pack(RIP_HEADER_PACK_FORMAT,self.command,self.version,0)
-        entries = b''
-        for ent in self.entry:
-            entries = entries + ent.pack()
-        packet = header + entries
-        return packet
-
-    def unpack(data):
-        pkt = RipPacket()
-        hdr = data[:RIP_HEADER_SIZE]
-        data = data[RIP_HEADER_SIZE:]
-        pkt.command, pkt.version, zero = struct.unpack(RIP_HEADER_PACK_FORMAT, hdr)
-        while len(data) > 0 and len(data)%RIP_ENTRY_SIZE == 0:
-            ent = data[:RIP_ENTRY_SIZE]
-            data = data[RIP_ENTRY_SIZE:]
-            family, tag, prefix, mask, nextHop, metric = struct.unpack(RIP_ENTRY_PACK_FORMAT, ent)
-            pkt.entry.append(RipRoute(
-                prefix, MaskInt2PrefixLen(mask), nextHop, metric, tag, family))
-        return pkt
-
-    def addEntry(self, prefix, prefixLen, nextHop, metric, routeTag=0, family=RIP_ADDRESS_FAMILY):
-        self.entry.append(RipRoute(prefix, prefixLen, nextHop, metric, routeTag, family))
-        return True
-
-    def removeEntry(self, prefix, prefixLen, nextHop):
-        for ent in self.entry:
-            if ent.prefix == prefix and ent.prefixLen == prefixLen and ent.nextHop == nextHop:
-                self.entry.remove(ent)
-                return True
-        return False
-
-    def __getitem__(self, key):
-        return self.entry[key]
-
-    def __setitem__(self, key, value):
-        self.entry[key] = value
-
-    def __repr__(self):
-        if self.command == RIP_COMMAND_REQUEST:
-            cmd = 'request'
-        elif self.command == RIP_COMMAND_RESPONSE:
-            cmd = 'response'
-
-        ret = 'v{:d}, {:s}, {:d} entries'.format(self.version,cmd,len(self.entry))
-        return ret
-
 '''
     main RIP process. RIP version 2.
     version 1 should be added in future.